@@ -2,7 +2,7 @@
 
 import os
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -10,6 +10,8 @@ class Settings(BaseSettings):
 
     # Database
     database_url: str = "sqlite:///./face_database/faces.db"
+    database_pool_size: int = 5  # Connections kept open for the async routes
+    database_max_overflow: int = 10  # Extra connections allowed under bursts
 
     # Server
     host: str = "0.0.0.0"
@@ -23,15 +25,65 @@ class Settings(BaseSettings):
     log_level: str = "INFO"
 
     # Face Recognition
-    face_detection_model: str = "hog"  # hog or cnn
+    face_detection_model: str = "hog"  # hog, cnn, haar or dnn
+    face_detection_scale: float = 1.0  # Detect on a downscaled copy (0 = auto)
+    face_detection_upsample: int = 1  # Upsampling passes when the scale is fixed
+    face_detection_min_face_size: int = 80  # Smallest face in pixels (auto scale)
+    haar_cascade_path: Optional[str] = None  # None = OpenCV's frontal face cascade
+    dnn_detector_prototxt: str = "face_database/models/deploy.prototxt"
+    dnn_detector_weights: str = (
+        "face_database/models/res10_300x300_ssd_iter_140000.caffemodel"
+    )
+    dnn_detector_confidence: float = 0.5
     face_recognition_tolerance: float = 0.45  # Lower = stricter (0.4-0.6 recommended)
     face_recognition_confidence_threshold: float = (
         60.0  # Minimum confidence % to consider valid
     )
     max_face_size_mb: int = 10
+    max_batch_images: int = 64  # Images per batch recognition request
+    max_bulk_enrollment_items: int = 100000  # Images per bulk enrollment request
+    gallery_compaction_ratio: float = 0.1  # Compact once this share of rows is deleted
+
+    # Streaming
+    stream_tracking: bool = True  # Reuse identities of tracked faces across frames
+    tracker_iou_threshold: float = 0.3  # Min box overlap to continue a track
+    tracker_drift_iou: float = 0.5  # Re-encode when overlap with last encoding drops
+    tracker_refresh_frames: int = 30  # Re-encode tracked faces this often
+    tracker_max_missed: int = 5  # Frames a track survives without a detection
+
+    # Matching index
+    face_index_backend: str = "exact"  # exact or ivf (approximate, for large galleries)
+    ivf_nlist: int = 256  # Number of k-means cells
+    ivf_nprobe: int = 8  # Cells scanned per probe (higher = better recall, slower)
+    ivf_min_gallery_size: int = 10000  # Smaller galleries are scanned exactly
+    ivf_train_sample: int = 100000  # Encodings sampled to train the quantizer
+    ivf_train_iterations: int = 20
+    # People shortlisted by centroid before their encodings are scanned (0 = off)
+    person_prefilter_top_k: int = 0
+    person_prefilter_min_encodings: float = 4.0  # Mean per person to enable it
+    # none, float16 or int8: compact in-memory copy scored before an exact re-rank
+    gallery_quantization: str = "none"
+    gallery_rerank_candidates: int = 32  # Closest quantized rows re-ranked exactly
 
     # Performance
     workers: int = 4
+    # Recognition pool size per worker; None = CPU cores / workers, 0 = threads only
+    engine_processes: Optional[int] = None
+    service_warm_up: bool = True  # Run a first inference before reporting ready
+
+    # Request profiling (also adjustable at runtime via /api/admin/profiler)
+    profiler_enabled: bool = False
+    profiler_sample_rate: float = 0.01  # Fraction of requests always profiled
+    profiler_slow_threshold: float = 1.0  # Keep profiles of slower requests, 0 = off
+    profiler_interval: float = 0.005  # Seconds between stack samples
+    profiler_max_profiles: int = 20  # Most recent profiles kept
+    profiler_max_sample_rate: float = 0.1  # Cap on sample_rate, also at runtime
+    # Serve /api/admin (profiler settings and profiles); it has no authentication
+    admin_endpoints_enabled: bool = False
+
+    # Probe cache
+    probe_cache_size: int = 1024  # Analyzed images kept for resubmissions, 0 = off
+    probe_cache_ttl_seconds: float = 300.0  # Seconds an analyzed image stays cached
 
     class Config:
         env_file = ".env"
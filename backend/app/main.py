@@ -1,10 +1,12 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 import os
 import logging
-from app.routers import face_recognition
-from app.services.database import init_database
+from app.routers import admin, face_recognition
+from app.services.database import async_engine, init_database
+from app.services.readiness import services
 from app.config import settings
 from app.utils.performance import PerformanceMiddleware, metrics
 
@@ -36,6 +38,20 @@ app.add_middleware(
 # Add performance monitoring
 app.add_middleware(PerformanceMiddleware)
 
+
+@app.middleware("http")
+async def require_ready(request: Request, call_next):
+    """Turn API traffic away while the recognition service is still loading"""
+    path = request.url.path
+    if path.startswith("/api/") and path != "/api/metrics" and not services.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": f"Recognition service is {services.stage}"},
+            headers={"Retry-After": "5"},
+        )
+    return await call_next(request)
+
+
 # Create face_database directory if it doesn't exist
 os.makedirs("face_database", exist_ok=True)
 os.makedirs("face_database/uploads", exist_ok=True)
@@ -45,21 +61,25 @@ app.mount("/static", StaticFiles(directory="face_database"), name="static")
 
 # Include routers
 app.include_router(face_recognition.router, prefix="/api", tags=["face_recognition"])
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 
 
 @app.on_event("startup")
 def startup_event():
-    """Initialize database on startup"""
+    """Initialize database on startup and load the service in the background"""
     logger.info("Starting Face Recognition API...")
     init_database()
     logger.info("Database initialized")
+    services.start()
     logger.info(f"API running at http://{settings.host}:{settings.port}")
 
 
 @app.on_event("shutdown")
-def shutdown_event():
+async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down Face Recognition API...")
+    services.shutdown()
+    await async_engine.dispose()
 
 
 @app.get("/")
@@ -79,13 +99,51 @@ async def health_check():
     return {"status": "healthy", "version": "2.0.0", "service": "face-recognition-api"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 once the gallery is loaded and the models are warm"""
+    return JSONResponse(
+        status_code=200 if services.ready else 503, content=services.get_status()
+    )
+
+
 @app.get("/api/metrics")
 async def get_metrics():
     """Get performance metrics"""
-    return metrics.get_stats()
+    stats = metrics.get_stats()
+    if services.ready:
+        stats["probe_cache"] = services.get_service().probe_cache.get_stats()
+    return stats
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """Performance metrics in the Prometheus text exposition format"""
+    gauges = {"service_ready": int(services.ready)}
+    counters = {}
+    if services.ready:
+        service = services.get_service()
+        gallery = service.gallery
+        gauges["gallery_encodings"] = len(gallery)
+        gauges["gallery_people"] = gallery.person_count
+        cache_stats = service.probe_cache.get_stats()
+        gauges["probe_cache_entries"] = cache_stats["entries"]
+        for counter in ("hits", "misses", "evictions", "expirations"):
+            counters[f"probe_cache_{counter}_total"] = cache_stats[counter]
+    return PlainTextResponse(
+        metrics.to_prometheus(gauges, counters),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
 
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Workers share the memory-mapped gallery and see each other's writes
+    uvicorn.run(
+        "app.main:app",
+        host=settings.host,
+        port=settings.port,
+        reload=settings.reload,
+        workers=settings.workers,
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Integer, String, DateTime, Text, LargeBinary, DDL, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
@@ -8,10 +8,36 @@ class Face(Base):
     __tablename__ = "faces"
     
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), nullable=False)
+    name = Column(String(100), nullable=False, index=True)
     image_path = Column(String(255), nullable=False)
     encoding_path = Column(String(255), nullable=False)
+    # Packed little-endian float32 encoding; NULL for rows enrolled before it
+    # was stored alongside the face
+    encoding = Column(LargeBinary, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     def __repr__(self):
         return f"<Face(id={self.id}, name='{self.name}')>"
+
+class FaceCount(Base):
+    """Running total of faces in a single row, kept current by triggers"""
+    __tablename__ = "face_counts"
+    
+    id = Column(Integer, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+
+# The triggers count every insert and delete, whichever process makes it.
+# create_all runs at each startup, so the statements must be idempotent; the
+# seed row counts the faces of a database created before the counter existed.
+FACE_COUNT_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS faces_count_insert AFTER INSERT ON faces "
+    "BEGIN UPDATE face_counts SET total = total + 1 WHERE id = 1; END",
+    "CREATE TRIGGER IF NOT EXISTS faces_count_delete AFTER DELETE ON faces "
+    "BEGIN UPDATE face_counts SET total = total - 1 WHERE id = 1; END",
+    "INSERT OR IGNORE INTO face_counts (id, total) SELECT 1, COUNT(*) FROM faces",
+]
+
+for statement in FACE_COUNT_DDL:
+    event.listen(
+        Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite")
+    )
@@ -1,13 +1,15 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 
 class FaceEnrollRequest(BaseModel):
     name: str
     image_data: str  # Base64 encoded image
+    detector: Optional[str] = None  # hog, cnn, haar or dnn (default from settings)
 
 class FaceRecognitionRequest(BaseModel):
     image_data: str  # Base64 encoded image
+    detector: Optional[str] = None  # hog, cnn, haar or dnn (default from settings)
 
 class FaceData(BaseModel):
     id: int
@@ -23,13 +25,65 @@ class RecognitionResult(BaseModel):
     name: str
     confidence: float
     face_location: List[int]  # [top, right, bottom, left]
+    track_id: Optional[int] = None  # Set on streaming results
 
 class RecognitionResponse(BaseModel):
     faces_detected: int
     results: List[RecognitionResult]
     processing_time: float
 
+class BatchRecognitionRequest(BaseModel):
+    images: List[str]  # Base64 encoded images
+    detector: Optional[str] = None  # hog, cnn, haar or dnn (default from settings)
+
+class ImageRecognitionResult(BaseModel):
+    faces_detected: int
+    results: List[RecognitionResult]
+    error: Optional[str] = None
+
+class BatchTimings(BaseModel):
+    analyze: float  # Decode, detect and encode of all images (wall time)
+    detection: float  # Detector time summed over images
+    match: float  # One gallery pass for every face
+    total: float
+
+class BatchRecognitionResponse(BaseModel):
+    images: List[ImageRecognitionResult]
+    faces_detected: int
+    processing_time: float
+    timings: BatchTimings
+
+class StreamResult(BaseModel):
+    frame: int  # Sequence number of the processed frame on this connection
+    faces_detected: int
+    results: List[RecognitionResult]
+    processing_time: float
+    faces_encoded: int  # Faces encoded this frame; the rest reused their track
+    frames_dropped: int  # Stale frames skipped so far
+
+class ProfilerConfig(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = Field(None, ge=0, le=1)  # Fraction always profiled
+    slow_threshold: Optional[float] = Field(None, ge=0)  # Seconds, 0 = off
+    interval: Optional[float] = Field(None, gt=0)  # Seconds between stack samples
+    max_profiles: Optional[int] = Field(None, ge=1)
+
 class EnrollmentResponse(BaseModel):
     success: bool
     message: str
     face_id: Optional[int] = None
+
+class BulkEnrollmentItem(BaseModel):
+    index: int
+    source: str  # Archive entry or uploaded file name
+    name: str
+    success: bool
+    message: str
+    face_id: Optional[int] = None
+
+class BulkEnrollmentResponse(BaseModel):
+    total: int
+    enrolled: int
+    failed: int
+    processing_time: float
+    items: List[BulkEnrollmentItem]
@@ -0,0 +1,53 @@
+"""
+Operator endpoints: request profiles
+"""
+
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.config import settings
+from app.models.schemas import ProfilerConfig
+from app.utils.profiler import profiler
+
+
+def require_admin_enabled():
+    """Hide the operator endpoints unless the deployment turned them on"""
+    if not settings.admin_endpoints_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+router = APIRouter(dependencies=[Depends(require_admin_enabled)])
+
+
+@router.get("/profiler")
+async def get_profiler_config():
+    """Current profiler settings"""
+    return profiler.get_config()
+
+
+@router.put("/profiler")
+async def configure_profiler(config: ProfilerConfig):
+    """Change profiler settings without a restart; omitted fields are kept"""
+    profiler.configure(**config.model_dump())
+    return profiler.get_config()
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """Summaries of the kept request profiles, newest first"""
+    return profiler.get_profiles()
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: int, format: Literal["speedscope", "collapsed"] = "speedscope"
+):
+    """Download a profile as speedscope JSON or collapsed stacks"""
+    profile = profiler.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    return profile.speedscope()
@@ -1,47 +1,123 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Depends,
+    Query,
+    File,
+    Form,
+    Request,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import logging
 import os
-from typing import List
+from typing import Iterator, List, Optional, Tuple, Union
 import time
 
 from app.models.schemas import (
+    BatchRecognitionRequest,
+    BatchRecognitionResponse,
+    BatchTimings,
+    BulkEnrollmentItem,
+    BulkEnrollmentResponse,
     FaceEnrollRequest,
     FaceRecognitionRequest,
+    ImageRecognitionResult,
     FaceData,
     RecognitionResponse,
     EnrollmentResponse,
 )
 from app.models.database import Face
-from app.services.database import get_database as get_db
-from app.services.face_recognition_service import face_recognition_service
+from app.services.database import (
+    count_faces,
+    encoding_to_blob,
+    get_async_database as get_db,
+    iter_faces,
+    list_faces,
+)
+from app.services.face_detectors import DETECTOR_BACKENDS
+from app.services.readiness import services
+from app.services.stream import StreamSession
+from app.config import settings
+from app.utils.archive import iter_archive_images, person_name
 from app.utils.performance import metrics
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
-@router.post("/faces/enroll", response_model=EnrollmentResponse)
-async def enroll_face(request: FaceEnrollRequest, db: Session = Depends(get_db)):
-    """Enroll a new face in the system"""
+# Binary variants of enroll/recognize take the encoded image (JPEG, PNG, ...)
+# as a multipart file or as the raw request body, skipping base64 and JSON
+RAW_IMAGE_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/octet-stream": {
+                "schema": {"type": "string", "format": "binary"}
+            }
+        },
+    }
+}
+
+# Faces per page of GET /faces/ by default and at most
+FACE_PAGE_SIZE = 100
+MAX_FACE_PAGE_SIZE = 1000
+
+
+def _check_detector(detector: Optional[str]):
+    """Reject unknown per-request detector backends"""
+    if detector is not None and detector not in DETECTOR_BACKENDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown detector '{detector}', use one of {list(DETECTOR_BACKENDS)}",
+        )
+
+
+async def _enroll(
+    image_data: Union[str, bytes],
+    name: str,
+    db: AsyncSession,
+    detector: Optional[str] = None,
+):
+    """Enroll a base64 or raw image and record it in the database"""
+    _check_detector(detector)
     start_time = time.time()
     try:
         # Use face recognition service to enroll face
-        success, message, encoding_path = face_recognition_service.enroll_face(
-            request.image_data, request.name
+        success, message, encoding_path, image_path = (
+            await services.get_engine().enroll(image_data, name, detector)
         )
 
         if not success:
             return EnrollmentResponse(success=False, message=message)
 
-        # Save to database
+        # Save to database, with the encoding so the row is self-contained
+        (encoding,), _ = await run_in_threadpool(
+            services.get_service().get_encodings, [encoding_path]
+        )
         db_face = Face(
-            name=request.name,
-            image_path=f"face_database/uploads/{request.name}_{int(os.path.getmtime(encoding_path))}.jpg",
+            name=name,
+            image_path=image_path,
             encoding_path=encoding_path,
+            encoding=encoding_to_blob(encoding),
         )
 
-        db.add(db_face)
-        db.commit()
-        db.refresh(db_face)
+        try:
+            db.add(db_face)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            await run_in_threadpool(
+                services.get_service().undo_enrollments, [encoding_path], [image_path]
+            )
+            raise
 
         # Track metrics
         duration = time.time() - start_time
@@ -53,12 +129,12 @@ async def enroll_face(request: FaceEnrollRequest, db: Session = Depends(get_db))
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/faces/recognize", response_model=RecognitionResponse)
-async def recognize_faces(request: FaceRecognitionRequest):
-    """Recognize faces in an image"""
+async def _recognize(image_data: Union[str, bytes], detector: Optional[str] = None):
+    """Recognize faces in a base64 or raw image"""
+    _check_detector(detector)
     try:
-        results, processing_time = face_recognition_service.recognize_faces(
-            request.image_data
+        results, processing_time = await services.get_engine().recognize(
+            image_data, detector
         )
 
         # Track metrics
@@ -74,34 +150,381 @@ async def recognize_faces(request: FaceRecognitionRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _recognize_batch(
+    images: List[Union[str, bytes]], detector: Optional[str] = None
+):
+    """Recognize faces in many base64 or raw images at once"""
+    _check_detector(detector)
+    if not images:
+        raise HTTPException(status_code=400, detail="No images provided")
+    if len(images) > settings.max_batch_images:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many images, at most {settings.max_batch_images} per batch",
+        )
+    try:
+        image_results, timings = await services.get_engine().recognize_batch(
+            images, detector
+        )
+
+        # Track metrics (batch time amortized over the recognized images)
+        for results, error in image_results:
+            if error is None:
+                metrics.add_recognition_time(timings["total"] / len(images))
+
+        return BatchRecognitionResponse(
+            images=[
+                ImageRecognitionResult(
+                    faces_detected=len(results), results=results, error=error
+                )
+                for results, error in image_results
+            ],
+            faces_detected=sum(len(results) for results, _ in image_results),
+            processing_time=round(timings["total"], 3),
+            timings=BatchTimings(
+                **{stage: round(value, 3) for stage, value in timings.items()}
+            ),
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/faces/enroll", response_model=EnrollmentResponse)
+async def enroll_face(request: FaceEnrollRequest, db: AsyncSession = Depends(get_db)):
+    """Enroll a new face in the system"""
+    return await _enroll(request.image_data, request.name, db, request.detector)
+
+
+@router.post("/faces/enroll/upload", response_model=EnrollmentResponse)
+async def enroll_face_upload(
+    name: str = Form(...),
+    image: UploadFile = File(...),
+    detector: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_db),
+):
+    """Enroll a new face from a multipart/form-data image upload"""
+    return await _enroll(await image.read(), name, db, detector)
+
+
+@router.post(
+    "/faces/enroll/raw",
+    response_model=EnrollmentResponse,
+    openapi_extra=RAW_IMAGE_BODY,
+)
+async def enroll_face_raw(
+    request: Request,
+    name: str,
+    detector: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Enroll a new face from an application/octet-stream image body"""
+    return await _enroll(await request.body(), name, db, detector)
+
+
+def _upload_entries(
+    names: List[str], images: List[UploadFile], max_bytes: int
+) -> Iterator[Tuple[str, str, Optional[bytes], Optional[str]]]:
+    """Read (name, image) upload pairs one at a time"""
+    for name, image in zip(names, images):
+        data = image.file.read(max_bytes + 1)
+        if len(data) > max_bytes:
+            yield image.filename, name, None, f"Image larger than {max_bytes} bytes"
+        else:
+            yield image.filename, name, data, None
+
+
+async def _enroll_bulk(
+    entries: Iterator[Tuple[str, str, Optional[bytes], Optional[str]]],
+    db: AsyncSession,
+    detector: Optional[str] = None,
+) -> BulkEnrollmentResponse:
+    """Enroll (source, name, image, error) entries with one gallery write and
+    one database transaction"""
+    start_time = time.time()
+    items: List[BulkEnrollmentItem] = []
+    accepted: List[BulkEnrollmentItem] = []  # Items handed to the engine
+
+    async def images():
+        # Entries are read off the event loop, one at a time
+        while True:
+            entry = await run_in_threadpool(next, entries, None)
+            if entry is None:
+                return
+            source, name, image_data, error = entry
+            name = name.strip()
+            if error is None and not name:
+                error = "Missing name"
+            if error is None and len(accepted) >= settings.max_bulk_enrollment_items:
+                error = (
+                    f"Too many images, at most {settings.max_bulk_enrollment_items} "
+                    "per request"
+                )
+            item = BulkEnrollmentItem(
+                index=len(items),
+                source=source,
+                name=name,
+                success=False,
+                message=error or "",
+            )
+            items.append(item)
+            if error is None:
+                accepted.append(item)
+                yield name, image_data
+
+    try:
+        outcomes = await services.get_engine().enroll_many(images(), detector)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    enrolled = []
+    for item, (encoding_path, encoding, image_path, error) in zip(accepted, outcomes):
+        if error is not None:
+            item.message = error
+            continue
+        face = Face(
+            name=item.name,
+            image_path=image_path,
+            encoding_path=encoding_path,
+            encoding=encoding_to_blob(encoding),
+        )
+        enrolled.append((item, face))
+
+    try:
+        # One transaction; flushing assigns ids without re-reading every row
+        db.add_all([face for _, face in enrolled])
+        await db.flush()
+        for item, face in enrolled:
+            item.face_id = face.id
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        await run_in_threadpool(
+            services.get_service().undo_enrollments,
+            [face.encoding_path for _, face in enrolled],
+            [face.image_path for _, face in enrolled],
+        )
+        raise HTTPException(status_code=500, detail=str(e))
+
+    for item, _ in enrolled:
+        item.success = True
+        item.message = f"Face enrolled successfully for {item.name}"
+
+    processing_time = time.time() - start_time
+    for _ in enrolled:
+        metrics.add_enrollment_time(processing_time / len(enrolled))
+
+    return BulkEnrollmentResponse(
+        total=len(items),
+        enrolled=len(enrolled),
+        failed=len(items) - len(enrolled),
+        processing_time=round(processing_time, 3),
+        items=items,
+    )
+
+
+@router.post("/faces/enroll/bulk", response_model=BulkEnrollmentResponse)
+async def enroll_faces_bulk(
+    archive: Optional[UploadFile] = File(None),
+    names: List[str] = Form([]),
+    images: List[UploadFile] = File([]),
+    detector: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_db),
+):
+    """Enroll many faces from a zip/tar archive or from (name, image) pairs
+
+    In an archive, an image in a directory is enrolled under the directory
+    name (``alice/1.jpg``), any other image under its file name
+    (``alice.jpg``). Otherwise send repeated ``names`` and ``images`` fields
+    in matching order. Every item is reported; one bad image does not fail
+    the others.
+    """
+    _check_detector(detector)
+    max_bytes = settings.max_face_size_mb * 1024 * 1024
+    if archive is not None:
+        entries = (
+            (entry_name, person_name(entry_name), data, error)
+            for entry_name, data, error in iter_archive_images(archive.file, max_bytes)
+        )
+    elif images:
+        if not names or len(names) != len(images):
+            raise HTTPException(status_code=400, detail="Provide one name per image")
+        entries = _upload_entries(names, images, max_bytes)
+    else:
+        raise HTTPException(
+            status_code=400, detail="Provide an archive or names and images"
+        )
+    return await _enroll_bulk(entries, db, detector)
+
+
+@router.post("/faces/recognize", response_model=RecognitionResponse)
+async def recognize_faces(request: FaceRecognitionRequest):
+    """Recognize faces in an image"""
+    return await _recognize(request.image_data, request.detector)
+
+
+@router.post("/faces/recognize/upload", response_model=RecognitionResponse)
+async def recognize_faces_upload(
+    image: UploadFile = File(...), detector: Optional[str] = Form(None)
+):
+    """Recognize faces in a multipart/form-data image upload"""
+    return await _recognize(await image.read(), detector)
+
+
+@router.post(
+    "/faces/recognize/raw",
+    response_model=RecognitionResponse,
+    openapi_extra=RAW_IMAGE_BODY,
+)
+async def recognize_faces_raw(request: Request, detector: Optional[str] = None):
+    """Recognize faces in an application/octet-stream image body"""
+    return await _recognize(await request.body(), detector)
+
+
+@router.post("/faces/recognize/batch", response_model=BatchRecognitionResponse)
+async def recognize_faces_batch(request: BatchRecognitionRequest):
+    """Recognize faces in many images with one gallery pass"""
+    return await _recognize_batch(request.images, request.detector)
+
+
+@router.post("/faces/recognize/batch/upload", response_model=BatchRecognitionResponse)
+async def recognize_faces_batch_upload(
+    images: List[UploadFile] = File(...), detector: Optional[str] = Form(None)
+):
+    """Recognize faces in many multipart/form-data image uploads"""
+    return await _recognize_batch([await image.read() for image in images], detector)
+
+
+async def _receive_frames(websocket: WebSocket, session: StreamSession):
+    """Feed incoming frames to the session until the client goes away"""
+    max_frame_bytes = settings.max_face_size_mb * 1024 * 1024
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            # Binary JPEG frames; text frames are taken as base64 images
+            frame = message.get("bytes") or message.get("text")
+            if not frame:
+                continue
+            if len(frame) > max_frame_bytes:
+                await websocket.close(code=status.WS_1009_MESSAGE_TOO_BIG)
+                break
+            session.submit(frame)
+    finally:
+        session.close()
+
+
+@router.websocket("/faces/stream")
+async def recognize_stream(websocket: WebSocket, detector: Optional[str] = None):
+    """Recognize faces in a live stream of binary JPEG frames
+
+    Results are pushed back as JSON as each frame is processed. Frames that
+    arrive while recognition is busy replace each other, so only the newest
+    one is processed and latency does not build up.
+    """
+    await websocket.accept()
+    if detector is not None and detector not in DETECTOR_BACKENDS:
+        await websocket.close(
+            code=status.WS_1008_POLICY_VIOLATION,
+            reason=f"Unknown detector '{detector}'",
+        )
+        return
+    if not services.ready:
+        await websocket.close(
+            code=status.WS_1013_TRY_AGAIN_LATER,
+            reason=f"Recognition service is {services.stage}",
+        )
+        return
+
+    session = StreamSession(services.get_engine(), detector)
+    receiver = asyncio.create_task(_receive_frames(websocket, session))
+    try:
+        while True:
+            frame = await session.next_frame()
+            if frame is None:
+                break
+
+            result = await session.process(*frame)
+
+            # Track metrics
+            metrics.add_recognition_time(result.processing_time)
+
+            await websocket.send_text(result.model_dump_json())
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error in recognition stream: {str(e)}")
+    finally:
+        session.close()
+        receiver.cancel()
+
+    logger.info(
+        f"Recognition stream closed: {session.frames_received} frames received, "
+        f"{session.frames_processed} processed, {session.frames_dropped} dropped"
+    )
+
+
 @router.get("/faces/", response_model=List[FaceData])
-async def get_all_faces(db: Session = Depends(get_db)):
-    """Get all enrolled faces"""
+async def get_all_faces(
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(FACE_PAGE_SIZE, ge=1, le=MAX_FACE_PAGE_SIZE),
+    name_prefix: Optional[str] = Query(None, max_length=100),
+    db: AsyncSession = Depends(get_db),
+):
+    """Get a page of enrolled faces in id order
+
+    Pass the last id of a page as ``after_id`` to get the next one; a page
+    shorter than ``limit`` is the last.
+    """
     try:
-        faces = db.query(Face).all()
-        return faces
+        return await db.run_sync(list_faces, after_id, limit, name_prefix)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/faces/export")
+async def export_faces(
+    name_prefix: Optional[str] = Query(None, max_length=100),
+    db: AsyncSession = Depends(get_db),
+):
+    """Stream every enrolled face as one JSON array"""
+
+    async def generate():
+        yield "["
+        separator = ""
+        async for page in iter_faces(db, name_prefix):
+            for face in page:
+                yield separator + FaceData.model_validate(face).model_dump_json()
+                separator = ","
+        yield "]"
+
+    return StreamingResponse(generate(), media_type="application/json")
+
+
 @router.delete("/faces/{face_id}")
-async def delete_face(face_id: int, db: Session = Depends(get_db)):
+async def delete_face(face_id: int, db: AsyncSession = Depends(get_db)):
     """Delete an enrolled face"""
     try:
-        face = db.query(Face).filter(Face.id == face_id).first()
+        face = await db.get(Face, face_id)
         if not face:
             raise HTTPException(status_code=404, detail="Face not found")
 
         # Delete encoding file
-        face_recognition_service.delete_face_encoding(face.encoding_path)
+        await run_in_threadpool(
+            services.get_service().delete_face_encoding, face.encoding_path
+        )
 
         # Delete image file if exists
         if os.path.exists(face.image_path):
             os.remove(face.image_path)
 
         # Delete from database
-        db.delete(face)
-        db.commit()
+        await db.delete(face)
+        await db.commit()
 
         return {"message": f"Face {face.name} deleted successfully"}
 
@@ -110,11 +533,10 @@ async def delete_face(face_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/faces/count")
-async def get_faces_count(db: Session = Depends(get_db)):
+async def get_faces_count(db: AsyncSession = Depends(get_db)):
     """Get total number of enrolled faces"""
     try:
-        count = db.query(Face).count()
-        return {"total_faces": count}
+        return {"total_faces": await db.run_sync(count_faces)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -123,7 +545,7 @@ async def get_faces_count(db: Session = Depends(get_db)):
 async def get_faces_statistics():
     """Get detailed statistics about enrolled faces including grouped encodings"""
     try:
-        stats = face_recognition_service.get_face_statistics()
+        stats = services.get_service().get_face_statistics()
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,22 +1,106 @@
 import sqlalchemy
-from sqlalchemy.orm import sessionmaker
-from app.models.database import Base
+from sqlalchemy import event, func, inspect, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+)
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from typing import AsyncIterator, List, Optional, Tuple
+import numpy as np
+from app.config import settings
+from app.models.database import Base, Face, FaceCount
+from app.services.gallery import ENCODING_DIM
 import os
 
-DATABASE_URL = "sqlite:///./face_database/faces.db"
+DATABASE_URL = settings.database_url
 
-engine = sqlalchemy.create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Applied to every SQLite connection: WAL lets readers run alongside the
+# writer, NORMAL sync is still crash-safe under WAL, and writers from other
+# workers wait for the lock instead of failing
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -65536,  # 64 MB
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,
+    "foreign_keys": "ON",
+}
+
+# Rows fetched per round trip when streaming encodings
+LOAD_BATCH_ROWS = 4096
+
+def _apply_sqlite_pragmas(engine: sqlalchemy.engine.Engine):
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def create_database_engine(url: str):
+    """Create an engine, with tuned pragmas on every SQLite connection"""
+    if not url.startswith("sqlite"):
+        return sqlalchemy.create_engine(url)
+
+    engine = sqlalchemy.create_engine(url, connect_args={"check_same_thread": False})
+    _apply_sqlite_pragmas(engine)
+    return engine
+
+def create_async_database_engine(url: str) -> AsyncEngine:
+    """Create a pooled asyncio engine for the API routes
+
+    A plain SQLite URL is opened through aiosqlite, which runs each connection
+    in its own thread; other databases need an async driver in the URL.
+    """
+    url = make_url(url)
+    pool = {
+        "pool_size": settings.database_pool_size,
+        "max_overflow": settings.database_max_overflow,
+    }
+    if url.drivername != "sqlite":
+        return create_async_engine(url, **pool)
+
+    # aiosqlite defaults to a connection per session, paying for the
+    # pragmas every time
+    engine = create_async_engine(
+        url.set(drivername="sqlite+aiosqlite"),
+        poolclass=AsyncAdaptedQueuePool,
+        **pool,
+    )
+    _apply_sqlite_pragmas(engine.sync_engine)
+    return engine
+
+engine = create_database_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Used by the async routes; the CLI and the startup loader stay synchronous
+async_engine = create_async_database_engine(DATABASE_URL)
+
+# Rows stay readable after commit without another round trip
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+def migrate_schema(bind):
+    """Add columns and indexes introduced after an existing database was created"""
+    columns = {column["name"] for column in inspect(bind).get_columns("faces")}
+    if "encoding" not in columns:
+        with bind.begin() as connection:
+            connection.execute(text("ALTER TABLE faces ADD COLUMN encoding BLOB"))
+    # Indexes added to existing tables, such as the one on Face.name
+    for index in Face.__table__.indexes:
+        index.create(bind, checkfirst=True)
+
 def init_database():
     """Initialize database tables"""
     # Create face_database directory if it doesn't exist
     os.makedirs("face_database", exist_ok=True)
     # Create all tables
     Base.metadata.create_all(bind=engine)
+    migrate_schema(engine)
 
 def get_database():
     """Get database session"""
@@ -25,3 +109,77 @@ def get_database():
         yield db
     finally:
         db.close()
+
+async def get_async_database():
+    """Get async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def encoding_to_blob(encoding: np.ndarray) -> bytes:
+    """Pack one face encoding for the ``Face.encoding`` column"""
+    return np.asarray(encoding, dtype="<f4").reshape(ENCODING_DIM).tobytes()
+
+def load_face_encodings(db: Session) -> Tuple[np.ndarray, List[str], List[str]]:
+    """Stream every stored encoding into one preallocated array
+
+    Returns the encodings, names and encoding references in face id order,
+    read with a single SELECT in batches of ``LOAD_BATCH_ROWS``.
+    """
+    stored = Face.encoding.isnot(None)
+    count = db.query(func.count(Face.id)).filter(stored).scalar()
+    encodings = np.empty((count, ENCODING_DIM), dtype=np.float32)
+    names, encoding_paths = [], []
+
+    rows = db.execute(
+        select(Face.name, Face.encoding_path, Face.encoding)
+        .where(stored)
+        .order_by(Face.id)
+        .execution_options(yield_per=LOAD_BATCH_ROWS)
+    )
+    for name, encoding_path, blob in rows:
+        if len(names) == count:
+            break  # Rows committed after counting are left for the next load
+        encodings[len(names)] = np.frombuffer(blob, dtype="<f4")
+        names.append(name)
+        encoding_paths.append(encoding_path)
+    return encodings[: len(names)], names, encoding_paths
+
+# Listing columns; the encoding blob is never needed to show a face
+FACE_LIST_COLUMNS = (
+    Face.id, Face.name, Face.image_path, Face.encoding_path, Face.created_at
+)
+
+def list_faces(
+    db: Session, after_id: int = 0, limit: int = 100, name_prefix: Optional[str] = None
+) -> List:
+    """One keyset page of faces in id order: the ``limit`` rows after ``after_id``"""
+    query = select(*FACE_LIST_COLUMNS).where(Face.id > after_id)
+    if name_prefix:
+        # A range rather than LIKE, which SQLite cannot answer from the index
+        query = query.where(
+            Face.name >= name_prefix, Face.name < name_prefix + "\U0010ffff"
+        )
+    return db.execute(query.order_by(Face.id).limit(limit)).all()
+
+async def iter_faces(
+    db: AsyncSession,
+    name_prefix: Optional[str] = None,
+    batch_size: int = LOAD_BATCH_ROWS,
+) -> AsyncIterator[List]:
+    """Every matching face, a keyset page at a time"""
+    after_id = 0
+    while True:
+        page = await db.run_sync(list_faces, after_id, batch_size, name_prefix)
+        if page:
+            yield page
+        if len(page) < batch_size:
+            return
+        after_id = page[-1].id
+
+def count_faces(db: Session) -> int:
+    """Number of faces, read from the trigger-maintained counter row"""
+    total = db.query(FaceCount.total).filter(FaceCount.id == 1).scalar()
+    if total is None:
+        # Not SQLite, so no triggers were installed
+        total = db.query(func.count(Face.id)).scalar()
+    return total
@@ -0,0 +1,395 @@
+"""
+Process-pool execution engine for CPU-bound face recognition work
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.models.schemas import RecognitionResult
+from app.services.face_recognition_service import FaceRecognitionService
+from app.services.probe_cache import CachedProbe
+from app.services.tracker import FaceTracker
+from app.utils.performance import metrics
+from app.utils.profiler import Profile, current_profile, profiled
+
+logger = logging.getLogger(__name__)
+
+# Larger images are hashed for the probe cache in the thread pool
+_INLINE_KEY_BYTES = 64 * 1024
+
+# Service instance owned by each pool worker process
+_worker_service: Optional[FaceRecognitionService] = None
+
+
+def _init_worker():
+    """Load the dlib models once per pool worker"""
+    global _worker_service
+    _worker_service = FaceRecognitionService(load_gallery=False)
+
+
+def default_processes() -> int:
+    """Pool size per API process: the CPU cores shared among uvicorn workers"""
+    return max(1, (os.cpu_count() or 1) // max(settings.workers, 1))
+
+
+def _pool_context():
+    # Workers start from a fresh interpreter instead of forking this process,
+    # whose other threads (the loader, the event loop) may hold locks
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def _call_worker(method: str, *args):
+    """Run a stateless service method inside a pool worker"""
+    return getattr(_worker_service, method)(*args)
+
+
+def _call_worker_profiled(interval: float, method: str, *args):
+    """Run a service method in a pool worker and return its stack samples too"""
+    profile = Profile(method, interval)
+    with profile.sampling():
+        result = getattr(_worker_service, method)(*args)
+    return result, profile.samples
+
+
+class RecognitionEngine:
+    """Run decode/detect/encode off the event loop
+
+    The CPU-bound stages run in a process pool, by default with an equal share
+    of the cores for every uvicorn worker, while the event loop keeps serving
+    other requests.
+    Gallery matching is a single vectorized pass and runs in the parent's
+    thread pool against the live gallery, so pool workers never hold gallery
+    state that could go stale after an enrollment or delete.
+
+    With ``processes=0`` the stages run in the default thread pool instead.
+    """
+
+    def __init__(
+        self, service: FaceRecognitionService, processes: Optional[int] = None
+    ):
+        self.service = service
+        self.processes = default_processes() if processes is None else processes
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            logger.info(f"Starting recognition process pool ({self.processes} workers)")
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=_pool_context(),
+                initializer=_init_worker,
+            )
+        return self._pool
+
+    async def run(self, method: str, *args):
+        """Await a CPU-bound service method in the pool"""
+        loop = asyncio.get_running_loop()
+        if self.processes <= 0:
+            return await loop.run_in_executor(
+                None, profiled(getattr(self.service, method)), *args
+            )
+
+        try:
+            profile = current_profile()
+            if profile is None:
+                return await loop.run_in_executor(
+                    self._get_pool(), _call_worker, method, *args
+                )
+            # Workers sample themselves; their stacks join the request's profile
+            result, samples = await loop.run_in_executor(
+                self._get_pool(),
+                _call_worker_profiled,
+                profile.interval,
+                method,
+                *args,
+            )
+            profile.merge(samples)
+            return result
+        except BrokenProcessPool:
+            # A crashed worker poisons the pool; start a fresh one next time
+            logger.error("Recognition process pool broke, restarting it")
+            self.shutdown()
+            raise
+
+    async def _analyze(
+        self, image_data: Union[str, bytes], detector: Optional[str] = None
+    ) -> Tuple[List[Tuple[int, int, int, int]], np.ndarray, Dict[str, float]]:
+        """Decode, detect and encode in the pool and record the stage times"""
+        face_locations, face_encodings, (backend, stage_times) = await self.run(
+            "analyze_image", image_data, detector
+        )
+        # Workers time their stages; the metrics live in this process
+        metrics.add_analysis(backend, stage_times, len(face_locations))
+        return face_locations, face_encodings, stage_times
+
+    async def _probe_key(
+        self, image_data: Union[str, bytes], detector: Optional[str] = None
+    ) -> bytes:
+        """Probe cache key of an image, hashed off the event loop if large"""
+        key = self.service.probe_cache.key
+        if len(image_data) > _INLINE_KEY_BYTES:
+            return await run_in_threadpool(key, image_data, detector)
+        return key(image_data, detector)
+
+    async def _analyze_cached(
+        self, image_data: Union[str, bytes], detector: Optional[str] = None
+    ) -> CachedProbe:
+        """Analyze an image in the pool unless the probe cache already has it"""
+        probe_cache = self.service.probe_cache
+        key = await self._probe_key(image_data, detector)
+        probe = probe_cache.get(key)
+        if probe is None:
+            face_locations, face_encodings, stage_times = await self._analyze(
+                image_data, detector
+            )
+            probe = probe_cache.put(key, face_locations, face_encodings)
+        return probe
+
+    async def recognize(
+        self,
+        image_data: Union[str, bytes],
+        detector: Optional[str] = None,
+        use_cache: bool = True,
+    ) -> Tuple[List[RecognitionResult], float]:
+        """Recognize faces in an image without blocking the event loop
+
+        Resubmissions of an image, base64 or raw, are served from the probe
+        cache and only re-matched if the gallery changed since.
+        """
+        start_time = time.time()
+
+        try:
+            if use_cache:
+                probe = await self._analyze_cached(image_data, detector)
+            else:
+                face_locations, face_encodings, _ = await self._analyze(
+                    image_data, detector
+                )
+                probe = CachedProbe(face_locations, face_encodings, 0.0)
+
+            # Match all faces against the gallery together
+            matches = await run_in_threadpool(profiled(self.service.match_probe), probe)
+            results = self.service.build_results(probe.face_locations, matches)
+
+            processing_time = time.time() - start_time
+            return results, processing_time
+
+        except Exception as e:
+            processing_time = time.time() - start_time
+            logger.error(f"Error in face recognition: {str(e)}")
+            return [], processing_time
+
+    async def recognize_tracked(
+        self,
+        image_data: Union[str, bytes],
+        tracker: FaceTracker,
+        detector: Optional[str] = None,
+    ) -> Tuple[List[RecognitionResult], float, int]:
+        """Recognize faces in a stream frame, reusing tracked identities
+
+        Faces are detected on every frame, but only faces the tracker flags
+        (new, drifted or due for a refresh) are encoded and matched; the rest
+        keep the identity of their track. Also returns how many faces were
+        encoded.
+        """
+        start_time = time.time()
+
+        try:
+            face_locations, (backend, stage_times) = await self.run(
+                "locate_faces", image_data, detector
+            )
+            metrics.add_analysis(backend, stage_times, len(face_locations))
+
+            plan = tracker.update(face_locations)
+            stale = [i for i, (_, needs_encoding) in enumerate(plan) if needs_encoding]
+            if stale:
+                face_encodings, stage_times = await self.run(
+                    "encode_faces", image_data, [face_locations[i] for i in stale]
+                )
+                metrics.add_analysis(backend, stage_times)
+                matches = await run_in_threadpool(
+                    profiled(self.service.match_faces), face_encodings
+                )
+                for i, (name, confidence) in zip(stale, matches):
+                    plan[i][0].identify(name, confidence)
+
+            results = self.service.build_results(
+                face_locations, [(track.name, track.confidence) for track, _ in plan]
+            )
+            for result, (track, _) in zip(results, plan):
+                result.track_id = track.track_id
+
+            processing_time = time.time() - start_time
+            return results, processing_time, len(stale)
+
+        except Exception as e:
+            processing_time = time.time() - start_time
+            logger.error(f"Error in tracked face recognition: {str(e)}")
+            return [], processing_time, 0
+
+    async def recognize_batch(
+        self, images: Sequence[Union[str, bytes]], detector: Optional[str] = None
+    ) -> Tuple[List[Tuple[List[RecognitionResult], Optional[str]]], Dict[str, float]]:
+        """Recognize faces in many images, matching all faces in one pass
+
+        Images are decoded, detected and encoded in parallel across the pool;
+        the encodings of every image are then stacked and matched against the
+        gallery as one probe matrix. Returns per-image results (with an error
+        message for images that failed) and per-stage timings in seconds.
+        """
+        start_time = time.time()
+
+        detection_time = 0.0
+
+        async def analyze(image: Union[str, bytes]) -> CachedProbe:
+            nonlocal detection_time
+            probe_cache = self.service.probe_cache
+            key = await self._probe_key(image, detector)
+            probe = probe_cache.get(key)
+            if probe is None:
+                face_locations, face_encodings, stage_times = await self._analyze(
+                    image, detector
+                )
+                detection_time += stage_times["detect"]
+                probe = probe_cache.put(key, face_locations, face_encodings)
+            return probe
+
+        analyses = await asyncio.gather(
+            *(analyze(image) for image in images), return_exceptions=True
+        )
+        analyze_time = time.time() - start_time
+
+        encodings = []
+        for analysis in analyses:
+            if isinstance(analysis, Exception):
+                logger.error(f"Error analyzing batch image: {str(analysis)}")
+                continue
+            encodings.append(analysis.face_encodings.reshape(-1, 128))
+
+        # Match the faces of every image against the gallery together
+        match_start = time.time()
+        probes = np.concatenate(encodings) if encodings else np.empty((0, 128))
+        matches = await run_in_threadpool(profiled(self.service.match_faces), probes)
+        match_time = time.time() - match_start
+
+        results = []
+        offset = 0
+        for analysis in analyses:
+            if isinstance(analysis, Exception):
+                results.append(([], str(analysis)))
+                continue
+            face_locations = analysis.face_locations
+            image_matches = matches[offset : offset + len(face_locations)]
+            offset += len(face_locations)
+            results.append(
+                (self.service.build_results(face_locations, image_matches), None)
+            )
+
+        timings = {
+            "analyze": analyze_time,
+            "detection": detection_time,
+            "match": match_time,
+            "total": time.time() - start_time,
+        }
+        return results, timings
+
+    async def enroll(
+        self,
+        image_data: Union[str, bytes],
+        name: str,
+        detector: Optional[str] = None,
+    ) -> Tuple[bool, str, Optional[str], Optional[str]]:
+        """Enroll a face without blocking the event loop"""
+        try:
+            face_encoding, image_path, error = await self.run(
+                "prepare_enrollment", image_data, name, detector
+            )
+            if error is not None:
+                return False, error, None, None
+
+            success, message, encoding_path = await run_in_threadpool(
+                profiled(self.service.add_enrollment), face_encoding, name
+            )
+            return success, message, encoding_path, image_path
+
+        except Exception as e:
+            return False, f"Error enrolling face: {str(e)}", None, None
+
+    async def enroll_many(
+        self,
+        items: AsyncIterator[Tuple[str, Union[str, bytes]]],
+        detector: Optional[str] = None,
+    ) -> List[Tuple[Optional[str], Optional[np.ndarray], Optional[str], Optional[str]]]:
+        """Enroll a stream of (name, image) pairs with one gallery write
+
+        Images are prepared in the pool as they arrive, with at most two per
+        worker in flight, so the input is never held in memory as a whole.
+        All encodings are then written to the gallery store together. Returns
+        the encoding path, encoding, image path and error of every item, in
+        order.
+        """
+        in_flight = 2 * max(self.processes, 1)
+
+        async def prepare(name: str, image_data: Union[str, bytes]):
+            try:
+                return await self.run("prepare_enrollment", image_data, name, detector)
+            except Exception as e:
+                return None, None, f"Error enrolling face: {str(e)}"
+
+        names: List[str] = []
+        prepared: List[asyncio.Future] = []
+        pending = set()
+        async for name, image_data in items:
+            if len(pending) >= in_flight:
+                _, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+            future = asyncio.ensure_future(prepare(name, image_data))
+            names.append(name)
+            prepared.append(future)
+            pending.add(future)
+        results = await asyncio.gather(*prepared)
+
+        enrolled = [i for i, (_, _, error) in enumerate(results) if error is None]
+        encoding_paths: Dict[int, str] = {}
+        if enrolled:
+            paths = await run_in_threadpool(
+                profiled(self.service.add_enrollments),
+                np.array([results[i][0] for i in enrolled]),
+                [names[i] for i in enrolled],
+            )
+            encoding_paths = dict(zip(enrolled, paths))
+
+        return [
+            (encoding_paths.get(i), encoding, image_path, error)
+            for i, (encoding, image_path, error) in enumerate(results)
+        ]
+
+    def warm_up(self):
+        """Start every pool worker and run a first inference in each"""
+        self.service.warm_up()
+        if self.processes > 0:
+            pool = self._get_pool()
+            futures = [
+                pool.submit(_call_worker, "warm_up") for _ in range(self.processes)
+            ]
+            for future in futures:
+                future.result()
+
+    def shutdown(self):
+        """Stop the pool workers"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,153 @@
+"""
+Pluggable face detector backends
+"""
+
+import logging
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import cv2
+import face_recognition
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FaceLocation = Tuple[int, int, int, int]  # (top, right, bottom, left)
+
+
+class FaceDetector:
+    """Find face boxes in an RGB image
+
+    ``detect`` returns ``(top, right, bottom, left)`` boxes in the
+    coordinates of the image it was given. ``min_face_size`` is the smallest
+    face (in pixels) found without upsampling, which the automatic detection
+    scale aims for; ``None`` means the backend handles scale on its own.
+    """
+
+    name = "base"
+    min_face_size: Optional[int] = 80
+    upsamples = False  # Whether ``upsample`` is honoured
+
+    def detect(self, image: np.ndarray, upsample: int = 0) -> List[FaceLocation]:
+        raise NotImplementedError
+
+
+class HOGDetector(FaceDetector):
+    """dlib HOG + linear SVM detector (face_recognition ``model="hog"``)"""
+
+    name = "hog"
+    upsamples = True
+
+    def detect(self, image: np.ndarray, upsample: int = 0) -> List[FaceLocation]:
+        return face_recognition.face_locations(
+            image, number_of_times_to_upsample=upsample, model="hog"
+        )
+
+
+class CNNDetector(FaceDetector):
+    """dlib MMOD CNN detector, run on the CPU unless dlib was built with CUDA"""
+
+    name = "cnn"
+    upsamples = True
+
+    def detect(self, image: np.ndarray, upsample: int = 0) -> List[FaceLocation]:
+        return face_recognition.face_locations(
+            image, number_of_times_to_upsample=upsample, model="cnn"
+        )
+
+
+class HaarDetector(FaceDetector):
+    """OpenCV Haar cascade detector; ``upsample`` is ignored"""
+
+    name = "haar"
+    min_face_size = 24  # Cascade window
+
+    def __init__(
+        self,
+        cascade_path: Optional[str] = None,
+        scale_factor: float = 1.1,
+        min_neighbors: int = 5,
+    ):
+        if cascade_path is None:
+            cascade_path = os.path.join(
+                cv2.data.haarcascades, "haarcascade_frontalface_default.xml"
+            )
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        if self.cascade.empty():
+            raise FileNotFoundError(f"Could not load Haar cascade: {cascade_path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self._lock = threading.Lock()  # Cascades are not safe to share
+
+    def detect(self, image: np.ndarray, upsample: int = 0) -> List[FaceLocation]:
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        with self._lock:
+            boxes = self.cascade.detectMultiScale(
+                gray,
+                scaleFactor=self.scale_factor,
+                minNeighbors=self.min_neighbors,
+                minSize=(self.min_face_size, self.min_face_size),
+            )
+        return [(int(y), int(x + w), int(y + h), int(x)) for x, y, w, h in boxes]
+
+
+class DNNDetector(FaceDetector):
+    """OpenCV DNN ResNet-10 SSD detector (res10_300x300 Caffe model)
+
+    Every image is resized to the network's 300x300 input, so detection cost
+    does not depend on the image size; ``upsample`` is ignored.
+    """
+
+    name = "dnn"
+    min_face_size = None
+    input_size = 300
+    mean = (104.0, 177.0, 123.0)  # BGR training mean
+
+    def __init__(self, prototxt_path: str, weights_path: str, confidence: float = 0.5):
+        for path in (prototxt_path, weights_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"OpenCV DNN face model not found: {path}")
+        self.net = cv2.dnn.readNetFromCaffe(prototxt_path, weights_path)
+        self.confidence = confidence
+        self._lock = threading.Lock()  # Net.forward is not thread-safe
+
+    def detect(self, image: np.ndarray, upsample: int = 0) -> List[FaceLocation]:
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(
+            cv2.resize(image, (self.input_size, self.input_size)),
+            1.0,
+            (self.input_size, self.input_size),
+            self.mean,
+            swapRB=True,  # The model was trained on BGR images
+        )
+        with self._lock:
+            self.net.setInput(blob)
+            detections = self.net.forward()[0, 0]
+
+        # Rows are [image, class, confidence, x1, y1, x2, y2] in relative units
+        detections = detections[detections[:, 2] >= self.confidence]
+        boxes = detections[:, 3:7] * np.array([width, height, width, height])
+        locations = []
+        for x1, y1, x2, y2 in boxes:
+            top, left = max(0, int(y1)), max(0, int(x1))
+            bottom, right = min(height, int(y2)), min(width, int(x2))
+            if bottom > top and right > left:
+                locations.append((top, right, bottom, left))
+        return locations
+
+
+DETECTOR_BACKENDS = ("hog", "cnn", "haar", "dnn")
+
+
+def create_detector(backend: str, **options) -> FaceDetector:
+    """Build a face detector backend by name"""
+    if backend == "hog":
+        return HOGDetector()
+    if backend == "cnn":
+        return CNNDetector()
+    if backend == "haar":
+        return HaarDetector(**options)
+    if backend == "dnn":
+        return DNNDetector(**options)
+    raise ValueError(f"Unknown face detector backend: {backend}")
@@ -0,0 +1,231 @@
+"""
+Candidate indexes for gallery matching
+"""
+
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.gallery import FaceGallery
+
+logger = logging.getLogger(__name__)
+
+
+class FaceIndex:
+    """Narrow a gallery scan down to candidate encodings
+
+    ``candidates`` returns, for every probe, the encoding ids worth scoring
+    exactly, or ``None`` to scan the whole gallery. Indexes are keyed by the
+    gallery's stable encoding ids, so gallery rows can move freely.
+    """
+
+    @property
+    def is_trained(self) -> bool:
+        """Whether new encodings can be added without a full ``sync``"""
+        return True
+
+    def sync(self, gallery: FaceGallery):
+        """Bring the index in line with a freshly loaded gallery"""
+
+    def add(self, ids: np.ndarray, encodings: np.ndarray):
+        """Index newly enrolled encodings"""
+
+    def remove(self, ids: np.ndarray):
+        """Drop deleted encodings from the index"""
+
+    def candidates(self, face_encodings: np.ndarray) -> Optional[List[np.ndarray]]:
+        """Candidate encoding ids per probe, or None for a full scan"""
+        return None
+
+    def save(self):
+        """Persist the index to disk"""
+
+
+class ExactIndex(FaceIndex):
+    """Brute-force scan of every known encoding"""
+
+
+class IVFIndex(FaceIndex):
+    """Inverted-file index with a k-means coarse quantizer
+
+    Encodings are assigned to the closest of ``nlist`` centroids. A probe
+    only looks at the encodings of its ``nprobe`` closest cells; the gallery
+    then scores the people owning them exactly. Raising ``nprobe`` trades
+    speed for recall. Galleries smaller than ``min_size`` are scanned in full.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        nlist: int = 256,
+        nprobe: int = 8,
+        min_size: int = 10000,
+        train_sample: int = 100000,
+        train_iterations: int = 20,
+    ):
+        self.path = path
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.train_sample = train_sample
+        self.train_iterations = train_iterations
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[np.ndarray] = []
+        self._cell_of: Dict[int, int] = {}
+        self.load()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def train(self, encodings: np.ndarray, ids: np.ndarray):
+        """Fit the coarse quantizer and assign every encoding to a cell"""
+        encodings = np.asarray(encodings, dtype=np.float32)
+        rng = np.random.default_rng(0)
+        sample = encodings
+        if len(sample) > self.train_sample:
+            sample = sample[rng.choice(len(sample), self.train_sample, replace=False)]
+
+        nlist = min(self.nlist, len(sample))
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            assignment = self._nearest(sample, centroids, 1)[:, 0]
+            counts = np.bincount(assignment, minlength=nlist)
+            empty = counts == 0
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[~empty]
+            order = np.argsort(assignment, kind="stable")
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            centroids[~empty] = sums / counts[~empty, np.newaxis]
+            # Re-seed empty cells with random points so every cell stays useful
+            centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+
+        self.centroids = centroids
+        self.lists = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._cell_of = {}
+        self.add(ids, encodings)
+        logger.info(f"Trained IVF index: {nlist} cells over {len(ids)} encodings")
+
+    def sync(self, gallery: FaceGallery):
+        if len(gallery) < self.min_size and not self.is_trained:
+            return
+        encodings, ids = gallery.live_arrays()
+        if not self.is_trained:
+            self.train(encodings, ids)
+            self.save()
+            return
+
+        # Reconcile a persisted index with the gallery on disk
+        indexed = np.fromiter(self._cell_of.keys(), dtype=np.int64, count=len(self))
+        stale = np.setdiff1d(indexed, ids)
+        missing_rows = gallery.rows_for(np.setdiff1d(ids, indexed))
+        if len(stale) or len(missing_rows):
+            self.remove(stale)
+            self.add(gallery.ids[missing_rows], gallery.encodings[missing_rows])
+            self.save()
+            logger.info(
+                f"Synced IVF index: +{len(missing_rows)} / -{len(stale)} encodings"
+            )
+
+    def add(self, ids: np.ndarray, encodings: np.ndarray):
+        if not self.is_trained or len(ids) == 0:
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        cells = self._nearest(
+            np.asarray(encodings, dtype=np.float32), self.centroids, 1
+        )
+        cells = cells[:, 0]
+        for cell in np.unique(cells):
+            self.lists[cell] = np.concatenate((self.lists[cell], ids[cells == cell]))
+        self._cell_of.update(zip(ids.tolist(), cells.tolist()))
+
+    def remove(self, ids: np.ndarray):
+        cells: Dict[int, List[int]] = {}
+        for encoding_id in np.asarray(ids, dtype=np.int64).tolist():
+            cell = self._cell_of.pop(encoding_id, None)
+            if cell is not None:
+                cells.setdefault(cell, []).append(encoding_id)
+        for cell, removed in cells.items():
+            self.lists[cell] = self.lists[cell][~np.isin(self.lists[cell], removed)]
+
+    def candidates(self, face_encodings: np.ndarray) -> Optional[List[np.ndarray]]:
+        if not self.is_trained or len(self) < self.min_size:
+            return None
+        probes = np.asarray(face_encodings, dtype=np.float32).reshape(
+            -1, self.centroids.shape[1]
+        )
+        nprobe = min(self.nprobe, len(self.centroids))
+        probed = self._nearest(probes, self.centroids, nprobe)
+        return [
+            np.concatenate([self.lists[cell] for cell in cells]) for cells in probed
+        ]
+
+    def save(self):
+        if not self.is_trained:
+            return
+        sizes = np.array([len(cells) for cells in self.lists], dtype=np.int64)
+        # A temporary file of our own: other workers may be saving too
+        fd, tmp_path = tempfile.mkstemp(
+            suffix=".tmp.npz", dir=os.path.dirname(self.path) or "."
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    centroids=self.centroids,
+                    sizes=sizes,
+                    ids=np.concatenate(self.lists),
+                )
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                centroids = data["centroids"]
+                sizes = data["sizes"]
+                ids = data["ids"]
+        except Exception as e:
+            logger.error(f"Error loading IVF index {self.path}: {e}")
+            return
+
+        self.centroids = centroids
+        self.lists = np.split(ids, np.cumsum(sizes)[:-1])
+        cells = np.repeat(np.arange(len(sizes)), sizes)
+        self._cell_of = dict(zip(ids.tolist(), cells.tolist()))
+        logger.info(f"Loaded IVF index with {len(self)} encodings")
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the ``k`` closest centroids for every vector"""
+        centroid_norms = np.einsum("ij,ij->i", centroids, centroids)[np.newaxis, :]
+        nearest = np.empty((len(vectors), k), dtype=np.int64)
+        # Chunk the rows so the score matrix stays small on large galleries
+        for start in range(0, len(vectors), 16384):
+            chunk = vectors[start : start + 16384]
+            scores = centroid_norms - 2.0 * (chunk @ centroids.T)
+            if k == 1:
+                nearest[start : start + len(chunk), 0] = np.argmin(scores, axis=1)
+            else:
+                nearest[start : start + len(chunk)] = np.argpartition(
+                    scores, k - 1, axis=1
+                )[:, :k]
+        return nearest
+
+
+def create_index(backend: str, path: str, **options) -> FaceIndex:
+    """Build the matching index configured for this deployment"""
+    if backend == "exact":
+        return ExactIndex()
+    if backend == "ivf":
+        return IVFIndex(path, **options)
+    raise ValueError(f"Unknown face index backend: {backend}")
@@ -1,37 +1,101 @@
 import cv2
 import numpy as np
 import base64
+import hashlib
+import math
 import os
-import pickle
+import re
+import secrets
+import threading
 import time
+import dlib
 import face_recognition
+from face_recognition import api as face_recognition_api
 from PIL import Image
 from io import BytesIO
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 import logging
 from app.models.schemas import RecognitionResult
 from app.config import settings
+from app.services.face_detectors import FaceDetector, create_detector
+from app.services.face_index import ExactIndex, FaceIndex, create_index
+from app.services.gallery import FaceGallery, PersonMatch
+from app.services.gallery_store import GalleryStore
+from app.services.probe_cache import CachedProbe, ProbeCache
+from app.utils.image_utils import resize_image, scale_face_locations
+from app.utils.performance import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Encodings in the gallery store are referenced as "gallery:<encoding id>"
+GALLERY_REFERENCE_PREFIX = "gallery:"
+
+
+def encoding_id_for(encoding_path: str) -> int:
+    """Stable 63-bit gallery/index id of an encoding reference
+
+    Legacy per-file pickles are keyed by a hash of their filename, which the
+    store migration keeps, so paths already saved in the database still work.
+    """
+    if encoding_path.startswith(GALLERY_REFERENCE_PREFIX):
+        return int(encoding_path[len(GALLERY_REFERENCE_PREFIX) :])
+    digest = hashlib.blake2b(
+        os.path.basename(encoding_path).encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "little") >> 1
+
+
 class FaceRecognitionService:
-    def __init__(self):
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.face_encodings_by_name = {}  # Dictionary to group encodings by name
+    def __init__(self, load_gallery: bool = True):
+        self.gallery = FaceGallery()  # Encoding matrix shared with other workers
+        self._gallery_lock = threading.Lock()  # Serializes gallery swaps
+        self._compaction: Optional[threading.Thread] = None
+        # (gallery, statistics): galleries are immutable, so the numbers only
+        # change when a new generation is loaded
+        self._statistics: Optional[Tuple[FaceGallery, Dict]] = None
         self.face_database_path = "face_database"
         self.encodings_path = os.path.join(self.face_database_path, "encodings")
         self.uploads_path = os.path.join(self.face_database_path, "uploads")
-        os.makedirs(self.encodings_path, exist_ok=True)
         os.makedirs(self.uploads_path, exist_ok=True)
+        self.store = GalleryStore(
+            os.path.join(self.face_database_path, "gallery"),
+            settings.gallery_quantization,
+        )
+        self._detectors: Dict[str, FaceDetector] = {}  # Built on first use
+        self._detectors_lock = threading.Lock()
+        self.probe_cache = ProbeCache(
+            settings.probe_cache_size, settings.probe_cache_ttl_seconds
+        )
 
         # Use face_recognition library (dlib-based)
         logger.info("Initializing face recognition service with dlib models")
 
-        self.load_known_faces()
+        # Engine pool workers only decode/detect/encode and skip the gallery
+        self.index: FaceIndex = ExactIndex()
+        if load_gallery:
+            self.index = create_index(
+                settings.face_index_backend,
+                os.path.join(self.face_database_path, "ivf_index.npz"),
+                nlist=settings.ivf_nlist,
+                nprobe=settings.ivf_nprobe,
+                min_size=settings.ivf_min_gallery_size,
+                train_sample=settings.ivf_train_sample,
+                train_iterations=settings.ivf_train_iterations,
+            )
+            self.load_known_faces()
+
+    def warm_up(self, detector: Optional[str] = None):
+        """Run one detection and one encoding on a blank image
+
+        dlib and OpenCV set up lazily on their first inference; doing that
+        here keeps the cost off the first real request.
+        """
+        image = np.zeros((160, 160, 3), dtype=np.uint8)
+        self.detect_faces(image, detector)
+        self.extract_face_encodings(image, [(16, 144, 144, 16)])
 
     def base64_to_image(self, base64_string: str) -> np.ndarray:
         """Convert base64 string to OpenCV image"""
@@ -60,8 +124,67 @@ class FaceRecognitionService:
             logger.error(f"Error converting base64 to image: {str(e)}")
             raise ValueError(f"Invalid image data: {str(e)}")
 
-    def detect_faces(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
-        """Detect faces using dlib CNN or HOG model"""
+    def bytes_to_image(self, image_bytes: Union[bytes, memoryview]) -> np.ndarray:
+        """Decode an encoded image (JPEG, PNG, ...) straight from a byte buffer
+
+        The buffer is wrapped without copying and decoded by OpenCV, then
+        converted to RGB in place.
+        """
+        try:
+            buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+            np_image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+            if np_image is None:
+                raise ValueError("unsupported or corrupt image")
+
+            # OpenCV decodes to BGR, face_recognition expects RGB
+            cv2.cvtColor(np_image, cv2.COLOR_BGR2RGB, dst=np_image)
+
+            logger.info(f"Image loaded: shape={np_image.shape}, dtype={np_image.dtype}")
+
+            return np_image
+        except Exception as e:
+            logger.error(f"Error decoding image bytes: {str(e)}")
+            raise ValueError(f"Invalid image data: {str(e)}")
+
+    def load_image(self, image_data: Union[str, bytes]) -> np.ndarray:
+        """Decode a base64 string (JSON API) or raw image bytes (binary API)"""
+        if isinstance(image_data, str):
+            return self.base64_to_image(image_data)
+        return self.bytes_to_image(image_data)
+
+    def get_detector(self, backend: Optional[str] = None) -> FaceDetector:
+        """Face detector backend by name, defaulting to the configured one"""
+        backend = backend or settings.face_detection_model
+        detector = self._detectors.get(backend)
+        if detector is None:
+            with self._detectors_lock:
+                detector = self._detectors.get(backend)
+                if detector is None:
+                    options = {}
+                    if backend == "haar":
+                        options = dict(cascade_path=settings.haar_cascade_path)
+                    elif backend == "dnn":
+                        options = dict(
+                            prototxt_path=settings.dnn_detector_prototxt,
+                            weights_path=settings.dnn_detector_weights,
+                            confidence=settings.dnn_detector_confidence,
+                        )
+                    detector = create_detector(backend, **options)
+                    self._detectors[backend] = detector
+                    logger.info(f"Initialized '{backend}' face detector")
+        return detector
+
+    def detect_faces(
+        self, image: np.ndarray, detector: Optional[str] = None
+    ) -> List[Tuple[int, int, int, int]]:
+        """Detect faces with the configured (or requested) detector backend"""
+        face_locations, _, _ = self.detect_faces_timed(image, detector)
+        return face_locations
+
+    def detect_faces_timed(
+        self, image: np.ndarray, detector: Optional[str] = None
+    ) -> Tuple[List[Tuple[int, int, int, int]], str, float]:
+        """Detect faces and report the backend used and its detection time"""
         # face_recognition library expects RGB images
         # If image is BGR (from OpenCV), convert to RGB
         if len(image.shape) == 3 and image.shape[2] == 3:
@@ -72,69 +195,142 @@ class FaceRecognitionService:
             logger.warning(f"Unexpected image format: shape={image.shape}")
             rgb_image = image
 
-        logger.info(f"Detecting faces in image: shape={rgb_image.shape}")
+        face_detector = self.get_detector(detector)
+
+        # Detect on a downscaled copy; boxes are mapped back so encodings
+        # are still computed from the full-resolution image
+        scale, upsample = self.detection_params(rgb_image.shape, face_detector)
+        height, width = rgb_image.shape[:2]
+        detection_image = rgb_image
+        if scale < 1.0:
+            detection_image = resize_image(
+                rgb_image,
+                max_width=max(1, int(round(width * scale))),
+                max_height=max(1, int(round(height * scale))),
+            )
+
+        logger.info(
+            f"Detecting faces in image with '{face_detector.name}': "
+            f"shape={rgb_image.shape}, detection shape={detection_image.shape}, "
+            f"upsample={upsample}"
+        )
+
+        start_time = time.perf_counter()
+        face_locations = face_detector.detect(detection_image, upsample)
+        detection_time = time.perf_counter() - start_time
+        if detection_image is not rgb_image:
+            face_locations = scale_face_locations(
+                face_locations, rgb_image.shape, detection_image.shape
+            )
 
-        # Use face_recognition library with HOG model (faster, good accuracy)
-        # For even better accuracy, use model="cnn" (requires GPU support)
-        face_locations = face_recognition.face_locations(rgb_image, model="hog")
+        logger.info(
+            f"Detected {len(face_locations)} faces in {detection_time * 1000:.1f}ms"
+        )
 
-        logger.info(f"Detected {len(face_locations)} faces")
+        return face_locations, face_detector.name, detection_time
 
-        return face_locations
+    def detection_params(
+        self, image_shape: Tuple[int, ...], detector: Optional[FaceDetector] = None
+    ) -> Tuple[float, int]:
+        """Detection scale and number of upsampling passes for an image
+
+        In automatic mode (``face_detection_scale=0``) the image is shrunk
+        until the configured minimum face size matches the detector's window,
+        or upsampled when smaller faces are wanted and the detector can.
+        """
+        detector = detector or self.get_detector()
+        if settings.face_detection_scale > 0:
+            return (
+                min(settings.face_detection_scale, 1.0),
+                settings.face_detection_upsample,
+            )
+        if detector.min_face_size is None:
+            return 1.0, 0
+
+        # A face can never be larger than the image itself
+        height, width = image_shape[:2]
+        min_face_size = max(
+            1, min(settings.face_detection_min_face_size, height, width)
+        )
+        ratio = detector.min_face_size / min_face_size
+        if not detector.upsamples:
+            return min(ratio, 1.0), 0
+        upsample = max(0, math.ceil(math.log2(ratio)))
+        return ratio / 2**upsample, upsample
 
     def extract_face_encoding(
         self, image: np.ndarray, face_location: Tuple[int, int, int, int]
     ) -> np.ndarray:
         """Extract 128-dimensional face encoding using dlib's ResNet model"""
-        # face_recognition expects RGB images
-        rgb_image = image
-
-        # Get face encoding (128-dimensional vector)
-        encodings = face_recognition.face_encodings(rgb_image, [face_location])
+        encodings = self.extract_face_encodings(image, [face_location])
 
         if len(encodings) > 0:
             return encodings[0]
         else:
             raise ValueError("Could not extract face encoding")
 
-    def save_face_encoding(self, face_encoding: np.ndarray, name: str) -> str:
-        """Save face encoding to file"""
-        encoding_filename = f"{name}_{int(time.time())}.pkl"
-        encoding_path = os.path.join(self.encodings_path, encoding_filename)
+    def extract_face_encodings(
+        self, image: np.ndarray, face_locations: List[Tuple[int, int, int, int]]
+    ) -> np.ndarray:
+        """Extract encodings for all face locations in a single batch
 
-        with open(encoding_path, "wb") as f:
-            pickle.dump(face_encoding, f)
+        Landmarks are predicted per face, but the ResNet descriptor runs once
+        over all faces, returning an (N, 128) array in ``face_locations`` order.
+        """
+        if len(face_locations) == 0:
+            return np.empty((0, 128))
 
-        return encoding_path
+        # face_recognition expects RGB images
+        rgb_image = np.ascontiguousarray(image)
+
+        # Same 5-point landmarks face_recognition.face_encodings uses by default
+        landmarks = dlib.full_object_detections()
+        for top, right, bottom, left in face_locations:
+            landmarks.append(
+                face_recognition_api.pose_predictor_5_point(
+                    rgb_image, dlib.rectangle(left, top, right, bottom)
+                )
+            )
+
+        descriptors = face_recognition_api.face_encoder.compute_face_descriptor(
+            rgb_image, landmarks, 1
+        )
+        return np.array(descriptors)
+
+    def save_face_encoding(self, face_encoding: np.ndarray, name: str) -> str:
+        """Append a face encoding to the gallery store and return its reference"""
+        encoding_id = secrets.randbits(63)
+        self.store.append(np.array([face_encoding]), [name], [encoding_id])
+        return f"{GALLERY_REFERENCE_PREFIX}{encoding_id}"
 
     def load_known_faces(self):
-        """Load all known face encodings from database directory and group by name"""
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.face_encodings_by_name = {}
-
-        if os.path.exists(self.encodings_path):
-            for filename in os.listdir(self.encodings_path):
-                if filename.endswith(".pkl"):
-                    filepath = os.path.join(self.encodings_path, filename)
-                    try:
-                        with open(filepath, "rb") as f:
-                            encoding = pickle.load(f)
-                            self.known_face_encodings.append(encoding)
-                            # Extract name from filename (remove timestamp and extension)
-                            name = "_".join(filename.split("_")[:-1])
-                            self.known_face_names.append(name)
-
-                            # Group encodings by name for better recognition
-                            if name not in self.face_encodings_by_name:
-                                self.face_encodings_by_name[name] = []
-                            self.face_encodings_by_name[name].append(encoding)
-                    except Exception as e:
-                        logger.error(f"Error loading encoding {filename}: {e}")
-
-        # Log statistics about grouped faces
-        for name, encodings in self.face_encodings_by_name.items():
-            logger.info(f"Loaded {len(encodings)} encoding(s) for '{name}'")
+        """Memory-map all known face encodings from the gallery store"""
+        # One-shot migration from the legacy per-encoding pickle directory
+        if not self.store.exists and os.path.isdir(self.encodings_path):
+            self.store.migrate_pickles(self.encodings_path, encoding_id_for)
+
+        self.gallery = self.store.load()
+        self.index.sync(self.gallery)
+
+        logger.info(
+            f"Loaded {len(self.gallery)} encoding(s) for "
+            f"{self.gallery.person_count} people"
+        )
+        self._maybe_compact()
+
+    def refresh_gallery(self) -> FaceGallery:
+        """Pick up enrollments and deletes published by other workers
+
+        Reading the published generation is a single memory-mapped load, so
+        this is cheap enough to call on every request. On a change the store
+        is re-mapped, reusing the shared pages and the cached norms.
+        """
+        if self.store.published_generation != self.gallery.generation:
+            with self._gallery_lock:
+                if self.store.published_generation != self.gallery.generation:
+                    self.gallery = self.store.load(previous=self.gallery)
+                    self.index.sync(self.gallery)
+        return self.gallery
 
     def compare_faces(
         self,
@@ -172,191 +368,358 @@ class FaceRecognitionService:
         return distances.tolist() if hasattr(distances, "tolist") else list(distances)
 
     def enroll_face(
-        self, image_data: str, name: str
-    ) -> Tuple[bool, str, Optional[str]]:
-        """Enroll a new face"""
-        try:
-            # Convert base64 to image
-            image = self.base64_to_image(image_data)
-
-            # Detect faces
-            face_locations = self.detect_faces(image)
+        self, image_data: Union[str, bytes], name: str, detector: Optional[str] = None
+    ) -> Tuple[bool, str, Optional[str], Optional[str]]:
+        """Enroll a new face
 
-            if len(face_locations) == 0:
-                return False, "No face detected in the image", None
+        Returns success, a message, and the encoding reference and saved image
+        path of the new enrollment.
+        """
+        try:
+            face_encoding, image_path, error = self.prepare_enrollment(
+                image_data, name, detector
+            )
+            if error is not None:
+                return False, error, None, None
 
-            if len(face_locations) > 1:
-                return (
-                    False,
-                    "Multiple faces detected. Please use an image with only one face",
-                    None,
-                )
+            success, message, encoding_path = self.add_enrollment(face_encoding, name)
+            return success, message, encoding_path, image_path
 
-            # Extract face encoding
-            face_encoding = self.extract_face_encoding(image, face_locations[0])
+        except Exception as e:
+            return False, f"Error enrolling face: {str(e)}", None, None
 
-            # Save the image (convert RGB to BGR for OpenCV)
-            image_filename = f"{name}_{int(time.time())}.jpg"
-            image_path = os.path.join(self.uploads_path, image_filename)
-            bgr_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-            cv2.imwrite(image_path, bgr_image)
-            logger.info(f"Saved image to {image_path}")
+    def prepare_enrollment(
+        self, image_data: Union[str, bytes], name: str, detector: Optional[str] = None
+    ) -> Tuple[Optional[np.ndarray], Optional[str], Optional[str]]:
+        """Decode, detect and encode an enrollment image and save the upload
 
+        This is the CPU-bound half of enrollment and does not touch the
+        gallery. Returns the face encoding and saved image path, or an error
+        message when the image does not contain exactly one face.
+        """
+        # Decode the base64 string or raw bytes
+        image = self.load_image(image_data)
+
+        # Detect faces
+        face_locations = self.detect_faces(image, detector)
+
+        if len(face_locations) == 0:
+            return None, None, "No face detected in the image"
+
+        if len(face_locations) > 1:
+            return (
+                None,
+                None,
+                "Multiple faces detected. Please use an image with only one face",
+            )
+
+        # Extract face encoding
+        face_encoding = self.extract_face_encoding(image, face_locations[0])
+
+        # Save the image (convert RGB to BGR for OpenCV); bulk enrollments
+        # can save several images of one person within the same second
+        safe_name = re.sub(r"[^\w.-]", "_", name)
+        image_filename = f"{safe_name}_{int(time.time())}_{secrets.token_hex(4)}.jpg"
+        image_path = os.path.join(self.uploads_path, image_filename)
+        bgr_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        cv2.imwrite(image_path, bgr_image)
+        logger.info(f"Saved image to {image_path}")
+
+        return face_encoding, image_path, None
+
+    def add_enrollment(
+        self, face_encoding: np.ndarray, name: str
+    ) -> Tuple[bool, str, Optional[str]]:
+        """Persist an enrollment encoding and add it to the gallery"""
+        with self._gallery_lock:
             # Save the encoding
             encoding_path = self.save_face_encoding(face_encoding, name)
+            encoding_id = encoding_id_for(encoding_path)
+
+            # Re-map the store (swap in a new gallery so readers never see a
+            # partial update); this also picks up other workers' writes
+            previous = self.gallery
+            self.gallery = self.store.load(previous=previous)
+            if (
+                self.gallery.generation == previous.generation + 1
+                and self.index.is_trained
+            ):
+                self.index.add(np.array([encoding_id]), np.array([face_encoding]))
+            else:
+                # Also trains the index once the gallery has grown large enough
+                self.index.sync(self.gallery)
 
-            # Add to known faces
-            self.known_face_encodings.append(face_encoding)
-            self.known_face_names.append(name)
+            # Check if this is an additional encoding for an existing person
+            encoding_count = self.gallery.encoding_count(name)
+        if encoding_count > 1:
+            message = (
+                f"Face enrolled successfully for {name}. "
+                f"Now have {encoding_count} encodings for improved recognition accuracy."
+            )
+            logger.info(f"Added encoding #{encoding_count} for '{name}'")
+        else:
+            message = f"Face enrolled successfully for {name}"
 
-            # Update grouped encodings
-            if name not in self.face_encodings_by_name:
-                self.face_encodings_by_name[name] = []
-            self.face_encodings_by_name[name].append(face_encoding)
+        return True, message, encoding_path
 
-            # Check if this is an additional encoding for an existing person
-            encoding_count = len(self.face_encodings_by_name[name])
-            if encoding_count > 1:
-                message = (
-                    f"Face enrolled successfully for {name}. "
-                    f"Now have {encoding_count} encodings for improved recognition accuracy."
+    def add_enrollments(
+        self, face_encodings: np.ndarray, names: List[str]
+    ) -> List[str]:
+        """Persist many enrollment encodings in one store write
+
+        Returns the encoding reference of every row, in order.
+        """
+        face_encodings = np.asarray(face_encodings).reshape(-1, 128)
+        encoding_ids = [secrets.randbits(63) for _ in names]
+        with self._gallery_lock:
+            self.store.append(face_encodings, names, encoding_ids)
+            self.gallery = self.store.load(previous=self.gallery)
+            # Reconciles (or first trains) the index with every new row
+            self.index.sync(self.gallery)
+        logger.info(f"Enrolled {len(names)} encoding(s) in one batch")
+        return [
+            f"{GALLERY_REFERENCE_PREFIX}{encoding_id}" for encoding_id in encoding_ids
+        ]
+
+    def get_encodings(self, encoding_paths: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Gallery encodings of the given references and which were found"""
+        gallery = self.refresh_gallery()
+        rows = gallery.find_rows(
+            np.array([encoding_id_for(path) for path in encoding_paths], dtype=np.int64)
+        )
+        found = rows >= 0
+        encodings = np.zeros((len(rows), 128), dtype=np.float32)
+        encodings[found] = gallery.encodings[rows[found]]
+        return encodings, found
+
+    def restore_gallery(
+        self, face_encodings: np.ndarray, names: List[str], encoding_paths: List[str]
+    ):
+        """Rebuild an empty gallery store from encodings kept in the database"""
+        encoding_ids = [encoding_id_for(path) for path in encoding_paths]
+        with self._gallery_lock:
+            if self.store.append_if_empty(face_encodings, names, encoding_ids) is None:
+                return
+            self.gallery = self.store.load(previous=self.gallery)
+            self.index.sync(self.gallery)
+        logger.info(f"Restored {len(names)} encoding(s) from the database")
+
+    def remove_enrollments(self, encoding_paths: List[str]):
+        """Tombstone many encodings in one store write"""
+        encoding_ids = [encoding_id_for(path) for path in encoding_paths]
+        with self._gallery_lock:
+            self.store.delete(encoding_ids)
+            self.gallery = self.store.load(previous=self.gallery)
+            self.index.sync(self.gallery)
+        self._maybe_compact()
+
+    def undo_enrollments(self, encoding_paths: List[str], image_paths: List[str]):
+        """Take back enrollments whose database rows could not be committed
+
+        Keeps the gallery consistent with the database and drops the saved
+        images.
+        """
+        self.remove_enrollments(encoding_paths)
+        for image_path in image_paths:
+            if os.path.exists(image_path):
+                os.remove(image_path)
+
+    def match_faces(self, face_encodings: np.ndarray) -> List[Tuple[str, float]]:
+        """Match a batch of encodings against the gallery in one pass
+
+        Returns the recognized name (or "Unknown") and the confidence in percent
+        for every row of ``face_encodings``.
+        """
+        start_time = time.perf_counter()
+        gallery = self.refresh_gallery()  # Pin the current gallery for the batch
+        candidates = self.index.candidates(face_encodings)
+        matches = gallery.match(
+            face_encodings,
+            settings.face_recognition_tolerance,
+            candidates,
+            self._prefilter_people(gallery),
+            settings.gallery_rerank_candidates,
+        )
+        results = [self._resolve_match(match) for match in matches]
+        metrics.add_stage_time("match", time.perf_counter() - start_time)
+        return results
+
+    def _prefilter_people(self, gallery: FaceGallery) -> Optional[int]:
+        """Candidate people scanned per probe, or None for a full scan
+
+        Scoring the person centroids first only pays off once people have
+        several encodings each.
+        """
+        top_k = settings.person_prefilter_top_k
+        if top_k <= 0 or len(gallery) < (
+            settings.person_prefilter_min_encodings * gallery.person_count
+        ):
+            return None
+        return top_k
+
+    def match_probe(self, probe: CachedProbe) -> List[Tuple[str, float]]:
+        """Match a cached probe, reusing its matches while the gallery is unchanged"""
+        generation = self.refresh_gallery().generation
+        matches = probe.matches
+        if matches is None or probe.generation != generation:
+            matches = self.match_faces(probe.face_encodings)
+            probe.generation, probe.matches = generation, matches
+        return matches
+
+    def _resolve_match(self, match: Optional[PersonMatch]) -> Tuple[str, float]:
+        """Apply the grouped-encoding acceptance rules to the closest person"""
+        tolerance = settings.face_recognition_tolerance
+        if match is None:
+            return "Unknown", 0.0
+
+        # Calculate confidence based on the best encoding of the closest person
+        confidence = max(0, (1 - match.best_distance) * 100)
+
+        logger.info(
+            f"Person '{match.name}': {match.encoding_count} encodings, "
+            f"match_rate={match.match_rate:.2f}, avg_dist={match.avg_distance:.3f}, "
+            f"best_dist={match.best_distance:.3f}, confidence={confidence:.1f}%"
+        )
+
+        # Enhanced matching criteria:
+        # - At least one encoding must match
+        # - Confidence must be above threshold
+        # - OR if multiple encodings available, require good match rate
+        if confidence < settings.face_recognition_confidence_threshold:
+            logger.info(
+                f"Low confidence match rejected: {match.name} "
+                f"({confidence:.1f}% < {settings.face_recognition_confidence_threshold}%)"
+            )
+            return "Unknown", 0.0
+
+        if match.encoding_count == 1:
+            # Single encoding: use standard matching
+            if match.best_distance <= tolerance:
+                logger.info(
+                    f"Match found (single encoding): {match.name} with {confidence:.1f}% confidence"
                 )
-                logger.info(f"Added encoding #{encoding_count} for '{name}'")
-            else:
-                message = f"Face enrolled successfully for {name}"
+                return match.name, confidence
+            return "Unknown", confidence
+
+        # Multiple encodings: use enhanced matching
+        # Require at least 50% of encodings to match OR best distance is very good
+        if match.match_rate >= 0.5 or match.best_distance < 0.4:
+            logger.info(
+                f"Match found (grouped encodings): {match.name} with {confidence:.1f}% confidence "
+                f"({match.matched_count}/{match.encoding_count} encodings matched)"
+            )
+            return match.name, confidence
+
+        logger.info(f"Match rejected: low match rate ({match.match_rate:.2f} < 0.5)")
+        return "Unknown", 0.0
+
+    def analyze_image(
+        self, image_data: Union[str, bytes], detector: Optional[str] = None
+    ) -> Tuple[
+        List[Tuple[int, int, int, int]], np.ndarray, Tuple[str, Dict[str, float]]
+    ]:
+        """Decode an image, detect faces and encode them in one batch
+
+        This is the CPU-bound half of recognition and does not touch the
+        gallery. Returns the face locations, their (N, 128) encodings and the
+        detector backend used with the decode, detect and encode times in
+        seconds.
+        """
+        # Decode the base64 string or raw bytes
+        start_time = time.perf_counter()
+        image = self.load_image(image_data)
+        decode_time = time.perf_counter() - start_time
+
+        # Detect faces
+        face_locations, backend, detection_time = self.detect_faces_timed(
+            image, detector
+        )
+
+        # Encode all detected faces in one batch
+        start_time = time.perf_counter()
+        face_encodings = self.extract_face_encodings(image, face_locations)
+        stage_times = {
+            "decode": decode_time,
+            "detect": detection_time,
+            "encode": time.perf_counter() - start_time,
+        }
+        return face_locations, face_encodings, (backend, stage_times)
 
-            return True, message, encoding_path
+    def locate_faces(
+        self, image_data: Union[str, bytes], detector: Optional[str] = None
+    ) -> Tuple[List[Tuple[int, int, int, int]], Tuple[str, Dict[str, float]]]:
+        """Decode an image and detect faces without encoding them
 
-        except Exception as e:
-            return False, f"Error enrolling face: {str(e)}", None
+        Returns the face locations and the detector backend used with the
+        decode and detect times in seconds.
+        """
+        start_time = time.perf_counter()
+        image = self.load_image(image_data)
+        decode_time = time.perf_counter() - start_time
+        face_locations, backend, detection_time = self.detect_faces_timed(
+            image, detector
+        )
+        return face_locations, (
+            backend,
+            {"decode": decode_time, "detect": detection_time},
+        )
+
+    def encode_faces(
+        self,
+        image_data: Union[str, bytes],
+        face_locations: List[Tuple[int, int, int, int]],
+    ) -> Tuple[np.ndarray, Dict[str, float]]:
+        """Decode an image and encode the faces at already known locations
 
-    def recognize_faces(self, image_data: str) -> Tuple[List[RecognitionResult], float]:
+        Also returns the decode and encode times in seconds.
+        """
+        start_time = time.perf_counter()
+        image = self.load_image(image_data)
+        decode_time = time.perf_counter() - start_time
+        face_encodings = self.extract_face_encodings(image, face_locations)
+        encode_time = time.perf_counter() - start_time - decode_time
+        return face_encodings, {"decode": decode_time, "encode": encode_time}
+
+    def build_results(
+        self,
+        face_locations: List[Tuple[int, int, int, int]],
+        matches: List[Tuple[str, float]],
+    ) -> List[RecognitionResult]:
+        """Combine face locations with their matched names"""
+        results = []
+        for face_location, (name, confidence) in zip(face_locations, matches):
+            # Convert face location format (top, right, bottom, left)
+            top, right, bottom, left = face_location
+
+            results.append(
+                RecognitionResult(
+                    name=name,
+                    confidence=round(confidence, 2),
+                    face_location=[top, right, bottom, left],
+                )
+            )
+        return results
+
+    def recognize_faces(
+        self, image_data: Union[str, bytes], detector: Optional[str] = None
+    ) -> Tuple[List[RecognitionResult], float]:
         """Recognize faces in an image using grouped encodings for better accuracy"""
         start_time = time.time()
-        results = []
 
         try:
-            # Convert base64 to image
-            image = self.base64_to_image(image_data)
-
-            # Detect faces
-            face_locations = self.detect_faces(image)
-
-            # Process each detected face
-            for face_location in face_locations:
-                # Extract face encoding
-                face_encoding = self.extract_face_encoding(image, face_location)
-
-                name = "Unknown"
-                confidence = 0.0
-
-                if len(self.known_face_encodings) > 0:
-                    # Strategy 1: Compare with all individual encodings
-                    face_distances = self.face_distance(
-                        self.known_face_encodings, face_encoding
-                    )
-
-                    if len(face_distances) > 0:
-                        best_match_index = np.argmin(face_distances)
-                        distance = face_distances[best_match_index]
-                        matches = self.compare_faces(
-                            self.known_face_encodings, face_encoding
-                        )
-
-                        # Strategy 2: Use grouped encodings for verification
-                        # Check if we have multiple encodings for the matched person
-                        matched_name = self.known_face_names[best_match_index]
-
-                        if matched_name in self.face_encodings_by_name:
-                            person_encodings = self.face_encodings_by_name[matched_name]
-
-                            # Compare with all encodings of this person
-                            person_distances = self.face_distance(
-                                person_encodings, face_encoding
-                            )
-                            person_matches = self.compare_faces(
-                                person_encodings, face_encoding
-                            )
-
-                            # Calculate average distance and match rate
-                            avg_distance = np.mean(person_distances)
-                            match_rate = sum(person_matches) / len(person_matches)
-
-                            # Use the best (minimum) distance from all encodings
-                            best_person_distance = np.min(person_distances)
-
-                            # Calculate confidence based on best match
-                            confidence = max(0, (1 - best_person_distance) * 100)
-
-                            logger.info(
-                                f"Person '{matched_name}': {len(person_encodings)} encodings, "
-                                f"match_rate={match_rate:.2f}, avg_dist={avg_distance:.3f}, "
-                                f"best_dist={best_person_distance:.3f}, confidence={confidence:.1f}%"
-                            )
-
-                            # Enhanced matching criteria:
-                            # - At least one encoding must match
-                            # - Confidence must be above threshold
-                            # - OR if multiple encodings available, require good match rate
-                            if (
-                                confidence
-                                >= settings.face_recognition_confidence_threshold
-                            ):
-                                if len(person_encodings) == 1:
-                                    # Single encoding: use standard matching
-                                    if matches[best_match_index]:
-                                        name = matched_name
-                                        logger.info(
-                                            f"Match found (single encoding): {name} with {confidence:.1f}% confidence"
-                                        )
-                                else:
-                                    # Multiple encodings: use enhanced matching
-                                    # Require at least 50% of encodings to match OR best distance is very good
-                                    if match_rate >= 0.5 or best_person_distance < 0.4:
-                                        name = matched_name
-                                        logger.info(
-                                            f"Match found (grouped encodings): {name} with {confidence:.1f}% confidence "
-                                            f"({sum(person_matches)}/{len(person_matches)} encodings matched)"
-                                        )
-                                    else:
-                                        logger.info(
-                                            f"Match rejected: low match rate ({match_rate:.2f} < 0.5)"
-                                        )
-                                        name = "Unknown"
-                                        confidence = 0.0
-                            else:
-                                name = "Unknown"
-                                confidence = 0.0
-                                logger.info(
-                                    f"Low confidence match rejected: {matched_name} "
-                                    f"({confidence:.1f}% < {settings.face_recognition_confidence_threshold}%)"
-                                )
-                        else:
-                            # Fallback to original logic if grouping data not available
-                            confidence = max(0, (1 - distance) * 100)
-                            if (
-                                matches[best_match_index]
-                                and confidence
-                                >= settings.face_recognition_confidence_threshold
-                            ):
-                                name = matched_name
-                                logger.info(
-                                    f"Match found: {name} with {confidence:.1f}% confidence"
-                                )
-                            else:
-                                name = "Unknown"
-                                confidence = 0.0
-
-                # Convert face location format (top, right, bottom, left)
-                top, right, bottom, left = face_location
-
-                results.append(
-                    RecognitionResult(
-                        name=name,
-                        confidence=round(confidence, 2),
-                        face_location=[top, right, bottom, left],
-                    )
+            # Resubmitted images skip decode, detection and encoding
+            key = self.probe_cache.key(image_data, detector)
+            probe = self.probe_cache.get(key)
+            if probe is None:
+                face_locations, face_encodings, (backend, stage_times) = (
+                    self.analyze_image(image_data, detector)
                 )
+                metrics.add_analysis(backend, stage_times, len(face_locations))
+                probe = self.probe_cache.put(key, face_locations, face_encodings)
+
+            # Match all faces against the gallery together
+            matches = self.match_probe(probe)
+            results = self.build_results(probe.face_locations, matches)
 
             processing_time = time.time() - start_time
             return results, processing_time
@@ -367,35 +730,83 @@ class FaceRecognitionService:
             return [], processing_time
 
     def delete_face_encoding(self, encoding_path: str):
-        """Delete a face encoding file and update grouped encodings"""
+        """Delete a face encoding and update grouped encodings
+
+        The encoding is tombstoned in place rather than reloading the gallery;
+        dead rows are compacted away in the background once they pile up.
+        """
         try:
+            encoding_id = encoding_id_for(encoding_path)
+
+            # Pickles of unmigrated legacy paths are removed as well
+            removed_file = False
             if os.path.exists(encoding_path):
                 os.remove(encoding_path)
-                # Reload known faces to update all data structures
-                self.load_known_faces()
+                removed_file = True
+
+            self.refresh_gallery()
+            with self._gallery_lock:
+                found = len(self.gallery.rows_for(np.array([encoding_id]))) > 0
+                if found:
+                    generation = self.store.delete([encoding_id])
+                    self.index.remove(np.array([encoding_id]))
+                    if generation == self.gallery.generation + 1:
+                        # Nobody else wrote in between: tombstone in place
+                        gallery = self.gallery.without(np.array([encoding_id]))
+                        gallery.generation = generation
+                        self.gallery = gallery
+                    else:
+                        self.gallery = self.store.load(previous=self.gallery)
+                        self.index.sync(self.gallery)
+
+            if found or removed_file:
                 logger.info(f"Deleted encoding: {encoding_path}")
+                self._maybe_compact()
                 return True
         except Exception as e:
             logger.error(f"Error deleting encoding: {e}")
         return False
 
+    def _maybe_compact(self):
+        """Start a background compaction once enough rows are tombstoned"""
+        gallery = self.gallery
+        if gallery.tombstone_count <= settings.gallery_compaction_ratio * len(
+            gallery.ids
+        ):
+            return
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+        self._compaction = threading.Thread(
+            target=self._compact_gallery, name="gallery-compaction", daemon=True
+        )
+        self._compaction.start()
+
+    def _compact_gallery(self):
+        """Rewrite the store without tombstones and swap in the compact gallery"""
+        try:
+            with self._gallery_lock:
+                self.store.compact()
+                self.gallery = self.store.load()
+            logger.info(f"Compacted gallery to {len(self.gallery)} encodings")
+        except Exception as e:
+            logger.error(f"Error compacting gallery: {e}")
+
     def get_face_statistics(self):
         """Get statistics about enrolled faces including grouped information"""
+        gallery = self.refresh_gallery()
+        cached = self._statistics
+        if cached is not None and cached[0] is gallery:
+            return cached[1]
+
+        grouped_faces = gallery.encoding_counts()
         stats = {
-            "total_encodings": len(self.known_face_encodings),
-            "unique_people": len(self.face_encodings_by_name),
-            "people_with_multiple_encodings": 0,
-            "grouped_faces": {},
+            "total_encodings": len(gallery),
+            "unique_people": gallery.person_count,
+            "people_with_multiple_encodings": sum(
+                1 for count in grouped_faces.values() if count > 1
+            ),
+            "grouped_faces": grouped_faces,
+            "memory": gallery.memory_usage(),
         }
-
-        for name, encodings in self.face_encodings_by_name.items():
-            encoding_count = len(encodings)
-            stats["grouped_faces"][name] = encoding_count
-            if encoding_count > 1:
-                stats["people_with_multiple_encodings"] += 1
-
+        self._statistics = (gallery, stats)
         return stats
-
-
-# Global instance
-face_recognition_service = FaceRecognitionService()
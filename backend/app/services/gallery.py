@@ -0,0 +1,700 @@
+"""
+Contiguous in-memory gallery of known face encodings
+"""
+
+import copy
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+ENCODING_DIM = 128
+
+# Rows gathered at a time when recomputing person centroids
+_STATS_CHUNK_ROWS = 65536
+# People with more rows than this have their centroid summed separately
+_RANKED_SUM_ROWS = 64
+
+# Compact representations for the first scoring pass of a full scan
+QUANTIZATIONS = ("none", "float16", "int8")
+# Quantized rows widened to float32 at a time while scanning
+_SCAN_CHUNK_ROWS = 8192
+
+# Margin for float32 error in the person lower bounds, so the prefilter only
+# stops widening when no unscanned person can be closer
+_BOUND_SLACK = 1e-3
+
+# Share of people the prefilter may widen to before a probe falls back to a
+# full scan, which is batched and cheaper per row
+_PREFILTER_MAX_FRACTION = 0.125
+
+
+class PersonMatch(NamedTuple):
+    """Distance statistics of a probe against the closest enrolled person"""
+
+    name: str
+    encoding_count: int
+    best_distance: float
+    avg_distance: float
+    matched_count: int
+
+    @property
+    def match_rate(self) -> float:
+        return self.matched_count / self.encoding_count
+
+
+class FaceGallery:
+    """Contiguous float32 matrix of known face encodings grouped by person
+
+    Encodings are stored as one (N, 128) matrix in insertion order (which
+    lets it be a read-only memory map shared between processes), with
+    ``person_ids`` giving the person index of every row. Rows are grouped
+    per person through the ``order`` permutation: ``order[offsets[p]:
+    offsets[p + 1]]`` are the rows of person ``p``. A probe is matched with a
+    single distance pass over the matrix; per-person statistics are
+    reductions over the closest person's rows.
+
+    Every person also has a ``centroid`` (mean of their live encodings) and
+    a ``radius`` (distance from the centroid to their farthest encoding).
+    They are only recomputed for the people an append or delete touches, and
+    let a probe be narrowed down to a few candidate people before their
+    encodings are scanned.
+
+    With ``quantization`` set to ``float16`` or ``int8`` (scaled per
+    dimension), a full scan scores a compact in-memory copy of the matrix
+    first and re-ranks the people owning the closest rows against the
+    float32 encodings, so reported distances are unchanged while the
+    full-precision matrix stays on disk except for the re-ranked rows.
+
+    Person indexes follow the order of ``names``, which does not need to be
+    sorted. Galleries are treated as immutable: mutations return a new
+    instance so readers holding a reference never observe a half-built
+    gallery. Deletes only flip rows off in a copied ``alive`` mask (shared
+    matrix, no re-load); the dead rows are dropped when the backing store is
+    compacted.
+    """
+
+    # Store segment and published generation this gallery was loaded from
+    segment: int = -1
+    generation: int = -1
+
+    def __init__(
+        self,
+        encodings: Optional[Sequence[np.ndarray]] = None,
+        names: Optional[Sequence[str]] = None,
+        ids: Optional[Sequence[int]] = None,
+        quantization: str = "none",
+    ):
+        encodings = [] if encodings is None else encodings
+        names = [] if names is None else list(names)
+        ids = np.arange(len(names)) if ids is None else ids
+        if not len(encodings) == len(names) == len(ids):
+            raise ValueError("encodings, names and ids must have the same length")
+
+        people, person_ids = np.unique(
+            np.asarray(names, dtype=object), return_inverse=True
+        )
+        self._init_arrays(
+            np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM),
+            person_ids,
+            [str(name) for name in people],
+            np.asarray(ids, dtype=np.int64),
+            quantization=quantization,
+        )
+
+    @classmethod
+    def from_arrays(
+        cls,
+        encodings: np.ndarray,
+        person_ids: np.ndarray,
+        names: List[str],
+        ids: np.ndarray,
+        previous: Optional["FaceGallery"] = None,
+        quantization: str = "none",
+    ) -> "FaceGallery":
+        """Build a gallery from per-row person indexes into ``names``
+
+        The encoding matrix is used as-is without copying, which keeps
+        memory-mapped encodings shared through the OS page cache. When the
+        rows start with the rows of ``previous`` (an append-only successor),
+        its squared norms, tombstones and person centroids are carried over
+        and only the appended rows are processed (and quantized).
+        """
+        gallery = cls.__new__(cls)
+        gallery._init_arrays(
+            encodings, person_ids, list(names), ids, previous, quantization
+        )
+        return gallery
+
+    def _init_arrays(
+        self,
+        encodings: np.ndarray,
+        person_ids: np.ndarray,
+        names: List[str],
+        ids: np.ndarray,
+        previous: Optional["FaceGallery"] = None,
+        quantization: str = "none",
+    ):
+        self.names: List[str] = names
+        self.encodings = encodings
+        self.person_ids = np.asarray(person_ids, dtype=np.int32)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        if previous is not None and len(previous.ids) > len(self.ids):
+            previous = None
+        known = 0 if previous is None else len(previous.ids)
+
+        self.sq_norms = np.empty(len(encodings), dtype=np.float32)
+        self.sq_norms[:known] = previous.sq_norms if known else 0.0
+        self.sq_norms[known:] = np.einsum(
+            "ij,ij->i", encodings[known:], encodings[known:]
+        )
+        self._init_quantized(quantization, previous)
+
+        # Group rows by person without moving the encodings
+        self._init_order(previous)
+        self._person_index: Dict[str, int] = {
+            name: i for i, name in enumerate(self.names)
+        }
+
+        # Tombstones: None while every row is alive
+        self.alive: Optional[np.ndarray] = None
+        self.live_counts = np.diff(self.offsets)
+        self.tombstone_count = 0
+
+        self.centroids = np.zeros((len(self.names), ENCODING_DIM), dtype=np.float32)
+        self.radii = np.zeros(len(self.names), dtype=np.float32)
+        if previous is None:
+            self._update_person_stats(np.arange(len(self.names)))
+            return
+
+        # Rows of the previous gallery keep their tombstones and statistics
+        if previous.alive is not None:
+            self.alive = np.ones(len(self.ids), dtype=bool)
+            self.alive[:known] = previous.alive
+            self.live_counts = self.live_counts.copy()
+            self.live_counts[: len(previous.names)] -= (
+                np.diff(previous.offsets) - previous.live_counts
+            )
+            self.tombstone_count = previous.tombstone_count
+        self.centroids[: len(previous.names)] = previous.centroids
+        self.radii[: len(previous.names)] = previous.radii
+        self._update_person_stats(np.unique(self.person_ids[known:]))
+
+    def _init_order(self, previous: Optional["FaceGallery"]):
+        """Build ``order``, ``offsets`` and the id order, extending ``previous``
+
+        The rows appended since ``previous`` are sorted on their own and
+        inserted after each person's earlier rows, so a reload after an
+        enrollment does not re-sort the whole gallery.
+        """
+        known = 0 if previous is None else len(previous.ids)
+        counts = np.bincount(self.person_ids[known:], minlength=len(self.names))
+        self.offsets = np.zeros(len(self.names) + 1, dtype=np.int64)
+        self._id_order: Optional[np.ndarray] = None
+        if previous is None:
+            self.order = np.argsort(self.person_ids, kind="stable")
+            np.cumsum(counts, out=self.offsets[1:])
+            return
+
+        counts[: len(previous.names)] += np.diff(previous.offsets)
+        np.cumsum(counts, out=self.offsets[1:])
+        new_rows = known + np.argsort(self.person_ids[known:], kind="stable")
+        # New people's rows go last, in person order
+        after = np.minimum(self.person_ids[new_rows] + 1, len(previous.names))
+        self.order = np.insert(previous.order, previous.offsets[after], new_rows)
+
+        if previous._id_order is not None:
+            new_ids = known + np.argsort(self.ids[known:], kind="stable")
+            positions = np.searchsorted(
+                previous.ids[previous._id_order], self.ids[new_ids], side="right"
+            )
+            self._id_order = np.insert(previous._id_order, positions, new_ids)
+
+    def __len__(self) -> int:
+        return len(self.ids) - self.tombstone_count
+
+    @property
+    def person_count(self) -> int:
+        return int(np.count_nonzero(self.live_counts))
+
+    def person_rows(self, person: int) -> np.ndarray:
+        """Row positions of every encoding of a person, dead rows included"""
+        return self.order[self.offsets[person] : self.offsets[person + 1]]
+
+    def encoding_count(self, name: str) -> int:
+        """Number of encodings enrolled for a person"""
+        person = self._person_index.get(name)
+        if person is None:
+            return 0
+        return int(self.live_counts[person])
+
+    def encoding_counts(self) -> Dict[str, int]:
+        """Number of encodings enrolled for every person"""
+        return {
+            name: int(count)
+            for name, count in zip(self.names, self.live_counts)
+            if count > 0
+        }
+
+    def live_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Encodings and ids of the rows that are not tombstoned"""
+        if self.alive is None:
+            return self.encodings, self.ids
+        return self.encodings[self.alive], self.ids[self.alive]
+
+    def _init_quantized(self, quantization: str, previous: Optional["FaceGallery"]):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown gallery quantization: {quantization}")
+        self.quantization = quantization
+        self.quantized: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None  # Per-dimension int8 step
+        if quantization == "none":
+            return
+
+        known = 0
+        if previous is not None and previous.quantization == quantization:
+            known = len(previous.ids)
+            self.scale = previous.scale
+        if quantization == "int8":
+            # The scale is kept across appends; rows outside its range
+            # rescale the whole matrix
+            peak = self._peak(self.encodings[known:])
+            if known and np.any(peak > self.scale * 127):
+                peak = np.maximum(peak, self._peak(self.encodings[:known]))
+                known = 0
+            if not known:
+                self.scale = np.maximum(peak, 1e-6) / 127
+        tail = self._quantize(self.encodings[known:])
+        self.quantized = np.concatenate((previous.quantized, tail)) if known else tail
+
+    @staticmethod
+    def _peak(encodings: np.ndarray) -> np.ndarray:
+        """Largest absolute value per dimension, read in chunks"""
+        peak = np.zeros(ENCODING_DIM, dtype=np.float32)
+        for start in range(0, len(encodings), _STATS_CHUNK_ROWS):
+            chunk = encodings[start : start + _STATS_CHUNK_ROWS]
+            np.maximum(peak, np.abs(chunk).max(axis=0), out=peak)
+        return peak
+
+    def _quantize(self, encodings: np.ndarray) -> np.ndarray:
+        dtype = np.int8 if self.quantization == "int8" else np.float16
+        quantized = np.empty((len(encodings), ENCODING_DIM), dtype=dtype)
+        for start in range(0, len(encodings), _STATS_CHUNK_ROWS):
+            chunk = encodings[start : start + _STATS_CHUNK_ROWS]
+            if self.quantization == "int8":
+                chunk = np.clip(np.rint(chunk / self.scale), -127, 127)
+            quantized[start : start + len(chunk)] = chunk
+        return quantized
+
+    def memory_usage(self) -> Dict[str, object]:
+        """Bytes held for matching, by representation"""
+        metadata = sum(
+            array.nbytes
+            for array in (
+                self.sq_norms,
+                self.person_ids,
+                self.ids,
+                self.order,
+                self.centroids,
+                self.radii,
+            )
+        )
+        quantized = 0 if self.quantized is None else self.quantized.nbytes
+        scanned = quantized if self.quantized is not None else self.encodings.nbytes
+        return {
+            "quantization": self.quantization,
+            "full_precision_bytes": int(self.encodings.nbytes),
+            "quantized_bytes": int(quantized),
+            "metadata_bytes": int(metadata),
+            "scan_bytes_per_encoding": (
+                self.quantized.itemsize * ENCODING_DIM
+                if self.quantized is not None
+                else self.encodings.itemsize * ENCODING_DIM
+            ),
+            "scan_bytes": int(scanned),
+        }
+
+    def _rows_of(self, people: np.ndarray) -> np.ndarray:
+        """Row positions of the given people, grouped by person in that order"""
+        starts = self.offsets[people]
+        counts = self.offsets[people + 1] - starts
+        local_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        positions = np.arange(counts.sum()) + np.repeat(starts - local_starts, counts)
+        return self.order[positions]
+
+    def _update_person_stats(self, people: np.ndarray):
+        """Recompute the centroid and radius of ``people`` from their live rows"""
+        people = np.asarray(people, dtype=np.int64)
+        people = people[self.offsets[people + 1] > self.offsets[people]]
+        ends = np.cumsum(self.offsets[people + 1] - self.offsets[people])
+        start = 0
+        while start < len(people):
+            # Gather at most about _STATS_CHUNK_ROWS rows at a time
+            done = ends[start - 1] if start else 0
+            end = max(
+                start + 1,
+                int(np.searchsorted(ends, done + _STATS_CHUNK_ROWS, side="right")),
+            )
+            self._update_person_stats_chunk(people[start:end])
+            start = end
+
+    def _update_person_stats_chunk(self, people: np.ndarray):
+        rows = self._rows_of(people)
+        counts = self.offsets[people + 1] - self.offsets[people]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        encodings = self.encodings[rows]
+        live = None if self.alive is None else self.alive[rows]
+        if live is not None:
+            encodings = encodings * live[:, np.newaxis]
+
+        # Add every person's j-th row in one vectorized step per rank j;
+        # people sorted by count make the ones with a j-th row a prefix.
+        # People with many rows are summed as one slice each instead.
+        by_count = np.argsort(-counts, kind="stable")
+        descending = -counts[by_count]
+        many = int(np.searchsorted(descending, -_RANKED_SUM_ROWS, side="left"))
+        sums = np.zeros((len(people), ENCODING_DIM), dtype=np.float64)
+        for i in by_count[:many]:
+            rows_of_person = encodings[starts[i] : starts[i] + counts[i]]
+            sums[i] = rows_of_person.sum(axis=0, dtype=np.float64)
+        for j in range(min(int(counts.max()), _RANKED_SUM_ROWS)):
+            active = by_count[many : np.searchsorted(descending, -j, side="left")]
+            sums[active] += encodings[starts[active] + j]
+
+        live_counts = self.live_counts[people]
+        centroids = (sums / np.maximum(live_counts, 1)[:, np.newaxis]).astype(
+            np.float32
+        )
+
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, reusing the rows' squared norms
+        dots = np.einsum("ij,ij->i", encodings, np.repeat(centroids, counts, axis=0))
+        sq_spread = self.sq_norms[rows] - 2.0 * dots
+        if live is not None:
+            sq_spread = np.where(live, sq_spread, -np.inf)
+        radii = np.maximum.reduceat(sq_spread, starts) + np.einsum(
+            "ij,ij->i", centroids, centroids
+        )
+
+        self.centroids[people] = centroids
+        self.radii[people] = np.where(
+            live_counts > 0, np.sqrt(np.maximum(radii, 0.0)), 0.0
+        )
+
+    def person_bounds(self, face_encodings: np.ndarray) -> np.ndarray:
+        """(M, people) lower bounds on the distance to any of a person's rows
+
+        ``|probe - centroid| - radius``, not clamped at zero: a probe inside
+        several people's spread still ranks them by how deep inside it is.
+        People without live encodings get ``inf``.
+        """
+        probes = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        sq_distances = (
+            centroid_norms[np.newaxis, :]
+            - 2.0 * (probes @ self.centroids.T)
+            + np.einsum("ij,ij->i", probes, probes)[:, np.newaxis]
+        )
+        bounds = np.sqrt(np.maximum(sq_distances, 0.0)) - self.radii
+        bounds[:, self.live_counts == 0] = np.inf
+        return bounds
+
+    def nearest_people(self, face_encodings: np.ndarray, k: int) -> List[np.ndarray]:
+        """The ``k`` people per probe with the lowest ``person_bounds``
+
+        People whose encodings are spread out are not ranked behind tighter
+        neighbours.
+        """
+        bounds = self.person_bounds(face_encodings)
+        k = min(k, len(self.names))
+        if k == len(self.names):
+            return [np.arange(len(self.names))] * len(bounds)
+        return list(np.argpartition(bounds, k - 1, axis=1)[:, :k])
+
+    def _match_prefiltered(
+        self,
+        probe: np.ndarray,
+        bounds: np.ndarray,
+        top_people: int,
+        max_people: int,
+        tolerance: float,
+        rerank: int,
+    ) -> Tuple[bool, Optional[PersonMatch]]:
+        """Scan the people with the lowest bounds, then any that could be closer
+
+        After the ``top_people`` lowest bounds are scanned, every person whose
+        bound is below the best distance found is scanned too, so the result
+        is the one a full scan gives. Returns ``(False, None)`` when that
+        would take more than ``max_people``, where a full scan is cheaper.
+        """
+        k = min(max(top_people, 1), len(bounds))
+        shortlist = np.argpartition(bounds, k - 1)[:k]
+        best = self._match_people(probe, shortlist, tolerance, rerank)
+        if best is None:
+            return True, None
+
+        closer = bounds < best.best_distance + _BOUND_SLACK
+        closer[shortlist] = False
+        remaining = np.flatnonzero(closer)
+        if len(remaining) == 0:
+            return True, best
+        if k + len(remaining) > max_people:
+            return False, None
+        match = self._match_people(probe, remaining, tolerance, rerank)
+        if match is not None and match.best_distance < best.best_distance:
+            best = match
+        return True, best
+
+    def rows_for(self, ids: np.ndarray) -> np.ndarray:
+        """Row positions of the given encoding ids, skipping unknown ids"""
+        rows = self.find_rows(ids)
+        return rows[rows >= 0]
+
+    def find_rows(self, ids: np.ndarray) -> np.ndarray:
+        """Row position of every encoding id, -1 where unknown or deleted"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind="stable")
+        sorted_ids = self.ids[self._id_order]
+        positions = np.minimum(np.searchsorted(sorted_ids, ids), len(self.ids) - 1)
+        rows = np.where(sorted_ids[positions] == ids, self._id_order[positions], -1)
+        if self.alive is not None:
+            rows[rows >= 0] = np.where(self.alive[rows[rows >= 0]], rows[rows >= 0], -1)
+        return rows
+
+    def without(self, ids: np.ndarray) -> "FaceGallery":
+        """Return a new gallery with the given encoding ids tombstoned
+
+        The encoding matrix, row order and id order are shared with this
+        gallery; only the alive mask and per-person arrays are copied, since
+        readers of this gallery must still see the rows.
+        """
+        rows = self.rows_for(ids)
+        if len(rows) == 0:
+            return self
+
+        gallery = copy.copy(self)
+        if self.alive is None:
+            gallery.alive = np.ones(len(self.ids), dtype=bool)
+        else:
+            gallery.alive = self.alive.copy()
+        gallery.alive[rows] = False
+        gallery.live_counts = self.live_counts - np.bincount(
+            self.person_ids[rows], minlength=len(self.names)
+        )
+        gallery.tombstone_count = self.tombstone_count + len(rows)
+        gallery.centroids = self.centroids.copy()
+        gallery.radii = self.radii.copy()
+        gallery._update_person_stats(np.unique(self.person_ids[rows]))
+        return gallery
+
+    def with_encoding(
+        self, encoding: np.ndarray, name: str, encoding_id: Optional[int] = None
+    ) -> "FaceGallery":
+        """Return a new gallery with one encoding appended for ``name``"""
+        if encoding_id is None:
+            encoding_id = int(self.ids.max()) + 1 if len(self.ids) else 0
+        person = self._person_index.get(name)
+        names = list(self.names)
+        if person is None:
+            person = len(names)
+            names.append(name)
+
+        row = np.asarray(encoding, dtype=np.float32).reshape(1, ENCODING_DIM)
+        return FaceGallery.from_arrays(
+            np.concatenate((self.encodings, row)),
+            np.append(self.person_ids, person),
+            names,
+            np.append(self.ids, encoding_id),
+            previous=self,
+            quantization=self.quantization,
+        )
+
+    def distances(self, face_encodings: np.ndarray) -> np.ndarray:
+        """Euclidean distances from (M, 128) probes to every known encoding
+
+        Uses ``|g|^2 - 2 g.p + |p|^2`` so the whole probe batch is scored with
+        one matrix multiplication against the gallery.
+        """
+        probes = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        sq_distances = (
+            self.sq_norms[np.newaxis, :]
+            - 2.0 * (probes @ self.encodings.T)
+            + np.einsum("ij,ij->i", probes, probes)[:, np.newaxis]
+        )
+        return np.sqrt(np.maximum(sq_distances, 0.0))
+
+    def match(
+        self,
+        face_encodings: np.ndarray,
+        tolerance: float,
+        candidates: Optional[List[np.ndarray]] = None,
+        top_people: Optional[int] = None,
+        rerank: int = 32,
+    ) -> List[Optional[PersonMatch]]:
+        """Find the closest person for each of a batch of probe encodings
+
+        Computes the (M, N) distance matrix once. For every probe, the person
+        owning the closest encoding is picked and that person's rows are
+        reduced to their best and average distance and number of encodings
+        within ``tolerance``.
+
+        When ``candidates`` holds an array of encoding ids per probe (from an
+        approximate index), only the people owning those encodings are scored,
+        exactly and over all of their encodings. Without candidates,
+        ``top_people`` first narrows every probe down to that many people by
+        their centroids (see ``person_bounds``) and scans only their rows,
+        widening the set until no other person can hold a closer encoding.
+        A quantized gallery scores the compact matrix first, over all rows or
+        those of the narrowed people, and re-ranks the people owning the
+        ``rerank`` closest rows exactly.
+        """
+        probes = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(self) == 0:
+            return [None] * len(probes)
+        if len(probes) == 0:
+            return []
+        if candidates is not None:
+            return [
+                self._match_people(
+                    probe,
+                    np.unique(self.person_ids[self.rows_for(ids)]),
+                    tolerance,
+                    rerank,
+                )
+                for probe, ids in zip(probes, candidates)
+            ]
+        if top_people is not None and top_people < self.person_count:
+            max_people = max(
+                top_people, int(self.person_count * _PREFILTER_MAX_FRACTION)
+            )
+            matches: List[Optional[PersonMatch]] = []
+            unresolved = []
+            for i, (probe, probe_bounds) in enumerate(
+                zip(probes, self.person_bounds(probes))
+            ):
+                resolved, match = self._match_prefiltered(
+                    probe, probe_bounds, top_people, max_people, tolerance, rerank
+                )
+                matches.append(match)
+                if not resolved:
+                    unresolved.append(i)
+            if unresolved:
+                # Centroids do not separate these probes' neighbours
+                full_scan = self._match_all(probes[unresolved], tolerance, rerank)
+                for i, match in zip(unresolved, full_scan):
+                    matches[i] = match
+            return matches
+        return self._match_all(probes, tolerance, rerank)
+
+    def _match_all(
+        self, probes: np.ndarray, tolerance: float, rerank: int
+    ) -> List[Optional[PersonMatch]]:
+        """Score every probe against the whole gallery"""
+        if self.quantized is not None:
+            return self._match_quantized(probes, tolerance, rerank)
+
+        distances = self.distances(probes)
+        if self.alive is not None:
+            distances = np.where(self.alive, distances, np.inf)
+        people = self.person_ids[np.argmin(distances, axis=1)]
+        return [
+            self._summarize(
+                person, probe_distances[self.person_rows(person)], tolerance
+            )
+            for probe_distances, person in zip(distances, people)
+        ]
+
+    def _quantized_weights(self, probes: np.ndarray) -> np.ndarray:
+        # Fold the int8 step into the probe so rows are only widened to float32
+        return probes * self.scale if self.quantization == "int8" else probes
+
+    def approximate_sq_distances(self, face_encodings: np.ndarray) -> np.ndarray:
+        """Squared distances from (M, 128) probes to the quantized rows"""
+        probes = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        weights = self._quantized_weights(probes)
+        dots = np.empty((len(probes), len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), _SCAN_CHUNK_ROWS):
+            chunk = self.quantized[start : start + _SCAN_CHUNK_ROWS]
+            dots[:, start : start + len(chunk)] = weights @ chunk.astype(np.float32).T
+        return (
+            self.sq_norms[np.newaxis, :]
+            - 2.0 * dots
+            + np.einsum("ij,ij->i", probes, probes)[:, np.newaxis]
+        )
+
+    def _match_quantized(
+        self, probes: np.ndarray, tolerance: float, rerank: int
+    ) -> List[Optional[PersonMatch]]:
+        sq_distances = self.approximate_sq_distances(probes)
+        if self.alive is not None:
+            sq_distances = np.where(self.alive, sq_distances, np.inf)
+        k = min(max(rerank, 1), len(self.ids))
+        nearest = np.argpartition(sq_distances, k - 1, axis=1)[:, :k]
+        return [
+            self._match_people(probe, np.unique(self.person_ids[rows]), tolerance)
+            for probe, rows in zip(probes, nearest)
+        ]
+
+    def _rerank_people(
+        self, probe: np.ndarray, people: np.ndarray, rerank: int
+    ) -> np.ndarray:
+        """People owning the ``rerank`` closest of their rows, scored quantized"""
+        rows = self._rows_of(people)
+        if len(rows) <= rerank:
+            return people
+        weights = self._quantized_weights(probe)
+        sq_distances = (
+            self.sq_norms[rows]
+            - 2.0 * (self.quantized[rows].astype(np.float32) @ weights)
+            + probe @ probe
+        )
+        if self.alive is not None:
+            sq_distances = np.where(self.alive[rows], sq_distances, np.inf)
+        nearest = np.argpartition(sq_distances, max(rerank, 1) - 1)[: max(rerank, 1)]
+        return np.unique(self.person_ids[rows[nearest]])
+
+    def _match_people(
+        self,
+        probe: np.ndarray,
+        people: np.ndarray,
+        tolerance: float,
+        rerank: Optional[int] = None,
+    ) -> Optional[PersonMatch]:
+        """Score one probe against all encodings of a subset of people
+
+        With ``rerank`` on a quantized gallery, the people's rows are scored
+        from the compact matrix first and only the closest are read in full.
+        """
+        people = people[self.live_counts[people] > 0]
+        if len(people) == 0:
+            return None
+        if rerank is not None and self.quantized is not None:
+            people = self._rerank_people(probe, people, rerank)
+
+        rows = self._rows_of(people)
+
+        sq_distances = (
+            self.sq_norms[rows] - 2.0 * (self.encodings[rows] @ probe) + probe @ probe
+        )
+        distances = np.sqrt(np.maximum(sq_distances, 0.0))
+        if self.alive is not None:
+            distances = np.where(self.alive[rows], distances, np.inf)
+
+        person = self.person_ids[rows[np.argmin(distances)]]
+        return self._summarize(
+            person, distances[self.person_ids[rows] == person], tolerance
+        )
+
+    def _summarize(
+        self, person: int, distances: np.ndarray, tolerance: float
+    ) -> PersonMatch:
+        """Reduce the distances to one person's encodings, skipping dead rows"""
+        distances = distances[np.isfinite(distances)]
+        return PersonMatch(
+            name=self.names[person],
+            encoding_count=len(distances),
+            best_distance=float(distances.min()),
+            avg_distance=float(distances.mean()),
+            matched_count=int(np.count_nonzero(distances <= tolerance)),
+        )
@@ -0,0 +1,393 @@
+"""
+Memory-mapped on-disk gallery of face encodings
+"""
+
+import json
+import logging
+import os
+import pickle
+from contextlib import contextmanager
+from typing import List, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single server process is the only writer
+    fcntl = None
+
+import numpy as np
+
+from app.services.gallery import ENCODING_DIM, FaceGallery
+
+logger = logging.getLogger(__name__)
+
+# Raw row files of one store segment: (prefix, dtype, values per row)
+_ROW_FILES = (
+    ("encodings", np.float32, ENCODING_DIM),
+    ("persons", np.int32, 1),
+    ("ids", np.int64, 1),
+)
+_ALL_FILES = _ROW_FILES + (("tombstones", np.int64, 1),)
+_ROW_BYTES = {
+    prefix: np.dtype(dtype).itemsize * width for prefix, dtype, width in _ALL_FILES
+}
+
+
+class GalleryStore:
+    """Gallery persisted as raw row files plus a small JSON manifest
+
+    A store segment ``s`` consists of ``encodings.s.f32`` (float32 rows),
+    ``persons.s.i32`` (person index per row), ``ids.s.i64`` (encoding id per
+    row) and ``tombstones.s.i64`` (deleted ids). ``manifest.json`` holds the
+    current segment, the committed row and tombstone counts and the person
+    names, and is replaced atomically after every write. Bytes past the
+    committed counts (from an interrupted write) are ignored and overwritten.
+
+    Loading memory-maps the row files read-only, so startup does not read
+    the encodings and every server worker shares the same pages. Writers
+    (enrollments, deletes, compaction) are serialized across processes by a
+    file lock and bump a published generation counter, an 8-byte memory-mapped
+    file that readers poll on every request to notice changes made by other
+    workers. Compaction rewrites the live rows into a new segment; processes
+    still mapping the old files keep a valid view.
+    """
+
+    def __init__(self, path: str, quantization: str = "none"):
+        self.path = path
+        self.quantization = quantization  # Of the galleries this store loads
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.lock_path = os.path.join(path, "writer.lock")
+        self.generation_path = os.path.join(path, "generation")
+        self._generation: Optional[np.memmap] = None
+        self.manifest = self._read_manifest()
+
+    @property
+    def exists(self) -> bool:
+        return self.manifest is not None
+
+    @property
+    def published_generation(self) -> int:
+        """Generation of the last write by any process, -1 without a store"""
+        if self._generation is None:
+            if not os.path.exists(self.generation_path):
+                return -1
+            self._generation = np.memmap(
+                self.generation_path, dtype=np.int64, mode="r", shape=(1,)
+            )
+        return int(self._generation[0])
+
+    def _read_manifest(self) -> Optional[dict]:
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if "segment" not in manifest:
+            # Older stores numbered their segment files "generation"
+            manifest["segment"] = manifest["generation"]
+            manifest["generation"] = -1
+        return manifest
+
+    @contextmanager
+    def _writing(self):
+        """Hold the cross-process writer lock with an up-to-date manifest"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                # Another worker may have written since we last looked
+                self.manifest = self._read_manifest()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _write_manifest(self, manifest: dict) -> int:
+        """Commit a manifest and publish it under the next generation"""
+        manifest = dict(manifest, generation=self._next_generation())
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        self._sync_directory()
+        self.manifest = manifest
+
+        # Publish only after the manifest is in place
+        counter = np.memmap(self.generation_path, dtype=np.int64, mode="r+", shape=(1,))
+        counter[0] = manifest["generation"]
+        counter.flush()
+        return manifest["generation"]
+
+    def _sync_directory(self):
+        """Make renames and newly created segment files durable"""
+        if not hasattr(os, "O_DIRECTORY"):
+            return  # Windows cannot open directories
+        fd = os.open(self.path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _next_generation(self) -> int:
+        if not os.path.exists(self.generation_path):
+            np.full(1, -1, dtype=np.int64).tofile(self.generation_path)
+        return self.published_generation + 1
+
+    def _file(self, prefix: str, segment: int) -> str:
+        extension = {"encodings": "f32", "persons": "i32"}.get(prefix, "i64")
+        return os.path.join(self.path, f"{prefix}.{segment}.{extension}")
+
+    def _map(
+        self, manifest: dict, prefix: str, dtype, width: int, count: int
+    ) -> np.ndarray:
+        """Read-only memory map of the first ``count`` committed rows"""
+        shape = (count, width) if width > 1 else (count,)
+        if count == 0:
+            return np.empty(shape, dtype=dtype)
+        path = self._file(prefix, manifest["segment"])
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def _append(self, prefix: str, committed: int, rows: np.ndarray):
+        """Write rows after the committed ones, dropping any torn tail
+
+        The rows are on disk before this returns, so a manifest counting them
+        never outlives them in a crash.
+        """
+        path = self._file(prefix, self.manifest["segment"])
+        with open(path, "ab") as f:
+            f.truncate(committed * _ROW_BYTES[prefix])
+            f.write(rows.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_segment_file(self, prefix: str, segment: int, rows: np.ndarray):
+        """Write a whole segment file and flush it to disk"""
+        with open(self._file(prefix, segment), "wb") as f:
+            f.write(np.ascontiguousarray(rows).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def create(self, names: Sequence[str] = ()) -> int:
+        """Initialize an empty store"""
+        with self._writing():
+            return self._create(names)
+
+    def _create(self, names: Sequence[str] = ()) -> int:
+        segment = 0
+        for prefix, _, _ in _ALL_FILES:
+            open(self._file(prefix, segment), "wb").close()
+        return self._write_manifest(
+            {
+                "segment": segment,
+                "count": 0,
+                "tombstones": 0,
+                "names": list(names),
+            }
+        )
+
+    def load(self, previous: Optional[FaceGallery] = None) -> FaceGallery:
+        """Memory-map the latest published gallery
+
+        Loading never writes, so every worker can do it without the writer
+        lock. Tombstoned rows are masked rather than compacted away, and the
+        squared norms and person centroids of ``previous`` are reused when it
+        maps the same segment.
+        """
+        for _ in range(3):
+            manifest = self._read_manifest()
+            if manifest is None:
+                return FaceGallery(quantization=self.quantization)
+            try:
+                gallery = self._load(manifest, previous)
+            except FileNotFoundError:
+                # A compaction removed the segment we were about to map
+                continue
+            self.manifest = manifest
+            return gallery
+        raise RuntimeError(f"Gallery store {self.path} kept changing while loading")
+
+    def _load(self, manifest: dict, previous: Optional[FaceGallery]) -> FaceGallery:
+        count = manifest["count"]
+        if previous is not None and previous.segment != manifest["segment"]:
+            previous = None
+
+        gallery = FaceGallery.from_arrays(
+            self._map(manifest, "encodings", np.float32, ENCODING_DIM, count),
+            self._map(manifest, "persons", np.int32, 1, count),
+            list(manifest["names"]),
+            self._map(manifest, "ids", np.int64, 1, count),
+            previous,
+            self.quantization,
+        )
+        tombstones = self._map(
+            manifest, "tombstones", np.int64, 1, manifest["tombstones"]
+        )
+        gallery = gallery.without(tombstones)
+        gallery.segment = manifest["segment"]
+        gallery.generation = manifest["generation"]
+        return gallery
+
+    def append(
+        self, encodings: np.ndarray, names: Sequence[str], ids: Sequence[int]
+    ) -> int:
+        """Durably add encodings with their person names and ids
+
+        Returns the generation the new rows were published under.
+        """
+        with self._writing():
+            if not self.exists:
+                self._create()
+            return self._append_rows(encodings, names, ids)
+
+    def append_if_empty(
+        self, encodings: np.ndarray, names: Sequence[str], ids: Sequence[int]
+    ) -> Optional[int]:
+        """Append only while the store holds no live rows
+
+        The check and the write happen under one writer lock, so when several
+        workers restore a lost store only the first one writes. Returns the
+        generation, or None if the store was not empty.
+        """
+        with self._writing():
+            if not self.exists:
+                self._create()
+            elif self._live_count() > 0:
+                return None
+            return self._append_rows(encodings, names, ids)
+
+    def _live_count(self) -> int:
+        manifest = self.manifest
+        count = manifest["count"]
+        if count == 0 or manifest["tombstones"] == 0:
+            return count
+        ids = self._map(manifest, "ids", np.int64, 1, count)
+        tombstones = self._map(
+            manifest, "tombstones", np.int64, 1, manifest["tombstones"]
+        )
+        return int(np.count_nonzero(~np.isin(ids, tombstones)))
+
+    def _append_rows(
+        self, encodings: np.ndarray, names: Sequence[str], ids: Sequence[int]
+    ) -> int:
+        manifest = dict(self.manifest)
+        manifest["names"] = list(manifest["names"])
+        person_index = {name: i for i, name in enumerate(manifest["names"])}
+        persons = []
+        for name in names:
+            if name not in person_index:
+                person_index[name] = len(manifest["names"])
+                manifest["names"].append(name)
+            persons.append(person_index[name])
+
+        count = manifest["count"]
+        rows = {
+            "encodings": np.asarray(encodings, dtype=np.float32).reshape(
+                -1, ENCODING_DIM
+            ),
+            "persons": np.asarray(persons, dtype=np.int32),
+            "ids": np.asarray(ids, dtype=np.int64),
+        }
+        for prefix, _, _ in _ROW_FILES:
+            self._append(prefix, count, rows[prefix])
+
+        manifest["count"] = count + len(rows["ids"])
+        return self._write_manifest(manifest)
+
+    def delete(self, ids: Sequence[int]) -> Optional[int]:
+        """Record deleted encoding ids; rows are dropped on compaction
+
+        Returns the generation the deletes were published under.
+        """
+        if len(ids) == 0:
+            return None
+        with self._writing():
+            if not self.exists:
+                return None
+            ids = np.asarray(ids, dtype=np.int64)
+            self._append("tombstones", self.manifest["tombstones"], ids)
+            return self._write_manifest(
+                dict(self.manifest, tombstones=self.manifest["tombstones"] + len(ids))
+            )
+
+    def compact(self) -> Optional[int]:
+        """Rewrite live rows grouped by person into a new segment"""
+        with self._writing():
+            if not self.exists or self.manifest["tombstones"] == 0:
+                return None
+            return self._compact()
+
+    def _compact(self) -> int:
+        manifest = self.manifest
+        count = manifest["count"]
+        old_segment = manifest["segment"]
+        encodings = self._map(manifest, "encodings", np.float32, ENCODING_DIM, count)
+        persons = self._map(manifest, "persons", np.int32, 1, count)
+        ids = self._map(manifest, "ids", np.int64, 1, count)
+        tombstones = self._map(
+            manifest, "tombstones", np.int64, 1, manifest["tombstones"]
+        )
+
+        alive = ~np.isin(ids, tombstones)
+        order = np.flatnonzero(alive)[np.argsort(persons[alive], kind="stable")]
+
+        # Drop people without encodings left and renumber the rest
+        used = np.unique(persons[order])
+        remap = np.full(len(manifest["names"]), -1, dtype=np.int32)
+        remap[used] = np.arange(len(used), dtype=np.int32)
+        names = [manifest["names"][person] for person in used]
+
+        segment = old_segment + 1
+        self._write_segment_file("encodings", segment, encodings[order])
+        self._write_segment_file("persons", segment, remap[persons[order]])
+        self._write_segment_file("ids", segment, ids[order])
+        self._write_segment_file("tombstones", segment, np.empty(0, dtype=np.int64))
+
+        generation = self._write_manifest(
+            {
+                "segment": segment,
+                "count": len(order),
+                "tombstones": 0,
+                "names": names,
+            }
+        )
+        for prefix, _, _ in _ALL_FILES:
+            try:
+                os.remove(self._file(prefix, old_segment))
+            except OSError:
+                pass
+        logger.info(f"Compacted gallery store to {len(order)} encodings")
+        return generation
+
+    def migrate_pickles(self, encodings_path: str, id_for) -> int:
+        """One-shot import of a legacy directory of per-encoding pickles
+
+        Person names are parsed from ``<name>_<timestamp>.pkl`` filenames and
+        ids come from ``id_for(filename)`` so existing references stay valid.
+        Only the first worker to get the writer lock migrates.
+        """
+        with self._writing():
+            if self.exists:
+                return 0
+            return self._migrate_pickles(encodings_path, id_for)
+
+    def _migrate_pickles(self, encodings_path: str, id_for) -> int:
+        encodings: List[np.ndarray] = []
+        names: List[str] = []
+        ids: List[int] = []
+        for filename in sorted(os.listdir(encodings_path)):
+            if not filename.endswith(".pkl"):
+                continue
+            try:
+                with open(os.path.join(encodings_path, filename), "rb") as f:
+                    encodings.append(pickle.load(f))
+                names.append("_".join(filename.split("_")[:-1]))
+                ids.append(id_for(filename))
+            except Exception as e:
+                logger.error(f"Error migrating encoding {filename}: {e}")
+
+        self._create()
+        if encodings:
+            self._append_rows(np.asarray(encodings), names, ids)
+        logger.info(f"Migrated {len(encodings)} pickled encodings to {self.path}")
+        return len(encodings)
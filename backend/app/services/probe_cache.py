@@ -0,0 +1,119 @@
+"""
+Content-addressed cache of analyzed probe images
+"""
+
+import base64
+import binascii
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+
+class CachedProbe:
+    """Faces found in one image, plus the matches of its last gallery pass"""
+
+    __slots__ = ("face_locations", "face_encodings", "generation", "matches", "expires")
+
+    def __init__(
+        self,
+        face_locations: List[Tuple[int, int, int, int]],
+        face_encodings: np.ndarray,
+        expires: float,
+    ):
+        self.face_locations = face_locations
+        self.face_encodings = face_encodings
+        self.generation: Optional[int] = None  # Gallery generation of ``matches``
+        self.matches: Optional[List[Tuple[str, float]]] = None
+        self.expires = expires
+
+
+class ProbeCache:
+    """Bounded LRU/TTL cache of face locations and encodings per image
+
+    Entries are keyed by a hash of the image bytes (base64 payloads are
+    decoded first, so JSON and raw uploads of an image share an entry) and
+    the detector backend, so retries and resubmissions of the same image skip
+    decode, detection and encoding.
+    Matches are only reused while the gallery generation is unchanged.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, CachedProbe]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(image_data: Union[str, bytes], detector: Optional[str] = None) -> bytes:
+        """Content hash of an image for a detector backend"""
+        if isinstance(image_data, str):
+            # Hash the decoded image, without the data URL prefix
+            payload = image_data.split(",")[-1].encode("ascii", "ignore")
+            try:
+                image_data = base64.b64decode(payload)
+            except binascii.Error:
+                # Not decodable; analysis rejects it, but it still needs a key
+                image_data = payload
+        digest = hashlib.blake2b(image_data, digest_size=16)
+        digest.update((detector or "").encode("utf-8"))
+        return digest.digest()
+
+    def get(self, key: bytes) -> Optional[CachedProbe]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            probe = self._entries.get(key)
+            if probe is not None and probe.expires < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                probe = None
+            if probe is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return probe
+
+    def put(
+        self,
+        key: bytes,
+        face_locations: List[Tuple[int, int, int, int]],
+        face_encodings: np.ndarray,
+    ) -> CachedProbe:
+        probe = CachedProbe(face_locations, face_encodings, time.monotonic() + self.ttl)
+        if not self.enabled:
+            return probe
+        with self._lock:
+            self._entries[key] = probe
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return probe
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,162 @@
+"""
+Background construction of the recognition service and readiness tracking
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.models.database import Face
+from app.services import database
+from app.services.engine import RecognitionEngine
+from app.services.face_recognition_service import FaceRecognitionService
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceNotReady(RuntimeError):
+    """The recognition service is still loading or failed to load"""
+
+
+class ServiceLoader:
+    """Build the recognition service off the import and startup path
+
+    ``start`` returns immediately and loads in a background thread: the
+    gallery is mapped and the matching index synced, then one detection and
+    encoding runs here and in every engine worker so the models are warm
+    before traffic arrives. ``stage`` moves through ``pending``,
+    ``loading_gallery``, ``warming_up`` and ``ready`` (or ``failed``).
+
+    While loading, the gallery is reconciled with ``faces.db``, which keeps
+    every encoding as a BLOB: rows from before that are backfilled from the
+    gallery, and a missing gallery store is rebuilt from the database.
+    """
+
+    def __init__(self, session_factory=database.SessionLocal):
+        self.session_factory = session_factory
+        self.stage = "pending"
+        self.error: Optional[str] = None
+        self.service: Optional[FaceRecognitionService] = None
+        self.engine: Optional[RecognitionEngine] = None
+        self.stage_times: Dict[str, float] = {}  # Seconds spent per finished stage
+        self._stage_started = time.time()
+        self._started_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.stage == "ready"
+
+    def start(self):
+        """Begin loading in the background; later calls are no-ops"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._started_at = time.time()
+            self._thread = threading.Thread(
+                target=self._load, name="service-loader", daemon=True
+            )
+            self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until loading finished; returns whether the service is ready"""
+        self._done.wait(timeout)
+        return self.ready
+
+    def _enter(self, stage: str):
+        now = time.time()
+        if self.stage != "pending":
+            self.stage_times[self.stage] = round(now - self._stage_started, 3)
+        self._stage_started = now
+        self.stage = stage
+        logger.info(f"Recognition service: {stage}")
+
+    def _load(self):
+        try:
+            self._enter("loading_gallery")
+            self.service = FaceRecognitionService()
+            self.sync_database(self.service)
+            self.engine = RecognitionEngine(self.service, settings.engine_processes)
+
+            self._enter("warming_up")
+            if settings.service_warm_up:
+                self.engine.warm_up()
+
+            self._enter("ready")
+        except Exception as e:
+            logger.exception("Recognition service failed to load")
+            self.error = str(e)
+            self._enter("failed")
+        finally:
+            self._done.set()
+
+    def sync_database(self, service: FaceRecognitionService):
+        """Backfill encoding BLOBs and rebuild an empty gallery from them"""
+        db = self.session_factory()
+        try:
+            faces = db.query(Face).filter(Face.encoding.is_(None)).all()
+            if faces:
+                encodings, found = service.get_encodings(
+                    [face.encoding_path for face in faces]
+                )
+                for face, encoding, present in zip(faces, encodings, found):
+                    if present:
+                        face.encoding = database.encoding_to_blob(encoding)
+                if found.any():
+                    db.commit()
+                    logger.info(
+                        f"Stored {int(np.count_nonzero(found))} encoding(s) "
+                        "in the database"
+                    )
+
+            if len(service.gallery) == 0:
+                encodings, names, encoding_paths = database.load_face_encodings(db)
+                if encoding_paths:
+                    service.restore_gallery(encodings, names, encoding_paths)
+        finally:
+            db.close()
+
+    def get_service(self) -> FaceRecognitionService:
+        if not self.ready:
+            raise ServiceNotReady(f"Recognition service is {self.stage}")
+        return self.service
+
+    def get_engine(self) -> RecognitionEngine:
+        if not self.ready:
+            raise ServiceNotReady(f"Recognition service is {self.stage}")
+        return self.engine
+
+    def get_status(self) -> Dict:
+        """Loading progress for the readiness probe"""
+        status = {
+            "ready": self.ready,
+            "stage": self.stage,
+            "elapsed_seconds": (
+                round(time.time() - self._started_at, 3) if self._started_at else 0.0
+            ),
+            "stage_seconds": dict(self.stage_times),
+        }
+        if self.service is not None:
+            gallery = self.service.gallery
+            status["encodings_loaded"] = len(gallery)
+            status["people_loaded"] = gallery.person_count
+        if self.error is not None:
+            status["error"] = self.error
+        return status
+
+    def shutdown(self):
+        """Stop the engine workers and persist the index if loading got that far"""
+        if self.engine is not None:
+            self.engine.shutdown()
+        if self.service is not None:
+            self.service.index.save()
+
+
+# Global instance, started by the application's startup handler
+services = ServiceLoader()
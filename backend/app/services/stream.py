@@ -0,0 +1,87 @@
+"""
+Per-connection state for streaming recognition over WebSocket
+"""
+
+import asyncio
+from typing import Optional, Tuple, Union
+
+from app.config import settings
+from app.models.schemas import StreamResult
+from app.services.tracker import FaceTracker
+
+
+class StreamSession:
+    """Latest-frame-wins recognition of a live camera stream
+
+    Frames are received independently of processing: ``submit`` only keeps
+    the newest unprocessed frame, so when recognition falls behind the
+    camera, stale frames are dropped instead of queueing up latency. The
+    session lives as long as the connection and carries the state that is
+    reused from frame to frame: a face tracker, so faces that stay put keep
+    their identity without being re-encoded.
+    """
+
+    def __init__(self, engine, detector: Optional[str] = None):
+        self.engine = engine
+        self.detector = detector
+        self.tracker: Optional[FaceTracker] = None
+        if settings.stream_tracking:
+            self.tracker = FaceTracker(
+                iou_threshold=settings.tracker_iou_threshold,
+                drift_iou=settings.tracker_drift_iou,
+                refresh_interval=settings.tracker_refresh_frames,
+                max_missed=settings.tracker_max_missed,
+            )
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.closed = False
+        self._latest: Optional[Tuple[int, Union[str, bytes]]] = None
+        self._frame_ready = asyncio.Event()
+
+    def submit(self, frame: Union[str, bytes]) -> int:
+        """Queue a frame, replacing any frame still waiting to be processed"""
+        self.frames_received += 1
+        if self._latest is not None:
+            self.frames_dropped += 1
+        self._latest = (self.frames_received, frame)
+        self._frame_ready.set()
+        return self.frames_received
+
+    def close(self):
+        """Stop processing once the client is gone"""
+        self.closed = True
+        self._frame_ready.set()
+
+    async def next_frame(self) -> Optional[Tuple[int, Union[str, bytes]]]:
+        """Wait for the newest frame, or None once the session is closed"""
+        while self._latest is None and not self.closed:
+            self._frame_ready.clear()
+            await self._frame_ready.wait()
+        if self.closed:
+            return None
+        frame, self._latest = self._latest, None
+        return frame
+
+    async def process(
+        self, frame_number: int, frame: Union[str, bytes]
+    ) -> StreamResult:
+        """Recognize one frame"""
+        if self.tracker is None:
+            results, processing_time = await self.engine.recognize(
+                frame, self.detector, use_cache=False
+            )
+            faces_encoded = len(results)
+        else:
+            results, processing_time, faces_encoded = (
+                await self.engine.recognize_tracked(frame, self.tracker, self.detector)
+            )
+        self.frames_processed += 1
+        return StreamResult(
+            frame=frame_number,
+            faces_detected=len(results),
+            results=results,
+            processing_time=round(processing_time, 3),
+            faces_encoded=faces_encoded,
+            frames_dropped=self.frames_dropped,
+        )
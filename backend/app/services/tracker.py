@@ -0,0 +1,111 @@
+"""
+Cross-frame face tracking for streaming recognition
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+FaceLocation = Tuple[int, int, int, int]  # (top, right, bottom, left)
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Pairwise intersection-over-union of (top, right, bottom, left) boxes"""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)[:, np.newaxis, :]
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)[np.newaxis, :, :]
+    height = np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    width = np.minimum(a[..., 1], b[..., 1]) - np.maximum(a[..., 3], b[..., 3])
+    intersection = np.clip(height, 0, None) * np.clip(width, 0, None)
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 1] - a[..., 3])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 1] - b[..., 3])
+    union = area_a + area_b - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+class Track:
+    """A face followed across frames with the identity of its last encoding"""
+
+    def __init__(self, track_id: int, location: FaceLocation, frame: int):
+        self.track_id = track_id
+        self.location = location
+        self.last_seen = frame
+        self.name = "Unknown"
+        self.confidence = 0.0
+        self.encoded_location: Optional[FaceLocation] = None
+        self.encoded_frame = -1
+
+    def identify(self, name: str, confidence: float):
+        """Record the identity from a fresh encoding at the current location"""
+        self.name = name
+        self.confidence = confidence
+        self.encoded_location = self.location
+        self.encoded_frame = self.last_seen
+
+
+class FaceTracker:
+    """IoU association of detections to tracks between frames
+
+    Every detection is greedily matched to the overlapping track with the
+    highest IoU. A matched face keeps its track's identity and is only
+    re-encoded when the track is new, has drifted away from where it was
+    last encoded, or its identity is older than ``refresh_interval`` frames.
+    Tracks not seen for ``max_missed`` frames are dropped. Frames are counted
+    by ``update`` calls, so frames a stream skips never age a track.
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        drift_iou: float = 0.5,
+        refresh_interval: int = 30,
+        max_missed: int = 5,
+    ):
+        self.iou_threshold = iou_threshold
+        self.drift_iou = drift_iou
+        self.refresh_interval = refresh_interval
+        self.max_missed = max_missed
+        self.tracks: List[Track] = []
+        self.frame = 0  # Frames processed so far
+        self._next_id = 1
+
+    def update(self, face_locations: List[FaceLocation]) -> List[Tuple[Track, bool]]:
+        """Assign the detections of the next processed frame to tracks
+
+        Returns the track of every detection, in ``face_locations`` order, and
+        whether the face needs a fresh encoding.
+        """
+        self.frame += 1
+        frame = self.frame
+        assigned: List[Optional[Track]] = [None] * len(face_locations)
+        if self.tracks and face_locations:
+            iou = box_iou([t.location for t in self.tracks], face_locations)
+            # Greedy matching, best overlaps first
+            for flat in np.argsort(iou, axis=None)[::-1]:
+                track_index, location_index = np.unravel_index(flat, iou.shape)
+                if iou[track_index, location_index] < self.iou_threshold:
+                    break
+                track = self.tracks[track_index]
+                if assigned[location_index] is None and track.last_seen != frame:
+                    assigned[location_index] = track
+                    track.last_seen = frame
+
+        plan = []
+        for location_index, location in enumerate(face_locations):
+            track = assigned[location_index]
+            if track is None:
+                track = Track(self._next_id, location, frame)
+                self._next_id += 1
+                self.tracks.append(track)
+            track.location = tuple(int(v) for v in location)
+            plan.append((track, self._needs_encoding(track, frame)))
+
+        self.tracks = [t for t in self.tracks if frame - t.last_seen <= self.max_missed]
+        return plan
+
+    def _needs_encoding(self, track: Track, frame: int) -> bool:
+        if track.encoded_location is None:
+            return True
+        if frame - track.encoded_frame >= self.refresh_interval:
+            return True
+        drift = box_iou([track.encoded_location], [track.location])[0, 0]
+        return drift < self.drift_iou
@@ -0,0 +1,66 @@
+"""
+Streaming readers for image archives used by bulk enrollment
+"""
+
+import tarfile
+import zipfile
+from pathlib import PurePosixPath
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# (entry name, image bytes, error)
+ArchiveEntry = Tuple[str, Optional[bytes], Optional[str]]
+
+
+def person_name(entry_name: str) -> str:
+    """Name of the person an archive entry belongs to
+
+    ``alice/1.jpg`` belongs to its directory, ``alice.jpg`` to its file name.
+    """
+    path = PurePosixPath(entry_name)
+    return path.parent.name if path.parent.name else path.stem
+
+
+def _is_image(entry_name: str) -> bool:
+    path = PurePosixPath(entry_name)
+    if any(part.startswith((".", "__MACOSX")) for part in path.parts):
+        return False
+    return path.suffix.lower() in IMAGE_EXTENSIONS
+
+
+def _read_capped(stream: BinaryIO, entry_name: str, max_bytes: int) -> ArchiveEntry:
+    # Declared sizes can lie, so never read more than the cap
+    data = stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        return entry_name, None, f"Image larger than {max_bytes} bytes"
+    return entry_name, data, None
+
+
+def iter_archive_images(fileobj: BinaryIO, max_bytes: int) -> Iterator[ArchiveEntry]:
+    """Yield the image entries of a zip or tar (optionally compressed) archive
+
+    Entries are read one at a time, so only one image is held in memory.
+    Images over ``max_bytes`` are reported with an error instead of data.
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not _is_image(info.filename):
+                    continue
+                with archive.open(info) as stream:
+                    yield _read_capped(stream, info.filename, max_bytes)
+        return
+
+    fileobj.seek(0)
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.TarError:
+        raise ValueError("Unsupported archive, use zip or tar")
+    with archive:
+        for member in archive:
+            if not member.isfile() or not _is_image(member.name):
+                continue
+            stream = archive.extractfile(member)
+            yield _read_capped(stream, member.name, max_bytes)
@@ -54,3 +54,19 @@ def resize_image(image: np.ndarray, max_width: int = 800, max_height: int = 600)
     resized_image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
     
     return resized_image
+
+def scale_face_locations(face_locations, image_shape, scaled_shape):
+    """Map (top, right, bottom, left) boxes from a resized image back to the original"""
+    height, width = image_shape[:2]
+    scale_y = height / scaled_shape[0]
+    scale_x = width / scaled_shape[1]
+
+    return [
+        (
+            max(0, int(round(top * scale_y))),
+            min(width, int(round(right * scale_x))),
+            min(height, int(round(bottom * scale_y))),
+            max(0, int(round(left * scale_x))),
+        )
+        for top, right, bottom, left in face_locations
+    ]
@@ -2,25 +2,99 @@
 Performance monitoring middleware and utilities
 """
 
+import math
 import time
 import logging
-from typing import Dict, List
+import threading
+from bisect import bisect_left
+from typing import Dict, Optional, Sequence
 from datetime import datetime
-from collections import deque
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
+from app.utils.profiler import profiler
 
 logger = logging.getLogger(__name__)
 
+# Latency bucket upper bounds in seconds: 0.5 ms to ~55 s, four per doubling
+LATENCY_BUCKETS = tuple(round(0.0005 * 2 ** (i / 4), 6) for i in range(68))
+FACE_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Pipeline stages with a latency histogram: decode/detect/encode per image,
+# match per gallery pass, recognition and enrollment end to end
+STAGES = ("request", "decode", "detect", "encode", "match", "recognition", "enrollment")
+
+
+class Histogram:
+    """Fixed-bucket histogram in constant memory
+
+    Percentiles are interpolated within a bucket, so their error is bounded
+    by the bucket width (about 19% with ``LATENCY_BUCKETS``).
+    """
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate the ``q`` quantile (0-1) of the observed values"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.max
+
+    def get_stats(self) -> Dict:
+        if self.count == 0:
+            return {
+                "avg": 0,
+                "min": 0,
+                "max": 0,
+                "count": 0,
+                "p50": 0,
+                "p95": 0,
+                "p99": 0,
+            }
+        return {
+            "avg": self.sum / self.count,
+            "min": self.min,
+            "max": self.max,
+            "count": self.count,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
 
 class PerformanceMetrics:
     """Track performance metrics"""
 
-    def __init__(self, max_history: int = 1000):
-        self.max_history = max_history
-        self.request_times: deque = deque(maxlen=max_history)
-        self.recognition_times: deque = deque(maxlen=max_history)
-        self.enrollment_times: deque = deque(maxlen=max_history)
+    def __init__(self):
+        self.stage_times: Dict[str, Histogram] = {
+            stage: Histogram() for stage in STAGES
+        }
+        self.detection_times: Dict[str, Histogram] = {}  # Per detector backend
+        self.faces_per_image = Histogram(FACE_COUNT_BUCKETS)
         self.total_requests = 0
         self.total_recognitions = 0
         self.total_enrollments = 0
@@ -28,47 +102,130 @@ class PerformanceMetrics:
 
     def add_request_time(self, duration: float):
         """Add request processing time"""
-        self.request_times.append(duration)
+        self.stage_times["request"].observe(duration)
         self.total_requests += 1
 
     def add_recognition_time(self, duration: float):
         """Add recognition processing time"""
-        self.recognition_times.append(duration)
+        self.stage_times["recognition"].observe(duration)
         self.total_recognitions += 1
 
     def add_enrollment_time(self, duration: float):
         """Add enrollment processing time"""
-        self.enrollment_times.append(duration)
+        self.stage_times["enrollment"].observe(duration)
         self.total_enrollments += 1
 
+    def add_stage_time(self, stage: str, duration: float):
+        """Add the time of one pipeline stage"""
+        self.stage_times[stage].observe(duration)
+
+    def add_detection_time(self, backend: str, duration: float):
+        """Add face detection time of a detector backend"""
+        if backend not in self.detection_times:
+            self.detection_times[backend] = Histogram()
+        self.detection_times[backend].observe(duration)
+        self.stage_times["detect"].observe(duration)
+
+    def add_analysis(
+        self, backend: str, stage_times: Dict[str, float], faces: Optional[int] = None
+    ):
+        """Add the stage times of one analyzed image and its face count"""
+        for stage, duration in stage_times.items():
+            if stage == "detect":
+                self.add_detection_time(backend, duration)
+            else:
+                self.add_stage_time(stage, duration)
+        if faces is not None:
+            self.faces_per_image.observe(faces)
+
     def get_stats(self) -> Dict:
         """Get performance statistics"""
         uptime = (datetime.now() - self.start_time).total_seconds()
 
-        def calc_stats(times: deque) -> Dict:
-            if not times:
-                return {"avg": 0, "min": 0, "max": 0, "count": 0}
-            times_list = list(times)
-            return {
-                "avg": sum(times_list) / len(times_list),
-                "min": min(times_list),
-                "max": max(times_list),
-                "count": len(times_list),
-            }
-
         return {
             "uptime_seconds": round(uptime, 2),
             "total_requests": self.total_requests,
             "total_recognitions": self.total_recognitions,
             "total_enrollments": self.total_enrollments,
-            "request_times": calc_stats(self.request_times),
-            "recognition_times": calc_stats(self.recognition_times),
-            "enrollment_times": calc_stats(self.enrollment_times),
+            "request_times": self.stage_times["request"].get_stats(),
+            "recognition_times": self.stage_times["recognition"].get_stats(),
+            "enrollment_times": self.stage_times["enrollment"].get_stats(),
+            "detection_times": {
+                backend: histogram.get_stats()
+                for backend, histogram in list(self.detection_times.items())
+            },
+            "stage_times": {
+                stage: histogram.get_stats()
+                for stage, histogram in self.stage_times.items()
+            },
+            "faces_per_image": self.faces_per_image.get_stats(),
             "requests_per_second": round(
                 self.total_requests / uptime if uptime > 0 else 0, 2
             ),
         }
 
+    def to_prometheus(
+        self,
+        gauges: Optional[Dict[str, float]] = None,
+        counters: Optional[Dict[str, float]] = None,
+    ) -> str:
+        """Render the metrics in the Prometheus text exposition format
+
+        ``gauges`` and ``counters`` add samples owned by other components,
+        keyed by metric name without the ``face_api_`` prefix.
+        """
+        lines = []
+
+        def header(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP face_api_{name} {help_text}")
+            lines.append(f"# TYPE face_api_{name} {kind}")
+
+        def histogram(name: str, hist: Histogram, labels: str = ""):
+            cumulative = 0
+            for bound, count in zip(hist.bounds, hist.counts):
+                cumulative += count
+                le = f'le="{bound:g}"'
+                lines.append(f"face_api_{name}_bucket{{{labels}{le}}} {cumulative}")
+            lines.append(f'face_api_{name}_bucket{{{labels}le="+Inf"}} {hist.count}')
+            suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+            lines.append(f"face_api_{name}_sum{suffix} {hist.sum:.9g}")
+            lines.append(f"face_api_{name}_count{suffix} {hist.count}")
+
+        header("uptime_seconds", "gauge", "Seconds since the metrics were created")
+        lines.append(
+            f"face_api_uptime_seconds "
+            f"{(datetime.now() - self.start_time).total_seconds():.3f}"
+        )
+        for name, value, help_text in (
+            ("requests_total", self.total_requests, "HTTP requests served"),
+            ("recognitions_total", self.total_recognitions, "Images recognized"),
+            ("enrollments_total", self.total_enrollments, "Enrollment attempts"),
+        ):
+            header(name, "counter", help_text)
+            lines.append(f"face_api_{name} {value}")
+
+        header("stage_duration_seconds", "histogram", "Latency of each pipeline stage")
+        for stage, hist in self.stage_times.items():
+            histogram("stage_duration_seconds", hist, f'stage="{stage}",')
+
+        header(
+            "detection_duration_seconds",
+            "histogram",
+            "Face detection latency per detector backend",
+        )
+        for backend, hist in list(self.detection_times.items()):
+            histogram("detection_duration_seconds", hist, f'backend="{backend}",')
+
+        header("faces_per_image", "histogram", "Faces detected per analyzed image")
+        histogram("faces_per_image", self.faces_per_image)
+
+        for kind, samples in (("gauge", gauges), ("counter", counters)):
+            for name, value in (samples or {}).items():
+                lines.append(f"# TYPE face_api_{name} {kind}")
+                lines.append(f"face_api_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
 
 # Global metrics instance
 metrics = PerformanceMetrics()
@@ -80,16 +237,28 @@ class PerformanceMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         start_time = time.time()
 
-        response = await call_next(request)
+        # Profiling the profile downloads would only evict real profiles
+        profile = None
+        if not request.url.path.startswith("/api/admin/"):
+            profile = profiler.begin(f"{request.method} {request.url.path}")
+
+        with profiler.activate(profile):
+            response = await call_next(request)
 
         process_time = time.time() - start_time
         metrics.add_request_time(process_time)
 
         # Add performance header
         response.headers["X-Process-Time"] = str(round(process_time, 4))
+        kept = profile is not None and profiler.finish(profile, process_time)
+        if kept:
+            response.headers["X-Profile-Id"] = str(profile.id)
 
         # Log slow requests
         if process_time > 1.0:
-            logger.warning(f"Slow request: {request.url.path} took {process_time:.2f}s")
+            logger.warning(
+                f"Slow request: {request.url.path} took {process_time:.2f}s"
+                + (f" (profile {profile.id})" if kept else "")
+            )
 
         return response
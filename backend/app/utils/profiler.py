@@ -0,0 +1,297 @@
+"""
+Low-overhead sampling profiler for individual requests
+"""
+
+import contextvars
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+# (function, file, first line) of one stack frame
+FrameKey = Tuple[str, str, int]
+Stack = Tuple[FrameKey, ...]  # Root first
+
+_active_profile: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar(
+    "active_profile", default=None
+)
+
+
+class Profile:
+    """Stack samples of the threads that worked on one request"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str, interval: float = 0.005):
+        self.id = next(self._ids)
+        self.name = name
+        self.interval = interval
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.reason = ""  # Why the profile was kept: "sampled" or "slow"
+        self.samples: Counter = Counter()  # Stack -> number of samples
+        self._lock = threading.Lock()
+
+    def add_frame(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        with self._lock:
+            self.samples[tuple(reversed(stack))] += 1
+
+    def merge(self, samples: Counter):
+        """Add samples taken elsewhere, e.g. in a pool worker process"""
+        with self._lock:
+            self.samples.update(samples)
+
+    @contextmanager
+    def sampling(self):
+        """Sample the current thread for the duration of the block"""
+        thread_id = threading.get_ident()
+        _sampler.register(thread_id, self)
+        try:
+            yield self
+        finally:
+            _sampler.unregister(thread_id)
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 4),
+            "reason": self.reason,
+            "samples": sum(self.samples.values()),
+            "interval": self.interval,
+        }
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed stack format, one ``a;b;c count`` per line"""
+        lines = []
+        for stack, count in self.samples.most_common():
+            frames = ";".join(
+                f"{name} ({os.path.basename(filename)}:{line})"
+                for name, filename, line in stack
+            )
+            lines.append(f"{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> Dict:
+        """The profile as a speedscope sampled-profile document"""
+        frame_index: Dict[FrameKey, int] = {}
+        samples, weights = [], []
+        for stack, count in self.samples.items():
+            samples.append(
+                [frame_index.setdefault(frame, len(frame_index)) for frame in stack]
+            )
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.name} #{self.id}",
+            "exporter": "face-recognition-api",
+            "shared": {
+                "frames": [
+                    {"name": name, "file": filename, "line": line}
+                    for name, filename, line in frame_index
+                ]
+            },
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": self.name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+class _Sampler:
+    """One background thread sampling the stacks of registered threads
+
+    The thread idles while no profile is active, so the cost is only paid
+    by the requests being profiled.
+    """
+
+    def __init__(self):
+        self._targets: Dict[int, Profile] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+
+    def register(self, thread_id: int, profile: Profile):
+        with self._lock:
+            # A forked pool worker inherits the object but not the thread
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="profile-sampler", daemon=True
+                )
+                self._thread.start()
+            self._targets[thread_id] = profile
+            self._wake.set()
+
+    def unregister(self, thread_id: int):
+        with self._lock:
+            self._targets.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                targets = list(self._targets.items())
+                if not targets:
+                    self._wake.clear()
+            if not targets:
+                self._wake.wait()
+                continue
+
+            frames = sys._current_frames()
+            for thread_id, profile in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.add_frame(frame)
+            del frames
+            time.sleep(min(target.interval for _, target in targets))
+
+
+_sampler = _Sampler()
+
+
+def current_profile() -> Optional[Profile]:
+    """The profile of the request being handled, if it is profiled"""
+    return _active_profile.get()
+
+
+def profiled(fn: Callable) -> Callable:
+    """Wrap ``fn`` to be sampled under the current request's profile
+
+    Use when handing work to another thread; returns ``fn`` unchanged when
+    the request is not profiled.
+    """
+    profile = _active_profile.get()
+    if profile is None:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with profile.sampling():
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+class Profiler:
+    """Decide which requests to profile and keep the most recent profiles
+
+    When enabled, a ``sample_rate`` fraction of requests is always kept. With
+    a ``slow_threshold`` (seconds) every request is sampled, since slowness
+    is only known at the end, and kept if it took at least that long.
+    ``sample_rate`` is capped at ``max_sample_rate``, however it is set.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        sample_rate: float = 0.0,
+        slow_threshold: float = 0.0,
+        interval: float = 0.005,
+        max_profiles: int = 20,
+        max_sample_rate: float = 1.0,
+    ):
+        self.enabled = enabled
+        self.max_sample_rate = max_sample_rate
+        self.sample_rate = min(sample_rate, max_sample_rate)
+        self.slow_threshold = slow_threshold
+        self.interval = interval
+        self.profiles: deque = deque(maxlen=max_profiles)
+        self._lock = threading.Lock()
+
+    def configure(self, **options):
+        """Change settings at runtime; ``max_profiles`` keeps the newest profiles"""
+        with self._lock:
+            max_profiles = options.pop("max_profiles", None)
+            if max_profiles is not None:
+                self.profiles = deque(self.profiles, maxlen=max_profiles)
+            if options.get("sample_rate") is not None:
+                options["sample_rate"] = min(
+                    options["sample_rate"], self.max_sample_rate
+                )
+            for name, value in options.items():
+                if value is not None:
+                    setattr(self, name, value)
+
+    def get_config(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_threshold": self.slow_threshold,
+            "interval": self.interval,
+            "max_profiles": self.profiles.maxlen,
+        }
+
+    def begin(self, name: str) -> Optional[Profile]:
+        """Start profiling a request, or return None if it is not profiled"""
+        if not self.enabled:
+            return None
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and self.slow_threshold <= 0:
+            return None
+        profile = Profile(name, self.interval)
+        profile.reason = "sampled" if sampled else ""
+        return profile
+
+    @contextmanager
+    def activate(self, profile: Optional[Profile]):
+        """Make ``profile`` the current request's profile within the block"""
+        token = _active_profile.set(profile)
+        try:
+            yield profile
+        finally:
+            _active_profile.reset(token)
+
+    def finish(self, profile: Profile, duration: float) -> bool:
+        """Keep the profile if it was sampled or slow; returns whether it was kept"""
+        profile.duration = duration
+        if not profile.reason:
+            if self.slow_threshold <= 0 or duration < self.slow_threshold:
+                return False
+            profile.reason = "slow"
+        with self._lock:
+            self.profiles.append(profile)
+        return True
+
+    def get_profiles(self) -> List[Dict]:
+        with self._lock:
+            return [profile.summary() for profile in reversed(self.profiles)]
+
+    def get_profile(self, profile_id: int) -> Optional[Profile]:
+        with self._lock:
+            for profile in self.profiles:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+
+# Global profiler instance
+profiler = Profiler(
+    enabled=settings.profiler_enabled,
+    sample_rate=settings.profiler_sample_rate,
+    slow_threshold=settings.profiler_slow_threshold,
+    interval=settings.profiler_interval,
+    max_profiles=settings.profiler_max_profiles,
+    max_sample_rate=settings.profiler_max_sample_rate,
+)
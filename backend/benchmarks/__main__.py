@@ -0,0 +1,99 @@
+"""
+Run the pipeline benchmarks and compare them against a stored baseline
+
+    python -m benchmarks --sizes 1000 10000 --output results.json
+    python -m benchmarks --baseline benchmarks/baseline.json --threshold 0.2
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+from benchmarks.suite import FACE_COUNTS, GALLERY_SIZES, compare, run_suite
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description=__doc__.strip().splitlines()[0]
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=list(GALLERY_SIZES),
+        help="Synthetic gallery sizes in encodings",
+    )
+    parser.add_argument(
+        "--faces",
+        type=int,
+        nargs="+",
+        default=list(FACE_COUNTS),
+        help="Faces per synthetic probe image",
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per stage")
+    parser.add_argument("--images", help="Directory of fixture images with real faces")
+    parser.add_argument(
+        "--output", default="benchmark_results.json", help="Where to write results"
+    )
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown before a stage counts as regressed (0.2 = 20%%)",
+    )
+    parser.add_argument(
+        "--metric", default="p95_ms", help="Latency statistic that is compared"
+    )
+    args = parser.parse_args(argv)
+
+    # The service logs every detection and match; keep the output readable
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    results = run_suite(
+        gallery_sizes=args.sizes,
+        face_counts=args.faces,
+        repeat=args.repeat,
+        image_dir=args.images,
+        log=lambda message: print(f"... {message}", file=sys.stderr),
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print(
+        f"{'benchmark':<44} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'per s':>10}"
+    )
+    for name, result in results["results"].items():
+        print(
+            f"{name:<44} {result['p50_ms']:>10.3f} {result['p95_ms']:>10.3f} "
+            f"{result['p99_ms']:>10.3f} {result['throughput']:>10.1f}"
+        )
+    print(f"Results written to {args.output}")
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(results, baseline, args.threshold, args.metric)
+    regressions = [row for row in rows if row["regressed"]]
+    print(
+        f"\nCompared {len(rows)} benchmark(s) on {args.metric} against {args.baseline}"
+    )
+    for row in rows:
+        marker = "REGRESSED" if row["regressed"] else ""
+        print(
+            f"{row['name']:<44} {row['baseline']:>10.3f} -> {row['current']:>10.3f} "
+            f"{row['change']:>+8.1%} {marker}"
+        )
+    if regressions:
+        print(
+            f"{len(regressions)} benchmark(s) slower than the {args.threshold:.0%} threshold"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+Stage-by-stage benchmarks of the recognition pipeline
+"""
+
+import base64
+import contextlib
+import os
+import platform
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from app.config import settings
+from app.services.face_recognition_service import FaceRecognitionService
+from app.services.gallery import ENCODING_DIM
+from app.services.gallery_store import GalleryStore
+
+FaceLocation = Tuple[int, int, int, int]  # (top, right, bottom, left)
+
+GALLERY_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+FACE_COUNTS = (1, 5, 20)
+ENCODINGS_PER_PERSON = 5
+
+# Synthetic probe canvas: faces sit in a grid of fixed-size cells
+CANVAS_SHAPE = (720, 1280)
+FACE_SIZE = 100
+CELL_SIZE = 140
+
+
+def summarize(samples: Sequence[float], items: int = 1) -> Dict[str, float]:
+    """Latency percentiles in milliseconds and throughput in items per second"""
+    seconds = np.asarray(samples, dtype=np.float64)
+    p50, p95, p99 = np.percentile(seconds * 1000, [50, 95, 99])
+    return {
+        "runs": len(seconds),
+        "mean_ms": round(float(seconds.mean() * 1000), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "throughput": round(items * len(seconds) / max(seconds.sum(), 1e-12), 3),
+    }
+
+
+def measure(
+    fn: Callable[[], object], repeat: int, items: int = 1, warmup: int = 1
+) -> Dict[str, float]:
+    """Time ``repeat`` calls of ``fn`` after ``warmup`` untimed ones"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, items)
+
+
+def synthetic_face_locations(faces: int) -> List[FaceLocation]:
+    """Face boxes laid out row by row on the synthetic canvas"""
+    columns = CANVAS_SHAPE[1] // CELL_SIZE
+    locations = []
+    for i in range(faces):
+        top = (i // columns) * CELL_SIZE + (CELL_SIZE - FACE_SIZE) // 2
+        left = (i % columns) * CELL_SIZE + (CELL_SIZE - FACE_SIZE) // 2
+        locations.append((top, left + FACE_SIZE, top + FACE_SIZE, left))
+    return locations
+
+
+def synthetic_image(faces: int, seed: int = 0) -> Tuple[bytes, List[FaceLocation]]:
+    """A JPEG-encoded textured canvas with ``faces`` face-sized blobs
+
+    The blobs are not real faces, so detectors find few or none of them;
+    encoding is benchmarked at the returned locations instead.
+    """
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, (*CANVAS_SHAPE, 3), dtype=np.uint8)
+    image = cv2.GaussianBlur(noise, (0, 0), 3)
+    locations = synthetic_face_locations(faces)
+    for top, right, bottom, left in locations:
+        center = ((left + right) // 2, (top + bottom) // 2)
+        axes = ((right - left) * 2 // 5, (bottom - top) // 2)
+        cv2.ellipse(image, center, axes, 0, 0, 360, (170, 140, 120), -1)
+        for dx in (-axes[0] // 2, axes[0] // 2):
+            cv2.circle(image, (center[0] + dx, center[1] - axes[1] // 4), 6, 40, -1)
+    _, buffer = cv2.imencode(".jpg", image)
+    return buffer.tobytes(), locations
+
+
+def synthetic_encodings(
+    count: int, seed: int = 0, first_row: int = 0
+) -> Tuple[np.ndarray, List[str]]:
+    """Random encodings clustered per person, ``ENCODINGS_PER_PERSON`` each
+
+    Rows are numbered from ``first_row`` so chunks of one gallery continue
+    each other's person numbering.
+    """
+    rng = np.random.default_rng(seed)
+    person = (first_row + np.arange(count)) // ENCODINGS_PER_PERSON
+    local = person - person[0] if count else person
+    centers = rng.normal(0.0, 0.09, (local[-1] + 1 if count else 0, ENCODING_DIM))
+    noise = rng.normal(0.0, 0.02, (count, ENCODING_DIM))
+    encodings = (centers[local] + noise).astype(np.float32)
+    names = [f"person-{p}" for p in person]
+    return encodings, names
+
+
+def fill_gallery(store: GalleryStore, size: int, chunk: int = 100_000) -> int:
+    """Append synthetic encodings until the store holds ``size`` rows"""
+    count = store.manifest["count"] if store.exists else 0
+    while count < size:
+        rows = min(chunk, size - count)
+        encodings, names = synthetic_encodings(rows, seed=count, first_row=count)
+        ids = np.arange(count, count + rows, dtype=np.int64) + 1
+        store.append(encodings, names, ids)
+        count += rows
+    return count
+
+
+@contextlib.contextmanager
+def scratch_directory() -> Iterator[str]:
+    """Run in a temporary working directory so the real face_database is untouched"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="face-bench-") as path:
+        os.chdir(path)
+        try:
+            yield path
+        finally:
+            os.chdir(cwd)
+
+
+def load_fixture_images(image_dir: str) -> List[Tuple[str, bytes]]:
+    """Encoded images from a fixture directory, by file name"""
+    images = []
+    for filename in sorted(os.listdir(image_dir)):
+        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
+            with open(os.path.join(image_dir, filename), "rb") as f:
+                images.append((filename, f.read()))
+    return images
+
+
+def bench_image_stages(
+    service: FaceRecognitionService,
+    label: str,
+    image_bytes: bytes,
+    locations: Optional[List[FaceLocation]],
+    repeat: int,
+) -> Dict[str, Dict]:
+    """Decode, detection and encoding of one probe image
+
+    ``locations`` are the faces to encode; ``None`` encodes whatever the
+    detector finds, as fixture images contain real faces.
+    """
+    image_b64 = "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode()
+    image = service.load_image(image_bytes)
+    detected = service.detect_faces(image)
+    if locations is None:
+        locations = detected
+
+    results = {
+        f"decode_base64/{label}": measure(
+            lambda: service.load_image(image_b64), repeat
+        ),
+        f"decode_jpeg/{label}": measure(
+            lambda: service.load_image(image_bytes), repeat
+        ),
+        f"detect_faces/{label}": measure(lambda: service.detect_faces(image), repeat),
+    }
+    results[f"detect_faces/{label}"]["faces_detected"] = len(detected)
+    if locations:
+        results[f"extract_face_encoding/{label}"] = measure(
+            lambda: service.extract_face_encodings(image, locations),
+            repeat,
+            items=len(locations),
+        )
+    return results
+
+
+def bench_gallery_stages(
+    size: int, face_counts: Sequence[int], repeat: int
+) -> Dict[str, Dict]:
+    """Startup load, matching and enrollment against a gallery of ``size``"""
+    results = {}
+    store = GalleryStore(os.path.join("face_database", "gallery"))
+    fill_gallery(store, size)
+
+    # Cold start: map the store, compute norms and sync the matching index
+    startup = []
+    for _ in range(max(1, min(repeat, 5))):
+        start = time.perf_counter()
+        service = FaceRecognitionService()
+        startup.append(time.perf_counter() - start)
+    results[f"startup_load/{size}"] = summarize(startup)
+
+    for faces in face_counts:
+        probes, _ = synthetic_encodings(faces, seed=size + faces)
+        results[f"match/{size}/{faces}faces"] = measure(
+            lambda: service.match_faces(probes), repeat, items=faces
+        )
+
+    encodings, _ = synthetic_encodings(repeat + 1, seed=size + 1)
+    rows = iter(encodings)
+    results[f"enroll/{size}"] = measure(
+        lambda: service.add_enrollment(next(rows), "benchmark-enrollee"), repeat
+    )
+    return results
+
+
+def run_suite(
+    gallery_sizes: Sequence[int] = GALLERY_SIZES,
+    face_counts: Sequence[int] = FACE_COUNTS,
+    repeat: int = 20,
+    image_dir: Optional[str] = None,
+    log: Callable[[str], None] = lambda message: None,
+) -> Dict:
+    """Benchmark every pipeline stage and return machine-readable results"""
+    results: Dict[str, Dict] = {}
+    with scratch_directory():
+        service = FaceRecognitionService(load_gallery=False)
+        service.warm_up()
+
+        for faces in face_counts:
+            log(f"Image stages with {faces} synthetic face(s)")
+            image_bytes, locations = synthetic_image(faces, seed=faces)
+            results.update(
+                bench_image_stages(
+                    service, f"{faces}faces", image_bytes, locations, repeat
+                )
+            )
+        if image_dir:
+            for filename, image_bytes in load_fixture_images(image_dir):
+                log(f"Image stages for fixture {filename}")
+                results.update(
+                    bench_image_stages(
+                        service, f"fixture:{filename}", image_bytes, None, repeat
+                    )
+                )
+
+        # Galleries grow in place, so sizes run smallest first
+        for size in sorted(gallery_sizes):
+            log(f"Gallery stages with {size} encodings")
+            results.update(bench_gallery_stages(size, face_counts, repeat))
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "detector": settings.face_detection_model,
+            "index_backend": settings.face_index_backend,
+            "quantization": settings.gallery_quantization,
+            "gallery_sizes": sorted(gallery_sizes),
+            "face_counts": list(face_counts),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(
+    current: Dict, baseline: Dict, threshold: float = 0.2, metric: str = "p95_ms"
+) -> List[Dict]:
+    """Compare benchmarks present in both runs
+
+    A benchmark regressed when ``metric`` grew by more than ``threshold``
+    (a fraction, 0.2 = 20% slower) over the baseline.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None or metric not in before or metric not in result:
+            continue
+        change = (result[metric] - before[metric]) / max(before[metric], 1e-9)
+        rows.append(
+            {
+                "name": name,
+                "baseline": before[metric],
+                "current": result[metric],
+                "change": round(change, 4),
+                "regressed": change > threshold,
+            }
+        )
+    return rows
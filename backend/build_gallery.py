@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Build a ready-to-serve face gallery offline from a directory of images
+
+    python build_gallery.py path/to/people --processes 8
+
+Images are laid out one folder per person (``people/alice/1.jpg``); like a
+bulk enrollment archive, nested images belong to their own folder and images
+directly in the root are named after their file. Encodings go to the gallery
+store and rows to ``faces.db`` under ``face_database``, so run this from the
+backend directory and the server picks the result up at startup. Re-running
+skips files whose content was already encoded.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.models.database import Face
+from app.services.database import SessionLocal, encoding_to_blob, init_database
+from app.services.engine import RecognitionEngine
+from app.services.face_recognition_service import FaceRecognitionService
+from app.utils.archive import IMAGE_EXTENSIONS, person_name
+
+MANIFEST_FILENAME = "gallery_build.json"
+MANIFEST_VERSION = 1
+
+# (path relative to the image root, absolute path, person name)
+ImageFile = Tuple[str, str, str]
+
+
+def iter_image_files(image_dir: str) -> Iterator[ImageFile]:
+    """Walk the tree in a stable order, skipping hidden files and folders"""
+    for root, dirs, files in os.walk(image_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for filename in sorted(files):
+            if filename.startswith(".") or not filename.lower().endswith(
+                IMAGE_EXTENSIONS
+            ):
+                continue
+            path = os.path.join(root, filename)
+            relative = os.path.relpath(path, image_dir).replace(os.sep, "/")
+            yield relative, path, person_name(relative)
+
+
+def load_manifest(path: str) -> Dict[str, Dict]:
+    """Content hash -> outcome of every file a previous build processed"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported build manifest version in {path}")
+    return manifest["files"]
+
+
+def save_manifest(path: str, files: Dict[str, Dict]):
+    # Write-then-rename so an interrupted build never leaves a torn manifest
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, f)
+    os.replace(temp_path, path)
+
+
+def _completed(files: Dict[str, Dict], session_factory, retry_failed: bool) -> set:
+    """Hashes to skip: enrolled files whose face still exists, and failures"""
+    db = session_factory()
+    try:
+        face_ids = {face_id for (face_id,) in db.query(Face.id)}
+    finally:
+        db.close()
+    done = set()
+    for digest, outcome in files.items():
+        if outcome.get("face_id") is not None:
+            if outcome["face_id"] in face_ids:
+                done.add(digest)
+        elif not retry_failed:
+            done.add(digest)
+    return done
+
+
+def _commit_faces(
+    service: FaceRecognitionService, session_factory, faces: List[Face]
+) -> List[int]:
+    """Insert the chunk's rows in one transaction and return their ids"""
+    db = session_factory()
+    try:
+        db.add_all(faces)
+        db.flush()
+        face_ids = [face.id for face in faces]
+        db.commit()
+        return face_ids
+    except Exception:
+        db.rollback()
+        service.undo_enrollments(
+            [face.encoding_path for face in faces],
+            [face.image_path for face in faces],
+        )
+        raise
+    finally:
+        db.close()
+
+
+async def _build_chunk(
+    engine: RecognitionEngine,
+    session_factory,
+    chunk: List[ImageFile],
+    files: Dict[str, Dict],
+    done: set,
+    detector: Optional[str],
+) -> Dict[str, int]:
+    """Encode one chunk with one gallery write and one database transaction"""
+    counts = {"enrolled": 0, "skipped": 0, "failed": 0}
+    submitted: List[Tuple[str, str, str]] = []  # (relative path, name, digest)
+
+    async def images():
+        for relative, path, name in chunk:
+            with open(path, "rb") as f:
+                image_data = f.read()
+            digest = hashlib.sha256(image_data).hexdigest()
+            if digest in done:
+                counts["skipped"] += 1
+                continue
+            # Copies of one image within the tree are only encoded once
+            done.add(digest)
+            submitted.append((relative, name, digest))
+            yield name, image_data
+
+    outcomes = await engine.enroll_many(images(), detector)
+
+    enrolled = []
+    for (relative, name, digest), (encoding_path, encoding, image_path, error) in zip(
+        submitted, outcomes
+    ):
+        if error is not None:
+            files[digest] = {"source": relative, "error": error}
+            counts["failed"] += 1
+            continue
+        face = Face(
+            name=name,
+            image_path=image_path,
+            encoding_path=encoding_path,
+            encoding=encoding_to_blob(encoding),
+        )
+        enrolled.append((relative, digest, face))
+
+    if enrolled:
+        face_ids = _commit_faces(
+            engine.service, session_factory, [face for _, _, face in enrolled]
+        )
+        for (relative, digest, _), face_id in zip(enrolled, face_ids):
+            files[digest] = {"source": relative, "face_id": face_id}
+    counts["enrolled"] = len(enrolled)
+    return counts
+
+
+def build_gallery(
+    image_dir: str,
+    engine: RecognitionEngine,
+    session_factory,
+    manifest_path: str,
+    chunk_size: int = 256,
+    detector: Optional[str] = None,
+    retry_failed: bool = False,
+    log: Callable[[str], None] = lambda message: None,
+) -> Dict:
+    """Encode every new image under ``image_dir`` into the gallery
+
+    Work is checkpointed per chunk: the gallery store, the database and the
+    manifest are all updated before the next chunk starts, so an interrupted
+    build resumes where it stopped. Returns counts and throughput.
+    """
+    image_files = list(iter_image_files(image_dir))
+    files = load_manifest(manifest_path)
+    done = _completed(files, session_factory, retry_failed)
+    totals = {"files": len(image_files), "enrolled": 0, "skipped": 0, "failed": 0}
+
+    start_time = time.perf_counter()
+    for offset in range(0, len(image_files), chunk_size):
+        chunk = image_files[offset : offset + chunk_size]
+        counts = asyncio.run(
+            _build_chunk(engine, session_factory, chunk, files, done, detector)
+        )
+        save_manifest(manifest_path, files)
+        for key, count in counts.items():
+            totals[key] += count
+
+        elapsed = time.perf_counter() - start_time
+        encoded = totals["enrolled"] + totals["failed"]
+        log(
+            f"[{offset + len(chunk)}/{len(image_files)}] "
+            f"enrolled {totals['enrolled']}, skipped {totals['skipped']}, "
+            f"failed {totals['failed']} ({encoded / max(elapsed, 1e-9):.1f} images/s)"
+        )
+
+    # Persist a trained index so the server does not retrain it at startup
+    engine.service.index.save()
+
+    elapsed = time.perf_counter() - start_time
+    encoded = totals["enrolled"] + totals["failed"]
+    totals["seconds"] = round(elapsed, 3)
+    totals["images_per_second"] = round(encoded / max(elapsed, 1e-9), 3)
+    return totals
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("image_dir", help="Directory with one folder per person")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Encoding worker processes (default: one per CPU core)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=256,
+        help="Images per checkpoint (one gallery write and transaction each)",
+    )
+    parser.add_argument("--detector", help="Face detector backend (default: config)")
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Retry images a previous build could not enroll",
+    )
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.image_dir):
+        print(f"✗ Not a directory: {args.image_dir}", file=sys.stderr)
+        return 1
+
+    # The service logs every enrollment; keep the progress output readable
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    init_database()
+    service = FaceRecognitionService()
+    engine = RecognitionEngine(service, args.processes)
+    try:
+        summary = build_gallery(
+            args.image_dir,
+            engine,
+            SessionLocal,
+            os.path.join(service.face_database_path, MANIFEST_FILENAME),
+            chunk_size=args.chunk_size,
+            detector=args.detector,
+            retry_failed=args.retry_failed,
+            log=lambda message: print(message, file=sys.stderr),
+        )
+    finally:
+        engine.shutdown()
+
+    print(
+        f"✓ {summary['files']} file(s): {summary['enrolled']} enrolled, "
+        f"{summary['skipped']} skipped, {summary['failed']} failed"
+    )
+    print(
+        f"  {summary['seconds']:.1f}s, {summary['images_per_second']:.1f} images/s "
+        f"with {args.processes} process(es)"
+    )
+    print(f"  Gallery now holds {len(service.gallery)} encoding(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,10 +7,13 @@ import os
 import shutil
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.main import app
 from app.models.database import Base
-from app.services.database import get_database
+from app.services.database import get_async_database
+from app.services.readiness import services
 
 # Test database
 TEST_DATABASE_URL = "sqlite:///./test_face_database.db"
@@ -18,15 +21,20 @@ TEST_FACE_DATABASE_PATH = "test_face_database"
 
 engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# The routes use the async layer; each test client runs its own event loop, so
+# connections are not pooled across tests
+async_engine = create_async_engine(
+    TEST_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://"), poolclass=NullPool
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
 
 
-def override_get_database():
+async def override_get_database():
     """Override database for testing"""
-    try:
-        db = TestingSessionLocal()
+    async with TestingAsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 @pytest.fixture(scope="function")
@@ -53,8 +61,10 @@ def test_db():
 @pytest.fixture(scope="function")
 def client(test_db):
     """Create test client"""
-    app.dependency_overrides[get_database] = override_get_database
+    app.dependency_overrides[get_async_database] = override_get_database
     with TestClient(app) as test_client:
+        # The service loads in the background after startup
+        assert services.wait(timeout=120), services.get_status()
         yield test_client
     app.dependency_overrides.clear()
 
@@ -2,6 +2,8 @@
 Tests for API endpoints
 """
 
+import base64
+
 import pytest
 from fastapi.testclient import TestClient
 
@@ -26,6 +28,30 @@ def test_health_check(client):
     assert "service" in data
 
 
+def test_readiness_check(client):
+    """Test the readiness probe once the service has loaded"""
+    response = client.get("/ready")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["ready"] is True
+    assert data["stage"] == "ready"
+    assert "loading_gallery" in data["stage_seconds"]
+    assert data["encodings_loaded"] == 0
+
+
+def test_api_gated_until_ready(client, monkeypatch):
+    """Test API requests are refused while the service is loading"""
+    from app.services.readiness import services
+
+    monkeypatch.setattr(services, "stage", "loading_gallery")
+    response = client.get("/api/faces/count")
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    assert client.get("/ready").status_code == 503
+    assert client.get("/health").status_code == 200
+    assert client.get("/api/metrics").status_code == 200
+
+
 def test_get_faces_count_empty(client):
     """Test getting faces count when database is empty"""
     response = client.get("/api/faces/count")
@@ -43,6 +69,30 @@ def test_get_all_faces_empty(client):
     assert len(data) == 0
 
 
+def test_get_all_faces_paginated(client, test_db):
+    """Test keyset pages, name prefixes, the export and the maintained count"""
+    from app.models.database import Face
+
+    names = ["alice", "bob", "alicia", "carol", "albert"]
+    test_db.add_all([Face(name=n, image_path="", encoding_path="") for n in names])
+    test_db.commit()
+
+    first = client.get("/api/faces/", params={"limit": 2}).json()
+    rest = client.get(
+        "/api/faces/", params={"limit": 10, "after_id": first[-1]["id"]}
+    ).json()
+    assert [face["name"] for face in first + rest] == names
+
+    response = client.get("/api/faces/", params={"name_prefix": "al"})
+    assert [face["name"] for face in response.json()] == ["alice", "alicia", "albert"]
+    assert client.get("/api/faces/", params={"limit": 0}).status_code == 422
+
+    response = client.get("/api/faces/export")
+    assert response.status_code == 200
+    assert response.json() == first + rest
+    assert client.get("/api/faces/count").json()["total_faces"] == 5
+
+
 def test_enroll_face_no_image(client):
     """Test enrollment without image"""
     response = client.post(
@@ -65,6 +115,228 @@ def test_recognize_face_no_image(client):
     assert response.status_code in [400, 422, 500]
 
 
+def test_recognize_face_upload(client, sample_face_image):
+    """Test recognition from a multipart image upload"""
+    image_bytes = base64.b64decode(sample_face_image.split(",")[1])
+    response = client.post(
+        "/api/faces/recognize/upload",
+        files={"image": ("blank.jpg", image_bytes, "image/jpeg")},
+    )
+    assert response.status_code == 200
+    assert response.json()["faces_detected"] == 0
+
+
+def test_recognize_face_raw(client, sample_face_image):
+    """Test recognition from a raw octet-stream body"""
+    image_bytes = base64.b64decode(sample_face_image.split(",")[1])
+    response = client.post(
+        "/api/faces/recognize/raw",
+        content=image_bytes,
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    assert response.status_code == 200
+    assert response.json()["faces_detected"] == 0
+
+
+def test_recognize_face_detector_selection(client, sample_face_image):
+    """Test choosing the detector backend per request"""
+    response = client.post(
+        "/api/faces/recognize",
+        json={"image_data": sample_face_image, "detector": "haar"},
+    )
+    assert response.status_code == 200
+    assert response.json()["faces_detected"] == 0
+    assert "haar" in client.get("/api/metrics").json()["detection_times"]
+
+    response = client.post(
+        "/api/faces/recognize",
+        json={"image_data": sample_face_image, "detector": "unknown"},
+    )
+    assert response.status_code == 400
+
+
+def test_recognize_face_resubmission_cached(client, sample_face_image):
+    """Test resubmitting an image is served from the probe cache"""
+    before = client.get("/api/metrics").json()["probe_cache"]
+    for _ in range(2):
+        response = client.post(
+            "/api/faces/recognize", json={"image_data": sample_face_image}
+        )
+        assert response.status_code == 200
+    after = client.get("/api/metrics").json()["probe_cache"]
+    assert after["hits"] >= before["hits"] + 1
+
+
+def test_enroll_face_raw_no_face(client, sample_face_image):
+    """Test raw enrollment of an image without a face is rejected"""
+    image_bytes = base64.b64decode(sample_face_image.split(",")[1])
+    response = client.post(
+        "/api/faces/enroll/raw?name=Test%20User",
+        content=image_bytes,
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    assert response.status_code == 200
+    assert response.json()["success"] is False
+
+
+def test_recognize_batch(client, sample_face_image):
+    """Test batch recognition returns per-image results and stage timings"""
+    response = client.post(
+        "/api/faces/recognize/batch",
+        json={"images": [sample_face_image, sample_face_image, "invalid_base64"]},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["images"]) == 3
+    assert data["faces_detected"] == 0
+    assert data["images"][0]["error"] is None
+    assert data["images"][2]["error"]
+    assert set(data["timings"]) == {"analyze", "detection", "match", "total"}
+
+
+def test_recognize_batch_upload(client, sample_face_image):
+    """Test batch recognition from multipart image uploads"""
+    image_bytes = base64.b64decode(sample_face_image.split(",")[1])
+    response = client.post(
+        "/api/faces/recognize/batch/upload",
+        files=[("images", (f"{i}.jpg", image_bytes, "image/jpeg")) for i in range(2)],
+    )
+    assert response.status_code == 200
+    assert len(response.json()["images"]) == 2
+
+
+def test_recognize_batch_empty(client):
+    """Test batch recognition without images is rejected"""
+    response = client.post("/api/faces/recognize/batch", json={"images": []})
+    assert response.status_code == 400
+
+
+def test_recognize_stream(client, sample_face_image):
+    """Test streaming recognition pushes a result per processed frame"""
+    image_bytes = base64.b64decode(sample_face_image.split(",")[1])
+    with client.websocket_connect("/api/faces/stream") as websocket:
+        websocket.send_bytes(image_bytes)
+        data = websocket.receive_json()
+    assert data["frame"] == 1
+    assert data["faces_detected"] == 0
+    assert data["faces_encoded"] == 0
+    assert data["results"] == []
+
+
+def test_prometheus_metrics(client, sample_face_image):
+    """Test the Prometheus endpoint exposes stage histograms and gallery gauges"""
+    client.post("/api/faces/recognize", json={"image_data": sample_face_image})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert "# TYPE face_api_stage_duration_seconds histogram" in text
+    assert 'face_api_stage_duration_seconds_bucket{stage="match",le="+Inf"}' in text
+    assert "face_api_gallery_encodings 0" in text
+    assert "face_api_service_ready 1" in text
+
+
+def test_profiler_admin(client, sample_face_image, monkeypatch):
+    """Test profiles of requests can be captured and downloaded"""
+    from app.config import settings
+
+    assert client.get("/api/admin/profiler").status_code == 404
+    monkeypatch.setattr(settings, "admin_endpoints_enabled", True)
+
+    original = client.get("/api/admin/profiler").json()
+    try:
+        # Every request is kept as slow, since the sample rate is capped
+        response = client.put(
+            "/api/admin/profiler",
+            json={
+                "enabled": True,
+                "sample_rate": 1.0,
+                "slow_threshold": 1e-6,
+                "interval": 0.001,
+            },
+        )
+        assert response.json()["enabled"] is True
+        assert response.json()["sample_rate"] == settings.profiler_max_sample_rate
+
+        response = client.post(
+            "/api/faces/recognize", json={"image_data": sample_face_image}
+        )
+        profile_id = int(response.headers["X-Profile-Id"])
+
+        profiles = client.get("/api/admin/profiles").json()
+        assert profiles[0]["id"] == profile_id
+        assert profiles[0]["name"] == "POST /api/faces/recognize"
+
+        document = client.get(f"/api/admin/profiles/{profile_id}").json()
+        assert document["profiles"][0]["type"] == "sampled"
+        response = client.get(
+            f"/api/admin/profiles/{profile_id}", params={"format": "collapsed"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert client.get("/api/admin/profiles/0").status_code == 404
+    finally:
+        client.put("/api/admin/profiler", json=original)
+
+
+def test_enroll_bulk_archive(client, sample_face_image):
+    """Test bulk enrollment reports every archive entry"""
+    import io
+    import zipfile
+
+    image_bytes = base64.b64decode(sample_face_image.split(",")[1])
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("alice/1.jpg", image_bytes)
+        archive.writestr("bob.jpg", image_bytes)
+        archive.writestr("readme.txt", b"ignored")
+    response = client.post(
+        "/api/faces/enroll/bulk",
+        files={"archive": ("faces.zip", buffer.getvalue(), "application/zip")},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["total"], data["enrolled"], data["failed"]) == (2, 0, 2)
+    assert [item["name"] for item in data["items"]] == ["alice", "bob"]
+    assert data["items"][0]["source"] == "alice/1.jpg"
+    assert data["items"][0]["message"] == "No face detected in the image"
+
+
+def test_enroll_bulk_pairs(client, sample_face_image):
+    """Test bulk enrollment from multipart (name, image) pairs"""
+    image_bytes = base64.b64decode(sample_face_image.split(",")[1])
+    response = client.post(
+        "/api/faces/enroll/bulk",
+        data={"names": ["alice", "bob"]},
+        files=[
+            ("images", ("a.jpg", image_bytes, "image/jpeg")),
+            ("images", ("b.jpg", image_bytes, "image/jpeg")),
+        ],
+    )
+    assert response.status_code == 200
+    assert [item["name"] for item in response.json()["items"]] == ["alice", "bob"]
+
+    response = client.post(
+        "/api/faces/enroll/bulk",
+        data={"names": ["alice"]},
+        files=[
+            ("images", ("a.jpg", image_bytes, "image/jpeg")),
+            ("images", ("b.jpg", image_bytes, "image/jpeg")),
+        ],
+    )
+    assert response.status_code == 400
+
+
+def test_enroll_bulk_invalid_archive(client):
+    """Test an unsupported archive is rejected"""
+    response = client.post(
+        "/api/faces/enroll/bulk",
+        files={"archive": ("faces.rar", b"not an archive", "application/x-rar")},
+    )
+    assert response.status_code == 400
+    assert client.post("/api/faces/enroll/bulk").status_code == 400
+
+
 def test_delete_nonexistent_face(client):
     """Test deleting a face that doesn't exist"""
     response = client.delete("/api/faces/999999")
@@ -77,3 +349,48 @@ def test_api_cors_headers(client):
     assert (
         "access-control-allow-origin" in response.headers or response.status_code == 200
     )
+
+
+def test_enroll_undoes_gallery_write_when_commit_fails(tmp_path, monkeypatch):
+    """Test a failed database commit removes the new encoding and image"""
+    import asyncio
+
+    import numpy as np
+    from fastapi import HTTPException
+
+    from app.routers.face_recognition import _enroll
+    from app.services.engine import RecognitionEngine
+    from app.services.face_recognition_service import FaceRecognitionService
+    from app.services.readiness import services
+
+    monkeypatch.chdir(tmp_path)
+    service = FaceRecognitionService()
+    engine = RecognitionEngine(service, processes=0)
+    image_path = tmp_path / "ghost.jpg"
+    image_path.write_bytes(b"image")
+
+    async def enroll(image_data, name, detector=None):
+        (encoding_path,) = service.add_enrollments(np.full((1, 128), 0.1), [name])
+        return True, "enrolled", encoding_path, str(image_path)
+
+    class FailingSession:
+        def add(self, face):
+            pass
+
+        async def commit(self):
+            raise RuntimeError("disk I/O error")
+
+        async def rollback(self):
+            pass
+
+    monkeypatch.setattr(engine, "enroll", enroll)
+    monkeypatch.setattr(services, "get_service", lambda: service)
+    monkeypatch.setattr(services, "get_engine", lambda: engine)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(_enroll(b"image", "ghost", FailingSession()))
+    assert error.value.status_code == 500
+    if service._compaction is not None:
+        service._compaction.join()  # Finish before the working directory resets
+    assert len(service.refresh_gallery()) == 0
+    assert not image_path.exists()
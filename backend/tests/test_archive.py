@@ -0,0 +1,62 @@
+"""
+Tests for streaming image archive readers
+"""
+
+import io
+import tarfile
+import zipfile
+
+import pytest
+from app.utils.archive import iter_archive_images, person_name
+
+
+def _zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def _tar(entries, mode="w:gz"):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, data in entries.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+
+def test_person_name():
+    """Test images are named after their directory or file name"""
+    assert person_name("alice/1.jpg") == "alice"
+    assert person_name("staff/bob/2.png") == "bob"
+    assert person_name("carol.jpeg") == "carol"
+
+
+@pytest.mark.parametrize("make_archive", [_zip, _tar])
+def test_iter_archive_images(make_archive):
+    """Test only image entries are yielded and oversized ones are reported"""
+    archive = make_archive(
+        {
+            "alice/1.jpg": b"a" * 10,
+            "bob.png": b"b" * 100,
+            "notes.txt": b"skip",
+            "__MACOSX/._alice.jpg": b"skip",
+            ".hidden/x.jpg": b"skip",
+        }
+    )
+    entries = list(iter_archive_images(archive, max_bytes=50))
+    assert entries == [
+        ("alice/1.jpg", b"a" * 10, None),
+        ("bob.png", None, "Image larger than 50 bytes"),
+    ]
+
+
+def test_iter_archive_images_unsupported():
+    """Test anything but zip or tar is rejected"""
+    with pytest.raises(ValueError):
+        list(iter_archive_images(io.BytesIO(b"not an archive"), max_bytes=50))
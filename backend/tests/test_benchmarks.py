@@ -0,0 +1,60 @@
+"""
+Tests for the benchmark suite helpers
+"""
+
+import os
+
+import pytest
+from benchmarks.suite import (
+    compare,
+    fill_gallery,
+    scratch_directory,
+    summarize,
+    synthetic_face_locations,
+)
+from app.services.gallery_store import GalleryStore
+
+
+def test_summarize_percentiles():
+    """Test latency percentiles and throughput of timing samples"""
+    summary = summarize([0.001 * i for i in range(1, 101)], items=2)
+    assert summary["runs"] == 100
+    assert summary["p50_ms"] == pytest.approx(50.5)
+    assert summary["p95_ms"] == pytest.approx(95.05)
+    assert summary["p99_ms"] == pytest.approx(99.01)
+    assert summary["throughput"] == pytest.approx(200 / 5.05, rel=1e-3)
+
+
+def test_compare_flags_regressions():
+    """Test only stages slower than the threshold count as regressed"""
+    baseline = {"results": {"a": {"p95_ms": 10.0}, "b": {"p95_ms": 10.0}}}
+    current = {
+        "results": {"a": {"p95_ms": 11.0}, "b": {"p95_ms": 13.0}, "c": {"p95_ms": 1.0}}
+    }
+    rows = {row["name"]: row for row in compare(current, baseline, threshold=0.2)}
+    assert set(rows) == {"a", "b"}
+    assert not rows["a"]["regressed"]
+    assert rows["b"]["regressed"]
+    assert rows["b"]["change"] == pytest.approx(0.3)
+
+
+def test_synthetic_faces_fit_the_canvas():
+    """Test synthetic face boxes do not overlap or leave the canvas"""
+    locations = synthetic_face_locations(20)
+    assert len(set(locations)) == 20
+    for top, right, bottom, left in locations:
+        assert 0 <= top < bottom <= 720 and 0 <= left < right <= 1280
+
+
+def test_fill_gallery_grows_in_place():
+    """Test synthetic galleries are topped up to the requested size"""
+    cwd = os.getcwd()
+    with scratch_directory():
+        store = GalleryStore(os.path.join("face_database", "gallery"))
+        assert fill_gallery(store, 12) == 12
+        assert fill_gallery(store, 30, chunk=7) == 30
+        gallery = store.load()
+        assert len(gallery) == 30
+        assert gallery.person_count == 6
+        assert len(set(gallery.ids.tolist())) == 30
+    assert os.getcwd() == cwd
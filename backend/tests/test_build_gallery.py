@@ -0,0 +1,126 @@
+"""
+Tests for the offline gallery build
+"""
+
+import os
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base, Face
+from app.services.engine import RecognitionEngine
+from app.services.face_recognition_service import FaceRecognitionService
+from build_gallery import MANIFEST_FILENAME, build_gallery, iter_image_files
+
+
+@pytest.fixture
+def image_tree(tmp_path):
+    """Two people in folders, one loose image, and files that are skipped"""
+    root = tmp_path / "people"
+    for relative, content in {
+        "alice/1.jpg": b"alice-1",
+        "alice/2.jpg": b"alice-2",
+        "bob/1.png": b"bob-1",
+        "bob/copy.png": b"bob-1",
+        "carol.jpg": b"carol",
+        "bob/notes.txt": b"not an image",
+        ".hidden/1.jpg": b"hidden",
+        "broken/1.jpg": b"no-face",
+    }.items():
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return str(root)
+
+
+@pytest.fixture
+def builder(tmp_path, monkeypatch):
+    """A threads-only engine whose encoder hashes the image bytes"""
+    monkeypatch.chdir(tmp_path)
+    db_engine = create_engine(f"sqlite:///{tmp_path / 'faces.db'}")
+    Base.metadata.create_all(bind=db_engine)
+    session_factory = sessionmaker(bind=db_engine)
+
+    service = FaceRecognitionService()
+    calls = []
+
+    def prepare_enrollment(image_data, name, detector=None):
+        calls.append(image_data)
+        if image_data == b"no-face":
+            return None, None, "No face detected in the image"
+        seed = int.from_bytes(image_data[:4].ljust(4, b"\0"), "little")
+        encoding = np.random.default_rng(seed).normal(0, 0.1, 128)
+        return encoding, f"face_database/uploads/{name}.jpg", None
+
+    service.prepare_enrollment = prepare_enrollment
+    engine = RecognitionEngine(service, processes=0)
+    manifest = os.path.join(service.face_database_path, MANIFEST_FILENAME)
+    return engine, session_factory, manifest, calls
+
+
+def test_iter_image_files_names_people_by_folder(image_tree):
+    """Test the image's folder names the person and non-images are skipped"""
+    nested = os.path.join(image_tree, "staff", "dave")
+    os.makedirs(nested)
+    with open(os.path.join(nested, "1.jpg"), "wb") as f:
+        f.write(b"dave-1")
+
+    files = {relative: name for relative, _, name in iter_image_files(image_tree)}
+    assert files == {
+        "alice/1.jpg": "alice",
+        "alice/2.jpg": "alice",
+        "bob/1.png": "bob",
+        "bob/copy.png": "bob",
+        "broken/1.jpg": "broken",
+        "carol.jpg": "carol",
+        "staff/dave/1.jpg": "dave",
+    }
+
+
+def test_build_gallery_writes_store_and_database(image_tree, builder):
+    """Test a build enrolls every face into both the gallery and faces.db"""
+    engine, session_factory, manifest, calls = builder
+    summary = build_gallery(image_tree, engine, session_factory, manifest, 2)
+
+    assert summary["files"] == 6
+    assert summary["enrolled"] == 4
+    assert summary["skipped"] == 1  # bob/copy.png has the same content
+    assert summary["failed"] == 1
+    assert len(calls) == 5
+
+    db = session_factory()
+    faces = db.query(Face).order_by(Face.id).all()
+    db.close()
+    assert sorted(face.name for face in faces) == ["alice", "alice", "bob", "carol"]
+    assert all(len(face.encoding) == 128 * 4 for face in faces)
+    gallery = engine.service.gallery
+    assert len(gallery) == 4
+    assert gallery.person_count == 3
+
+
+def test_build_gallery_resumes(image_tree, builder):
+    """Test a second run skips encoded files and picks up new or deleted ones"""
+    engine, session_factory, manifest, calls = builder
+    build_gallery(image_tree, engine, session_factory, manifest)
+    calls.clear()
+
+    with open(os.path.join(image_tree, "alice", "3.jpg"), "wb") as f:
+        f.write(b"alice-3")
+    db = session_factory()
+    db.query(Face).filter(Face.name == "carol").delete()
+    db.commit()
+    db.close()
+
+    summary = build_gallery(image_tree, engine, session_factory, manifest)
+    assert sorted(calls) == [b"alice-3", b"carol"]
+    assert summary["enrolled"] == 2
+    assert summary["skipped"] == 5
+
+    calls.clear()
+    summary = build_gallery(
+        image_tree, engine, session_factory, manifest, retry_failed=True
+    )
+    assert calls == [b"no-face"]
+    assert summary["failed"] == 1
@@ -0,0 +1,203 @@
+"""
+Tests for the database layer and gallery reconciliation
+"""
+
+import asyncio
+
+import numpy as np
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base, Face
+from app.services.database import (
+    count_faces,
+    create_async_database_engine,
+    create_database_engine,
+    encoding_to_blob,
+    iter_faces,
+    list_faces,
+    load_face_encodings,
+    migrate_schema,
+)
+from app.services.face_recognition_service import FaceRecognitionService
+from app.services.readiness import ServiceLoader
+
+
+def _session_factory(tmp_path):
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'faces.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def test_sqlite_pragmas_applied(tmp_path):
+    """Test every connection runs in WAL mode with the tuned pragmas"""
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'faces.db'}")
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+
+
+def test_migrate_schema_adds_encoding_column(tmp_path):
+    """Test databases created before the encoding column gain it"""
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'faces.db'}")
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE faces (id INTEGER PRIMARY KEY, name VARCHAR(100), "
+                "image_path VARCHAR(255), encoding_path VARCHAR(255), "
+                "created_at DATETIME)"
+            )
+        )
+    migrate_schema(engine)
+    migrate_schema(engine)
+    columns = {column["name"] for column in inspect(engine).get_columns("faces")}
+    assert "encoding" in columns
+    indexes = {index["name"] for index in inspect(engine).get_indexes("faces")}
+    assert "ix_faces_name" in indexes
+
+
+def test_face_counter_follows_inserts_and_deletes(tmp_path):
+    """Test the counter row is seeded from existing faces and kept current"""
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'faces.db'}")
+    Face.__table__.create(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            Face.__table__.insert(),
+            [{"name": n, "image_path": "", "encoding_path": ""} for n in "ab"],
+        )
+    # A later startup installs the counter on the existing database
+    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    assert count_faces(db) == 2
+
+    db.add_all([Face(name=n, image_path="", encoding_path="") for n in "cde"])
+    db.commit()
+    db.query(Face).filter(Face.name.in_(["a", "c"])).delete()
+    db.commit()
+    assert count_faces(db) == db.query(Face).count() == 3
+    db.close()
+
+
+def test_list_faces_pages_by_id_and_prefix(tmp_path):
+    """Test keyset pages cover every face once and prefixes filter by name"""
+    db = _session_factory(tmp_path)()
+    names = ["alice", "bob", "alicia", "al", "albert", "carol", "Alice"]
+    db.add_all([Face(name=n, image_path="", encoding_path="") for n in names])
+    db.commit()
+
+    first = list_faces(db, limit=3)
+    second = list_faces(db, after_id=first[-1].id, limit=3)
+    third = list_faces(db, after_id=second[-1].id, limit=3)
+    assert [face.name for face in first + second + third] == names
+    assert len(third) == 1
+    assert not hasattr(first[0], "encoding")
+
+    assert [face.name for face in list_faces(db, name_prefix="ali")] == [
+        "alice",
+        "alicia",
+    ]
+    db.close()
+
+
+def test_async_engine_pools_and_pages(tmp_path):
+    """Test the async layer keeps tuned connections and streams keyset pages"""
+    url = f"sqlite:///{tmp_path / 'faces.db'}"
+    db = _session_factory(tmp_path)()
+    names = ["alice", "bob", "alicia", "al", "albert"]
+    db.add_all([Face(name=n, image_path="", encoding_path="") for n in names])
+    db.commit()
+    db.close()
+
+    async def run():
+        engine = create_async_database_engine(url)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        try:
+            async with session_factory() as db:
+                mode = (await db.execute(text("PRAGMA journal_mode"))).scalar()
+                count = await db.run_sync(count_faces)
+                pages = [page async for page in iter_faces(db, "al", batch_size=2)]
+            # The connection went back to the pool instead of being closed
+            assert engine.pool.checkedin() == 1
+            return mode, count, pages
+        finally:
+            await engine.dispose()
+
+    mode, count, pages = asyncio.run(run())
+    assert mode == "wal"
+    assert count == 5
+    assert [len(page) for page in pages] == [2, 2]
+    assert [face.name for page in pages for face in page] == [
+        "alice",
+        "alicia",
+        "al",
+        "albert",
+    ]
+
+
+def test_load_face_encodings_streams_in_id_order(tmp_path):
+    """Test stored encodings load into one array, skipping rows without one"""
+    db = _session_factory(tmp_path)()
+    encodings = np.random.default_rng(0).normal(size=(3, 128)).astype(np.float32)
+    db.add_all(
+        [
+            Face(
+                name="a",
+                image_path="a.jpg",
+                encoding_path="gallery:1",
+                encoding=encoding_to_blob(encodings[0]),
+            ),
+            Face(name="b", image_path="b.jpg", encoding_path="gallery:2"),
+            Face(
+                name="c",
+                image_path="c.jpg",
+                encoding_path="gallery:3",
+                encoding=encoding_to_blob(encodings[2]),
+            ),
+        ]
+    )
+    db.commit()
+
+    loaded, names, encoding_paths = load_face_encodings(db)
+    db.close()
+    assert names == ["a", "c"]
+    assert encoding_paths == ["gallery:1", "gallery:3"]
+    np.testing.assert_array_equal(loaded, encodings[[0, 2]])
+
+
+def test_sync_database_backfills_and_restores(tmp_path, monkeypatch):
+    """Test rows gain their BLOB and a lost gallery store is rebuilt from them"""
+    monkeypatch.chdir(tmp_path)
+    session_factory = _session_factory(tmp_path)
+    service = FaceRecognitionService()
+    encodings = np.random.default_rng(1).normal(size=(2, 128)).astype(np.float32)
+    paths = service.add_enrollments(encodings, ["alice", "bob"])
+
+    db = session_factory()
+    db.add_all(
+        [
+            Face(name=name, image_path=f"{name}.jpg", encoding_path=path)
+            for name, path in zip(["alice", "bob"], paths)
+        ]
+    )
+    db.commit()
+    db.close()
+
+    loader = ServiceLoader(session_factory)
+    loader.sync_database(service)
+    db = session_factory()
+    assert all(face.encoding is not None for face in db.query(Face))
+    db.close()
+
+    # Losing the store only loses the serving copy
+    service.remove_enrollments(paths)
+    service.store.compact()
+    service.gallery = service.store.load()
+    assert len(service.gallery) == 0
+    loader.sync_database(service)
+    assert service.gallery.encoding_counts() == {"alice": 1, "bob": 1}
+    restored, found = service.get_encodings(paths)
+    assert found.all()
+    np.testing.assert_array_equal(restored, encodings)
@@ -0,0 +1,35 @@
+"""
+Tests for the face detector backends
+"""
+
+import numpy as np
+import pytest
+from app.services.face_detectors import (
+    DETECTOR_BACKENDS,
+    DNNDetector,
+    HaarDetector,
+    create_detector,
+)
+
+
+def test_create_detector_backends():
+    """Test every configurable backend name maps to a detector"""
+    for backend in ("hog", "cnn", "haar"):
+        assert create_detector(backend).name == backend
+    assert set(DETECTOR_BACKENDS) == {"hog", "cnn", "haar", "dnn"}
+    with pytest.raises(ValueError):
+        create_detector("unknown")
+
+
+def test_haar_detector_blank_image():
+    """Test the Haar cascade finds nothing in a blank image"""
+    detector = HaarDetector()
+    assert detector.detect(np.full((120, 160, 3), 255, dtype=np.uint8)) == []
+
+
+def test_dnn_detector_requires_model_files(tmp_path):
+    """Test the DNN detector reports missing model files"""
+    with pytest.raises(FileNotFoundError):
+        DNNDetector(
+            str(tmp_path / "deploy.prototxt"), str(tmp_path / "res10.caffemodel")
+        )
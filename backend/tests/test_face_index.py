@@ -0,0 +1,87 @@
+"""
+Tests for gallery matching indexes
+"""
+
+import os
+
+import numpy as np
+from app.services.face_index import ExactIndex, IVFIndex, create_index
+from app.services.gallery import FaceGallery
+
+
+def _clustered_gallery(people: int = 200, per_person: int = 3) -> FaceGallery:
+    rng = np.random.default_rng(0)
+    centers = rng.normal(scale=0.3, size=(people, 128))
+    encodings = np.repeat(centers, per_person, axis=0) + rng.normal(
+        scale=0.02, size=(people * per_person, 128)
+    )
+    names = [f"person_{i // per_person}" for i in range(people * per_person)]
+    ids = np.arange(people * per_person) + 1000
+    return FaceGallery(encodings, names, ids)
+
+
+def test_create_index_backends(tmp_path):
+    """Test the configured backend is selected"""
+    assert isinstance(create_index("exact", str(tmp_path / "i.npz")), ExactIndex)
+    assert isinstance(create_index("ivf", str(tmp_path / "i.npz")), IVFIndex)
+
+
+def test_ivf_candidates_match_exact_scan(tmp_path):
+    """Test IVF candidates give the same best person as a full scan"""
+    gallery = _clustered_gallery()
+    index = IVFIndex(str(tmp_path / "ivf.npz"), nlist=16, nprobe=2, min_size=10)
+    index.sync(gallery)
+    probes = gallery.encodings[::7] + 0.01
+
+    approximate = gallery.match(probes, 0.45, index.candidates(probes))
+    exact = gallery.match(probes, 0.45)
+
+    assert [m.name for m in approximate] == [m.name for m in exact]
+    np.testing.assert_allclose(
+        [m.best_distance for m in approximate],
+        [m.best_distance for m in exact],
+        atol=1e-4,
+    )
+
+
+def test_ivf_incremental_add_remove_and_persist(tmp_path):
+    """Test incremental updates survive a save/load round trip"""
+    gallery = _clustered_gallery(people=50)
+    path = str(tmp_path / "ivf.npz")
+    index = IVFIndex(path, nlist=8, nprobe=8, min_size=10)
+    index.sync(gallery)
+
+    index.remove(gallery.ids[:3])
+    index.add(np.array([1]), gallery.encodings[:1])
+    index.save()
+
+    reloaded = IVFIndex(path, nlist=8, nprobe=8, min_size=10)
+    assert len(reloaded) == len(gallery) - 2
+    candidates = np.concatenate(reloaded.candidates(gallery.encodings[:1]))
+    assert 1 in candidates
+    assert gallery.ids[1] not in candidates
+
+
+def test_ivf_small_gallery_uses_full_scan(tmp_path):
+    """Test galleries below the size threshold skip the index"""
+    gallery = _clustered_gallery(people=5)
+    index = IVFIndex(str(tmp_path / "ivf.npz"), min_size=1000)
+    index.sync(gallery)
+    assert index.candidates(gallery.encodings[:1]) is None
+
+
+def test_ivf_trains_on_one_at_a_time_enrollments(tmp_path, monkeypatch):
+    """Test single enrollments train the index once the gallery is big enough"""
+    from app.services.face_recognition_service import FaceRecognitionService
+
+    monkeypatch.chdir(tmp_path)
+    service = FaceRecognitionService()
+    service.index = IVFIndex(str(tmp_path / "ivf.npz"), nlist=4, min_size=12)
+    gallery = _clustered_gallery(people=6, per_person=2)
+    for encoding, person in zip(gallery.encodings, gallery.person_ids):
+        service.add_enrollment(encoding, gallery.names[person])
+
+    assert service.index.is_trained
+    assert len(service.index) == 12
+    # Saving goes through a private temporary file
+    assert sorted(os.listdir(tmp_path)) == ["face_database", "ivf.npz"]
@@ -18,10 +18,10 @@ def face_service():
 def test_face_service_initialization(face_service):
     """Test face service initializes correctly"""
     assert face_service is not None
-    assert hasattr(face_service, "known_face_encodings")
-    assert hasattr(face_service, "known_face_names")
-    assert isinstance(face_service.known_face_encodings, list)
-    assert isinstance(face_service.known_face_names, list)
+    assert hasattr(face_service, "gallery")
+    assert face_service.gallery.encodings.dtype == np.float32
+    assert face_service.gallery.encodings.shape[1] == 128
+    assert len(face_service.gallery.person_ids) == len(face_service.gallery)
 
 
 def test_base64_to_image_valid(face_service):
@@ -55,6 +55,64 @@ def test_base64_to_image_invalid(face_service):
         face_service.base64_to_image("invalid_base64_string")
 
 
+def test_bytes_to_image_valid(face_service):
+    """Test decoding raw image bytes to an RGB image"""
+    img = np.zeros((60, 80, 3), dtype=np.uint8)
+    img[:, :, 2] = 255  # Red in OpenCV's BGR order
+    _, buffer = cv2.imencode(".png", img)
+
+    result = face_service.bytes_to_image(buffer.tobytes())
+    assert result.shape == (60, 80, 3)
+    assert result[0, 0].tolist() == [255, 0, 0]
+
+
+def test_bytes_to_image_invalid(face_service):
+    """Test decoding invalid raw image bytes"""
+    with pytest.raises(ValueError):
+        face_service.bytes_to_image(b"not an image")
+    with pytest.raises(ValueError):
+        face_service.bytes_to_image(b"")
+
+
+def test_detection_params_auto_scale(face_service, monkeypatch):
+    """Test automatic detection scale follows the minimum face size"""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "face_detection_scale", 0.0)
+    monkeypatch.setattr(settings, "face_detection_min_face_size", 160)
+    assert face_service.detection_params((1080, 1920, 3)) == (0.5, 0)
+
+    monkeypatch.setattr(settings, "face_detection_min_face_size", 40)
+    assert face_service.detection_params((1080, 1920, 3)) == (1.0, 1)
+
+    # OpenCV detectors do not upsample, so they never shrink below 1.0
+    haar = face_service.get_detector("haar")
+    assert face_service.detection_params((1080, 1920, 3), haar) == (0.6, 0)
+    monkeypatch.setattr(settings, "face_detection_min_face_size", 12)
+    assert face_service.detection_params((1080, 1920, 3), haar) == (1.0, 0)
+
+    monkeypatch.setattr(settings, "face_detection_scale", 0.25)
+    monkeypatch.setattr(settings, "face_detection_upsample", 0)
+    assert face_service.detection_params((1080, 1920, 3)) == (0.25, 0)
+
+
+def test_detect_faces_downscaled_blank_image(face_service, monkeypatch):
+    """Test detection on a downscaled copy of an image"""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "face_detection_scale", 0.5)
+    img = np.full((200, 300, 3), 255, dtype=np.uint8)
+    assert face_service.detect_faces(img) == []
+
+
+def test_scale_face_locations():
+    """Test boxes found on a resized image map back to the original"""
+    from app.utils.image_utils import scale_face_locations
+
+    locations = scale_face_locations([(10, 60, 50, 20)], (400, 600, 3), (200, 300, 3))
+    assert locations == [(20, 120, 100, 40)]
+
+
 def test_compare_faces_empty(face_service):
     """Test comparing faces with empty known encodings"""
     face_encoding = np.random.rand(128)
@@ -67,3 +125,63 @@ def test_face_distance_empty(face_service):
     face_encoding = np.random.rand(128)
     result = face_service.face_distance([], face_encoding)
     assert result == []
+
+
+def test_extract_face_encodings_no_faces(face_service):
+    """Test batched encoding with no face locations"""
+    img = np.ones((100, 100, 3), dtype=np.uint8) * 255
+    result = face_service.extract_face_encodings(img, [])
+    assert result.shape == (0, 128)
+
+
+def test_match_faces_empty_gallery(face_service):
+    """Test batch matching against an empty gallery returns unknowns"""
+    from app.services.gallery import FaceGallery
+
+    gallery = FaceGallery()
+    # Mark the empty gallery as current so it is not refreshed from the store
+    gallery.generation = face_service.store.published_generation
+    face_service.gallery = gallery
+    result = face_service.match_faces(np.random.rand(3, 128))
+    assert result == [("Unknown", 0.0)] * 3
+
+
+def test_add_enrollments_single_write(tmp_path, monkeypatch):
+    """Test bulk enrollments are written and removed in one store write each"""
+    monkeypatch.chdir(tmp_path)
+    service = FaceRecognitionService()
+    encodings = np.random.rand(3, 128)
+
+    paths = service.add_enrollments(encodings, ["alice", "alice", "bob"])
+    assert len(set(paths)) == 3
+    assert service.gallery.generation == service.store.published_generation
+    assert service.gallery.encoding_counts() == {"alice": 2, "bob": 1}
+
+    service.remove_enrollments(paths[:2])
+    assert service.gallery.encoding_counts() == {"bob": 1}
+    if service._compaction is not None:
+        service._compaction.join()  # Finish before the working directory resets
+
+
+def test_engine_recognize_blank_image(face_service, sample_face_image):
+    """Test the engine runs the pipeline off the event loop"""
+    import asyncio
+    from app.services.engine import RecognitionEngine
+
+    engine = RecognitionEngine(face_service, processes=0)
+    results, processing_time = asyncio.run(engine.recognize(sample_face_image))
+    assert results == []
+    assert processing_time >= 0
+
+
+def test_engine_shares_cores_among_workers(face_service, monkeypatch):
+    """Test the default pool size splits the cores between uvicorn workers"""
+    from app.config import settings
+    from app.services.engine import RecognitionEngine
+
+    monkeypatch.setattr("os.cpu_count", lambda: 8)
+    monkeypatch.setattr(settings, "workers", 4)
+    assert RecognitionEngine(face_service).processes == 2
+    monkeypatch.setattr(settings, "workers", 16)
+    assert RecognitionEngine(face_service).processes == 1
+    assert RecognitionEngine(face_service, processes=3).processes == 3
@@ -0,0 +1,310 @@
+"""
+Tests for the contiguous face gallery
+"""
+
+import numpy as np
+import pytest
+from app.services.gallery import FaceGallery
+
+
+def _encoding(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.normal(scale=0.1, size=128)
+
+
+def test_empty_gallery():
+    """Test empty gallery has no matches"""
+    gallery = FaceGallery()
+    assert len(gallery) == 0
+    assert gallery.person_count == 0
+    assert gallery.match(_encoding(0), tolerance=0.45) == [None]
+
+
+def test_gallery_groups_encodings_by_person():
+    """Test encodings keep insertion order and are grouped per person"""
+    names = ["bob", "alice", "bob", "carol_smith", "alice"]
+    gallery = FaceGallery([_encoding(i) for i in range(5)], names)
+
+    assert gallery.encodings.shape == (5, 128)
+    assert gallery.encodings.dtype == np.float32
+    assert gallery.names == ["alice", "bob", "carol_smith"]
+    assert gallery.offsets.tolist() == [0, 2, 4, 5]
+    assert gallery.person_ids.tolist() == [1, 0, 1, 2, 0]
+    assert gallery.person_rows(0).tolist() == [1, 4]
+    assert gallery.person_rows(1).tolist() == [0, 2]
+    assert gallery.encoding_counts() == {"alice": 2, "bob": 2, "carol_smith": 1}
+
+
+def test_gallery_match_statistics():
+    """Test per-person statistics match a brute-force computation"""
+    encodings = [_encoding(i) for i in range(6)]
+    names = ["a", "b", "a", "c", "b", "a"]
+    gallery = FaceGallery(encodings, names)
+    probe = encodings[2] + 0.01
+
+    (match,) = gallery.match(probe, tolerance=1.2)
+
+    distances = np.linalg.norm(np.array(encodings) - probe, axis=1)
+    person_distances = distances[[0, 2, 5]]
+    assert match.name == "a"
+    assert match.encoding_count == 3
+    assert match.best_distance == pytest.approx(person_distances.min(), abs=1e-4)
+    assert match.avg_distance == pytest.approx(person_distances.mean(), abs=1e-4)
+    assert match.matched_count == int((person_distances <= 1.2).sum())
+
+
+def test_gallery_with_encoding_returns_new_gallery():
+    """Test adding encodings keeps the original gallery untouched"""
+    gallery = FaceGallery([_encoding(0)], ["bob"])
+
+    updated = gallery.with_encoding(_encoding(1), "alice").with_encoding(
+        _encoding(2), "bob"
+    )
+
+    assert len(gallery) == 1
+    assert updated.encoding_counts() == {"alice": 1, "bob": 2}
+    assert updated.names == ["bob", "alice"]
+    assert updated.offsets.tolist() == [0, 2, 3]
+    assert updated.match(_encoding(2), tolerance=0.45)[0].name == "bob"
+    np.testing.assert_allclose(
+        updated.sq_norms,
+        np.einsum("ij,ij->i", updated.encodings, updated.encodings),
+        rtol=1e-5,
+    )
+
+
+def test_gallery_match_batch():
+    """Test a probe batch is matched in one pass with per-probe results"""
+    encodings = [_encoding(i) for i in range(4)]
+    gallery = FaceGallery(encodings, ["a", "b", "c", "a"])
+    probes = np.array([encodings[1], encodings[3], encodings[2]])
+
+    matches = gallery.match(probes, tolerance=0.45)
+
+    assert [m.name for m in matches] == ["b", "a", "c"]
+    assert matches[1].encoding_count == 2
+    assert matches[1].best_distance == pytest.approx(0.0, abs=1e-3)
+    assert gallery.match(np.empty((0, 128)), tolerance=0.45) == []
+
+
+def test_gallery_without_tombstones_rows():
+    """Test deleted encodings are skipped without rebuilding the matrix"""
+    encodings = [_encoding(i) for i in range(4)]
+    gallery = FaceGallery(encodings, ["a", "b", "a", "c"], [10, 11, 12, 13])
+
+    updated = gallery.without(np.array([11, 12]))
+
+    assert updated.encodings is gallery.encodings
+    assert len(gallery) == 4
+    assert len(updated) == 2
+    assert updated.tombstone_count == 2
+    assert updated.encoding_counts() == {"a": 1, "c": 1}
+    assert updated.rows_for(np.array([11])).size == 0
+    (match,) = updated.match(encodings[1], tolerance=0.45)
+    assert match.name != "b"
+    (match,) = updated.match(encodings[0], tolerance=10.0)
+    assert match.name == "a"
+    assert match.encoding_count == 1
+    assert match.matched_count == 1
+    assert updated.with_encoding(_encoding(9), "b").encoding_counts() == {
+        "a": 1,
+        "b": 1,
+        "c": 1,
+    }
+
+
+def test_gallery_appends_extend_row_order():
+    """Test appended rows extend the person and id order of the previous gallery"""
+    rng = np.random.default_rng(5)
+    names = [f"p{i}" for i in rng.integers(0, 20, size=200)]
+    gallery = FaceGallery(rng.normal(size=(200, 128)), names, rng.permutation(200))
+    gallery.find_rows(np.array([0]))  # Builds the id order to extend
+
+    for start in range(0, 60, 15):
+        people = rng.integers(0, 30, size=15)
+        gallery = FaceGallery.from_arrays(
+            np.concatenate((gallery.encodings, rng.normal(size=(15, 128)))),
+            np.concatenate((gallery.person_ids, people)),
+            gallery.names + [f"q{i}" for i in range(len(gallery.names), 30)],
+            np.concatenate((gallery.ids, 1000 - start - np.arange(15))),
+            previous=gallery,
+        )
+
+    np.testing.assert_array_equal(
+        gallery.order, np.argsort(gallery.person_ids, kind="stable")
+    )
+    np.testing.assert_array_equal(
+        gallery.offsets[1:],
+        np.cumsum(np.bincount(gallery.person_ids, minlength=len(gallery.names))),
+    )
+    np.testing.assert_array_equal(gallery.ids[gallery._id_order], np.sort(gallery.ids))
+    np.testing.assert_array_equal(
+        gallery.find_rows(gallery.ids), np.arange(len(gallery.ids))
+    )
+
+
+def _assert_person_stats(gallery: FaceGallery):
+    """Centroids and radii equal a from-scratch computation"""
+    for person in range(len(gallery.names)):
+        rows = gallery.person_rows(person)
+        if gallery.alive is not None:
+            rows = rows[gallery.alive[rows]]
+        if len(rows) == 0:
+            continue
+        members = gallery.encodings[rows].astype(np.float64)
+        centroid = members.mean(axis=0)
+        np.testing.assert_allclose(gallery.centroids[person], centroid, atol=1e-6)
+        radius = np.linalg.norm(members - centroid, axis=1).max()
+        assert gallery.radii[person] == pytest.approx(radius, abs=1e-5)
+
+
+def test_gallery_person_centroids_follow_updates():
+    """Test centroids and radii stay exact through appends and deletes"""
+    encodings = [_encoding(i) for i in range(6)]
+    gallery = FaceGallery(encodings, ["a", "b", "a", "c", "b", "a"], range(6))
+    _assert_person_stats(gallery)
+
+    deleted = gallery.without(np.array([0, 3]))
+    _assert_person_stats(deleted)
+    np.testing.assert_array_equal(gallery.centroids[1], deleted.centroids[1])
+
+    appended = deleted.with_encoding(_encoding(7), "a").with_encoding(_encoding(8), "d")
+    assert appended.tombstone_count == 2
+    assert appended.encoding_counts() == {"a": 3, "b": 2, "d": 1}
+    _assert_person_stats(appended)
+
+
+def test_gallery_prefilter_matches_full_scan():
+    """Test the top-k people by centroid give the same matches as a full scan"""
+    rng = np.random.default_rng(1)
+    people, per_person = 100, 10
+    centers = rng.normal(scale=0.1, size=(people, 128))
+    encodings = np.repeat(centers, per_person, axis=0) + rng.normal(
+        scale=0.02, size=(people * per_person, 128)
+    )
+    names = [f"person_{i // per_person}" for i in range(people * per_person)]
+    gallery = FaceGallery(encodings, names)
+    probes = encodings[::13] + rng.normal(scale=0.02, size=(77, 128))
+
+    shortlisted = gallery.nearest_people(probes, 5)
+    assert all(len(people) == 5 for people in shortlisted)
+    prefiltered = gallery.match(probes, 0.45, top_people=5)
+    exact = gallery.match(probes, 0.45)
+    assert [m.name for m in prefiltered] == [m.name for m in exact]
+    assert [m.matched_count for m in prefiltered] == [m.matched_count for m in exact]
+    np.testing.assert_allclose(
+        [m.avg_distance for m in prefiltered],
+        [m.avg_distance for m in exact],
+        atol=1e-5,
+    )
+
+
+def test_gallery_prefilter_widens_past_overlapping_people():
+    """Test the prefilter stays exact when centroids do not separate people"""
+    rng = np.random.default_rng(4)
+    people, per_person = 400, 6
+    centers = rng.normal(scale=0.02, size=(people, 128))
+    encodings = np.repeat(centers, per_person, axis=0) + rng.normal(
+        scale=0.06, size=(people * per_person, 128)
+    )
+    names = [f"person_{i // per_person}" for i in range(people * per_person)]
+    gallery = FaceGallery(encodings, names)
+    probes = encodings[::31] + rng.normal(scale=0.06, size=(78, 128))
+
+    exact = gallery.match(probes, 0.45)
+    shortlisted = gallery.nearest_people(probes, 4)
+    owners = [gallery.names.index(m.name) for m in exact]
+    assert any(owner not in people for owner, people in zip(owners, shortlisted))
+    prefiltered = gallery.match(probes, 0.45, top_people=4)
+    assert [m.name for m in prefiltered] == [m.name for m in exact]
+    np.testing.assert_allclose(
+        [m.best_distance for m in prefiltered],
+        [m.best_distance for m in exact],
+        atol=1e-5,
+    )
+
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_quantized_gallery_reranks_at_full_precision(quantization):
+    """Test a quantized first pass reports the same people and distances"""
+    rng = np.random.default_rng(2)
+    centers = rng.normal(scale=0.1, size=(300, 128))
+    encodings = np.repeat(centers, 3, axis=0) + rng.normal(scale=0.02, size=(900, 128))
+    names = [f"person_{i // 3}" for i in range(900)]
+    exact = FaceGallery(encodings, names)
+    gallery = FaceGallery(encodings, names, quantization=quantization)
+    probes = encodings[::17] + rng.normal(scale=0.02, size=(53, 128))
+
+    assert gallery.quantized.dtype == np.dtype(quantization)
+    approximate = np.sqrt(np.maximum(gallery.approximate_sq_distances(probes), 0))
+    np.testing.assert_allclose(approximate, exact.distances(probes), atol=0.02)
+
+    matches = gallery.match(probes, 0.45, rerank=8)
+    expected = exact.match(probes, 0.45)
+    assert [m.name for m in matches] == [m.name for m in expected]
+    np.testing.assert_allclose(
+        [m.best_distance for m in matches],
+        [m.best_distance for m in expected],
+        atol=1e-5,
+    )
+    usage = gallery.memory_usage()
+    assert usage["quantized_bytes"] == 900 * 128 * np.dtype(quantization).itemsize
+    assert usage["scan_bytes"] < exact.memory_usage()["scan_bytes"]
+
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_quantized_gallery_scores_prefiltered_rows(quantization, monkeypatch):
+    """Test the person prefilter and index candidates use the quantized rows"""
+    rng = np.random.default_rng(3)
+    centers = rng.normal(scale=0.1, size=(200, 128))
+    encodings = np.repeat(centers, 5, axis=0) + rng.normal(scale=0.02, size=(1000, 128))
+    names = [f"person_{i // 5}" for i in range(1000)]
+    exact = FaceGallery(encodings, names)
+    gallery = FaceGallery(encodings, names, quantization=quantization)
+    probes = encodings[::23] + rng.normal(scale=0.02, size=(44, 128))
+
+    calls = []
+    rerank_people = gallery._rerank_people
+    monkeypatch.setattr(
+        gallery,
+        "_rerank_people",
+        lambda *args: calls.append(1) or rerank_people(*args),
+    )
+    expected = exact.match(probes, 0.45)
+    prefiltered = gallery.match(probes, 0.45, top_people=16, rerank=8)
+    candidates = gallery.match(
+        probes, 0.45, candidates=[gallery.ids[:500]] * len(probes), rerank=8
+    )
+    assert len(calls) == 2 * len(probes)
+    assert [m.name for m in prefiltered] == [m.name for m in expected]
+    np.testing.assert_allclose(
+        [m.best_distance for m in prefiltered],
+        [m.best_distance for m in expected],
+        atol=1e-5,
+    )
+    in_candidates = [m for m in candidates if m is not None]
+    assert all(int(m.name.split("_")[1]) < 100 for m in in_candidates)
+
+
+def test_int8_gallery_keeps_scale_until_rows_exceed_it():
+    """Test appends reuse the quantized rows unless the int8 range grows"""
+    gallery = FaceGallery([_encoding(i) for i in range(4)], list("abcd"), [1, 2, 3, 4])
+    gallery = FaceGallery.from_arrays(
+        gallery.encodings,
+        gallery.person_ids,
+        gallery.names,
+        gallery.ids,
+        quantization="int8",
+    )
+    scale = gallery.scale
+
+    inside = gallery.with_encoding(_encoding(0) * 0.5, "e")
+    assert inside.scale is scale
+    np.testing.assert_array_equal(inside.quantized[:4], gallery.quantized)
+
+    outside = inside.with_encoding(np.full(128, 5.0), "f")
+    assert np.all(outside.scale > scale)
+    (match,) = outside.match(np.full(128, 5.0), tolerance=0.45)
+    assert match.name == "f"
+    with pytest.raises(ValueError):
+        FaceGallery(quantization="int4")
@@ -0,0 +1,157 @@
+"""
+Tests for the memory-mapped gallery store
+"""
+
+import os
+import pickle
+
+import numpy as np
+import pytest
+from app.services.gallery_store import GalleryStore
+
+
+def _encodings(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(scale=0.1, size=(count, 128))
+
+
+def test_store_round_trip_is_memory_mapped(tmp_path):
+    """Test appended encodings load back memory-mapped and grouped"""
+    store = GalleryStore(str(tmp_path / "gallery"))
+    encodings = _encodings(3)
+    store.append(encodings[:2], ["mary_ann", "bob"], [10, 11])
+    store.append(encodings[2:], ["mary_ann"], [12])
+
+    gallery = GalleryStore(str(tmp_path / "gallery")).load()
+
+    assert isinstance(gallery.encodings, np.memmap)
+    assert gallery.encoding_counts() == {"mary_ann": 2, "bob": 1}
+    assert sorted(gallery.ids.tolist()) == [10, 11, 12]
+    row = gallery.rows_for(np.array([12]))[0]
+    np.testing.assert_allclose(gallery.encodings[row], encodings[2], rtol=1e-6)
+
+
+def test_store_delete_masks_on_load_and_compacts(tmp_path):
+    """Test tombstoned encodings are masked on load and dropped by compaction"""
+    store = GalleryStore(str(tmp_path / "gallery"))
+    store.append(_encodings(3), ["a", "b", "a"], [1, 2, 3])
+    store.delete([2])
+
+    gallery = store.load()
+
+    assert gallery.encoding_counts() == {"a": 2}
+    assert gallery.tombstone_count == 1
+    assert gallery.segment == 0
+
+    store.compact()
+    compacted = store.load(previous=gallery)
+
+    assert compacted.encoding_counts() == {"a": 2}
+    assert compacted.tombstone_count == 0
+    assert compacted.segment == 1
+    assert not os.path.exists(tmp_path / "gallery" / "encodings.0.f32")
+
+
+def test_store_append_if_empty_writes_once(tmp_path):
+    """Test only the first of several workers restores an empty store"""
+    path = str(tmp_path / "gallery")
+    first, second = GalleryStore(path), GalleryStore(path)
+    assert first.append_if_empty(_encodings(2), ["a", "b"], [1, 2]) is not None
+    # The second handle still has its stale, store-less manifest
+    assert second.append_if_empty(_encodings(2), ["a", "b"], [1, 2]) is None
+    assert sorted(second.load().ids.tolist()) == [1, 2]
+
+    # Tombstoned rows do not count as live
+    first.delete([1, 2, 7])
+    assert second.append_if_empty(_encodings(1), ["c"], [3]) is not None
+    assert first.load().encoding_counts() == {"c": 1}
+
+
+def test_store_publishes_generation_to_other_readers(tmp_path):
+    """Test a write by one store handle is visible to another without reload"""
+    writer = GalleryStore(str(tmp_path / "gallery"))
+    reader = GalleryStore(str(tmp_path / "gallery"))
+    assert reader.published_generation == -1
+
+    writer.append(_encodings(2), ["a", "b"], [1, 2])
+    gallery = reader.load()
+    assert gallery.generation == reader.published_generation
+
+    generation = writer.append(_encodings(1, seed=1), ["a"], [3])
+
+    assert reader.published_generation == generation == gallery.generation + 1
+    updated = reader.load(previous=gallery)
+    assert updated.encoding_counts() == {"a": 2, "b": 1}
+    assert updated.generation == generation
+    np.testing.assert_array_equal(updated.sq_norms[:2], gallery.sq_norms)
+
+
+def test_store_ignores_uncommitted_tail(tmp_path):
+    """Test bytes past the committed count are dropped on the next append"""
+    store = GalleryStore(str(tmp_path / "gallery"))
+    store.append(_encodings(1), ["a"], [1])
+    with open(tmp_path / "gallery" / "ids.0.i64", "ab") as f:
+        f.write(b"torn")
+
+    store.append(_encodings(1, seed=1), ["b"], [2])
+
+    assert store.load().ids.tolist() == [1, 2]
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_store_syncs_rows_before_the_manifest(tmp_path, monkeypatch):
+    """Test appended and compacted rows reach disk before a manifest counts them"""
+    store = GalleryStore(str(tmp_path / "gallery"))
+    store.create()
+    events = []
+    fsync, replace = os.fsync, os.replace
+
+    def record_fsync(fd):
+        events.append(os.path.basename(os.readlink(f"/proc/self/fd/{fd}")))
+        fsync(fd)
+
+    def record_replace(src, dst):
+        events.append("replace")
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "fsync", record_fsync)
+    monkeypatch.setattr(os, "replace", record_replace)
+    store.append(_encodings(2), ["a", "b"], [1, 2])
+    store.delete([1])
+    store.compact()
+
+    append, delete, compact = np.flatnonzero(np.array(events) == "replace")
+    assert {"encodings.0.f32", "persons.0.i32", "ids.0.i64"} <= set(events[:append])
+    assert "tombstones.0.i64" in events[append:delete]
+    assert {"encodings.1.f32", "persons.1.i32", "ids.1.i64"} <= set(
+        events[delete:compact]
+    )
+
+
+def test_store_migrates_pickles(tmp_path):
+    """Test the one-shot migration from per-encoding pickle files"""
+    legacy = tmp_path / "encodings"
+    legacy.mkdir()
+    for i, name in enumerate(["jo_smith", "jo_smith", "li"]):
+        with open(legacy / f"{name}_{1700000000 + i}.pkl", "wb") as f:
+            pickle.dump(_encodings(1, seed=i)[0], f)
+
+    store = GalleryStore(str(tmp_path / "gallery"))
+    migrated = store.migrate_pickles(str(legacy), lambda filename: abs(hash(filename)))
+
+    assert migrated == 3
+    assert store.load().encoding_counts() == {"jo_smith": 2, "li": 1}
+
+
+def test_store_loads_quantized_galleries(tmp_path):
+    """Test a quantizing store quantizes on load and only the new rows after"""
+    store = GalleryStore(str(tmp_path / "gallery"), quantization="int8")
+    store.append(np.full((2, 128), 0.1), ["a", "b"], [1, 2])
+    gallery = store.load()
+    assert gallery.quantized.shape == (2, 128)
+
+    store.append(np.full((1, 128), -0.1), ["c"], [3])
+    store.delete([1])
+    reloaded = store.load(previous=gallery)
+    assert reloaded.scale is gallery.scale
+    assert reloaded.quantized.shape == (3, 128)
+    assert reloaded.encoding_counts() == {"b": 1, "c": 1}
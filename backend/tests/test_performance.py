@@ -0,0 +1,53 @@
+"""
+Tests for performance metrics
+"""
+
+import pytest
+from app.utils.performance import Histogram, PerformanceMetrics
+
+
+def test_histogram_percentiles():
+    """Test percentiles are estimated within a bucket's width"""
+    histogram = Histogram()
+    values = [0.001 * i for i in range(1, 1001)]
+    for value in values:
+        histogram.observe(value)
+
+    stats = histogram.get_stats()
+    assert stats["count"] == 1000
+    assert stats["avg"] == pytest.approx(0.5005)
+    assert (stats["min"], stats["max"]) == (0.001, 1.0)
+    for q, key in ((0.5, "p50"), (0.95, "p95"), (0.99, "p99")):
+        assert stats[key] == pytest.approx(q, rel=0.2)
+    assert histogram.quantile(1.0) == pytest.approx(1.0)
+
+
+def test_histogram_constant_memory():
+    """Test observations only bump bucket counters"""
+    histogram = Histogram((1, 2, 5))
+    for value in (0, 1, 1.5, 3, 10, 10):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1, 2]
+    assert Histogram().get_stats()["p99"] == 0
+
+
+def test_prometheus_exposition():
+    """Test histograms are exposed with cumulative buckets, sum and count"""
+    metrics = PerformanceMetrics()
+    metrics.add_request_time(0.02)
+    metrics.add_analysis("hog", {"decode": 0.01, "detect": 0.2, "encode": 0.05}, 2)
+
+    text = metrics.to_prometheus(
+        {"gallery_encodings": 7}, {"probe_cache_hits_total": 3}
+    )
+    lines = text.splitlines()
+    assert "# TYPE face_api_stage_duration_seconds histogram" in lines
+    assert 'face_api_stage_duration_seconds_bucket{stage="detect",le="+Inf"} 1' in lines
+    assert 'face_api_stage_duration_seconds_count{stage="encode"} 1' in lines
+    assert 'face_api_detection_duration_seconds_count{backend="hog"} 1' in lines
+    assert 'face_api_faces_per_image_bucket{le="2"} 1' in lines
+    assert 'face_api_faces_per_image_bucket{le="1"} 0' in lines
+    assert "face_api_requests_total 1" in lines
+    assert "face_api_gallery_encodings 7" in lines
+    assert "face_api_probe_cache_hits_total 3" in lines
+    assert text.endswith("\n")
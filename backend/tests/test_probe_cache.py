@@ -0,0 +1,55 @@
+"""
+Tests for the probe image cache
+"""
+
+import numpy as np
+from app.services.probe_cache import ProbeCache
+
+
+def test_probe_cache_lru_eviction():
+    """Test the least recently used image is evicted first"""
+    cache = ProbeCache(max_entries=2)
+    encodings = np.zeros((0, 128))
+    for key in (b"a", b"b"):
+        cache.put(key, [], encodings)
+    assert cache.get(b"a") is not None  # b is now the oldest
+    cache.put(b"c", [], encodings)
+
+    assert cache.get(b"b") is None
+    assert cache.get(b"a") is not None
+    assert cache.get(b"c") is not None
+    stats = cache.get_stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+
+
+def test_probe_cache_expiry():
+    """Test entries are dropped once their TTL has passed"""
+    cache = ProbeCache(max_entries=4, ttl=-1.0)
+    cache.put(b"a", [], np.zeros((0, 128)))
+    assert cache.get(b"a") is None
+    assert cache.get_stats()["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_probe_cache_disabled():
+    """Test a zero-sized cache stores nothing"""
+    cache = ProbeCache(max_entries=0)
+    probe = cache.put(b"a", [(0, 10, 10, 0)], np.zeros((1, 128)))
+    assert probe.face_locations == [(0, 10, 10, 0)]
+    assert cache.get(b"a") is None
+    assert len(cache) == 0
+
+
+def test_probe_cache_key():
+    """Test keys ignore the data URL prefix but not the image or detector"""
+    key = ProbeCache.key("aGVsbG8=")
+    assert ProbeCache.key("data:image/jpeg;base64,aGVsbG8=") == key
+    assert ProbeCache.key("aGVsbG9v") != key
+    assert ProbeCache.key("aGVsbG8=", "haar") != key
+    assert ProbeCache.key(b"hello") == ProbeCache.key(b"hello")
+    # A base64 payload and the raw upload of the same image share a key
+    assert ProbeCache.key(b"hello") == key
+    assert ProbeCache.key(b"hello", "haar") == ProbeCache.key("aGVsbG8=", "haar")
+    assert ProbeCache.key("not base64!") != key
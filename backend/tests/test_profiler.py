@@ -0,0 +1,80 @@
+"""
+Tests for the request sampling profiler
+"""
+
+import time
+
+from app.utils.profiler import Profile, Profiler, profiled
+
+
+def _busy_wait(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_profile_samples_current_thread():
+    """Test samples are taken of the registered thread only while active"""
+    profile = Profile("busy", interval=0.001)
+    with profile.sampling():
+        _busy_wait(0.1)
+    samples = sum(profile.samples.values())
+    assert samples > 10
+    assert any(stack[-1][0] == "_busy_wait" for stack in profile.samples)
+
+    time.sleep(0.02)
+    assert sum(profile.samples.values()) == samples
+
+
+def test_profiled_without_profile_is_identity():
+    """Test work is not wrapped when the request is not profiled"""
+    assert profiled(_busy_wait) is _busy_wait
+
+
+def test_profile_exports():
+    """Test collapsed stack and speedscope exports of the same samples"""
+    profile = Profile("GET /x", interval=0.01)
+    profile.samples[(("main", "/app/main.py", 1), ("work", "/app/work.py", 5))] = 3
+    profile.samples[(("main", "/app/main.py", 1),)] = 1
+
+    assert (
+        profile.collapsed()
+        == "main (main.py:1);work (work.py:5) 3\nmain (main.py:1) 1\n"
+    )
+
+    document = profile.speedscope()
+    frames = document["shared"]["frames"]
+    assert [frame["name"] for frame in frames] == ["main", "work"]
+    (sampled,) = document["profiles"]
+    assert sampled["type"] == "sampled"
+    assert sampled["samples"] == [[0, 1], [0]]
+    assert sampled["weights"] == [0.03, 0.01]
+
+
+def test_profiler_keeps_sampled_and_slow_requests():
+    """Test only sampled or slow profiles are kept, newest first, bounded"""
+    profiler = Profiler(enabled=True, slow_threshold=0.5, max_profiles=2)
+    fast = profiler.begin("fast")
+    assert not profiler.finish(fast, 0.1)
+    for name in ("slow-1", "slow-2", "slow-3"):
+        assert profiler.finish(profiler.begin(name), 1.0)
+
+    assert [p["name"] for p in profiler.get_profiles()] == ["slow-3", "slow-2"]
+    assert profiler.get_profiles()[0]["reason"] == "slow"
+
+    profiler.configure(enabled=False)
+    assert profiler.begin("off") is None
+    profiler.configure(enabled=True, slow_threshold=0.0, sample_rate=1.0)
+    sampled = profiler.begin("sampled")
+    assert profiler.finish(sampled, 0.01)
+    assert sampled.reason == "sampled"
+
+
+def test_profiler_caps_sample_rate():
+    """Test the sample rate never exceeds the cap, at start or at runtime"""
+    profiler = Profiler(enabled=True, sample_rate=0.5, max_sample_rate=0.1)
+    assert profiler.sample_rate == 0.1
+    profiler.configure(sample_rate=1.0)
+    assert profiler.get_config()["sample_rate"] == 0.1
+    profiler.configure(sample_rate=0.05)
+    assert profiler.sample_rate == 0.05
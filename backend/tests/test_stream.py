@@ -0,0 +1,56 @@
+"""
+Tests for streaming recognition sessions
+"""
+
+import asyncio
+
+from app.services.stream import StreamSession
+
+
+class _RecordingEngine:
+    """Engine double that records which frames were recognized"""
+
+    def __init__(self):
+        self.frames = []
+
+    async def recognize(self, image_data, detector=None, use_cache=True):
+        self.frames.append(image_data)
+        return [], 0.01
+
+    async def recognize_tracked(self, image_data, tracker, detector=None):
+        self.frames.append(image_data)
+        return [], 0.01, 0
+
+
+def test_stream_session_drops_stale_frames():
+    """Test only the newest pending frame is processed"""
+
+    async def run():
+        engine = _RecordingEngine()
+        session = StreamSession(engine)
+        for frame in (b"1", b"2", b"3"):
+            session.submit(frame)
+
+        frame_number, frame = await session.next_frame()
+        result = await session.process(frame_number, frame)
+        return engine, session, result
+
+    engine, session, result = asyncio.run(run())
+
+    assert engine.frames == [b"3"]
+    assert result.frame == 3
+    assert result.frames_dropped == 2
+    assert session.frames_processed == 1
+
+
+def test_stream_session_close_wakes_waiter():
+    """Test closing the session ends a pending wait for frames"""
+
+    async def run():
+        session = StreamSession(_RecordingEngine())
+        waiter = asyncio.create_task(session.next_frame())
+        await asyncio.sleep(0)
+        session.close()
+        return await asyncio.wait_for(waiter, timeout=1)
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,59 @@
+"""
+Tests for cross-frame face tracking
+"""
+
+import numpy as np
+import pytest
+from app.services.tracker import FaceTracker, box_iou
+
+
+def test_box_iou():
+    """Test IoU of identical, shifted and disjoint boxes"""
+    iou = box_iou([(0, 10, 10, 0)], [(0, 10, 10, 0), (0, 15, 10, 5), (20, 30, 30, 20)])
+    np.testing.assert_allclose(iou, [[1.0, 50 / 150, 0.0]])
+
+
+def test_tracker_reuses_identity_of_stable_faces():
+    """Test only new faces are encoded while tracked faces stay put"""
+    tracker = FaceTracker(refresh_interval=10)
+
+    ((track, needs_encoding),) = tracker.update([(100, 200, 200, 100)])
+    assert needs_encoding
+    track.identify("alice", 92.0)
+
+    plan = tracker.update([(102, 202, 202, 102), (100, 400, 200, 300)])
+    assert plan[0] == (track, False)
+    assert plan[0][0].name == "alice"
+    assert plan[1][0] is not track
+    assert plan[1][1]
+
+
+def test_tracker_reencodes_on_drift_and_refresh():
+    """Test drifted or stale tracks are flagged for a fresh encoding"""
+    tracker = FaceTracker(iou_threshold=0.2, drift_iou=0.7, refresh_interval=5)
+    ((track, _),) = tracker.update([(0, 100, 100, 0)])
+    track.identify("bob", 90.0)
+
+    # Moved far enough to drop below the drift IoU but still the same track
+    ((moved, needs_encoding),) = tracker.update([(0, 130, 100, 30)])
+    assert moved is track
+    assert needs_encoding
+    track.identify("bob", 90.0)
+
+    for _ in range(4):
+        ((_, needs_encoding),) = tracker.update([(0, 130, 100, 30)])
+        assert not needs_encoding
+    ((_, needs_encoding),) = tracker.update([(0, 130, 100, 30)])
+    assert needs_encoding
+
+
+def test_tracker_drops_lost_tracks():
+    """Test tracks disappear after too many processed frames without a detection"""
+    tracker = FaceTracker(max_missed=2)
+    tracker.update([(0, 100, 100, 0)])
+    tracker.update([])
+    tracker.update([])
+    assert len(tracker.tracks) == 1
+    tracker.update([])
+    assert tracker.tracks == []
+    assert tracker.frame == 4
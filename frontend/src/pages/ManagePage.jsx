@@ -30,9 +30,14 @@ import {
 } from "@mui/icons-material";
 import { faceAPI } from "../services/api";
 
+const PAGE_SIZE = 100;
+
 const ManagePage = () => {
   const [faces, setFaces] = useState([]);
+  const [totalFaces, setTotalFaces] = useState(0);
+  const [hasMore, setHasMore] = useState(false);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [deleting, setDeleting] = useState(false);
   const [message, setMessage] = useState("");
   const [messageType, setMessageType] = useState("info");
@@ -41,8 +46,13 @@ const ManagePage = () => {
   const fetchFaces = async () => {
     try {
       setLoading(true);
-      const data = await faceAPI.getAllFaces();
+      const [data, count] = await Promise.all([
+        faceAPI.getAllFaces({ limit: PAGE_SIZE }),
+        faceAPI.getFacesCount(),
+      ]);
       setFaces(data);
+      setHasMore(data.length === PAGE_SIZE);
+      setTotalFaces(count.total_faces);
     } catch (error) {
       setMessage("Error loading faces: " + error.message);
       setMessageType("error");
@@ -51,6 +61,23 @@ const ManagePage = () => {
     }
   };
 
+  const fetchMoreFaces = async () => {
+    try {
+      setLoadingMore(true);
+      const data = await faceAPI.getAllFaces({
+        afterId: faces[faces.length - 1].id,
+        limit: PAGE_SIZE,
+      });
+      setFaces([...faces, ...data]);
+      setHasMore(data.length === PAGE_SIZE);
+    } catch (error) {
+      setMessage("Error loading faces: " + error.message);
+      setMessageType("error");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchFaces();
   }, []);
@@ -131,7 +158,7 @@ const ManagePage = () => {
             <CardContent sx={{ textAlign: "center" }}>
               <Face sx={{ fontSize: 60, color: "primary.main", mb: 2 }} />
               <Typography variant="h4" component="div" gutterBottom>
-                {faces.length}
+                {totalFaces}
               </Typography>
               <Typography variant="h6" color="text.secondary">
                 Enrolled Faces
@@ -227,6 +254,22 @@ const ManagePage = () => {
                       </ListItemSecondaryAction>
                     </ListItem>
                   ))}
+                  {hasMore && (
+                    <Box
+                      sx={{ display: "flex", justifyContent: "center", mt: 2 }}
+                    >
+                      <Button
+                        variant="outlined"
+                        onClick={fetchMoreFaces}
+                        disabled={loadingMore}
+                        startIcon={
+                          loadingMore ? <CircularProgress size={16} /> : null
+                        }
+                      >
+                        {loadingMore ? "Loading..." : "Load more"}
+                      </Button>
+                    </Box>
+                  )}
                 </List>
               )}
             </CardContent>
@@ -38,10 +38,16 @@ export const faceAPI = {
     }
   },
 
-  // Get all enrolled faces
-  getAllFaces: async () => {
+  // Get a page of enrolled faces; pass the last id seen as afterId
+  getAllFaces: async ({ afterId = 0, limit = 100, namePrefix } = {}) => {
     try {
-      const response = await api.get("/faces/");
+      const response = await api.get("/faces/", {
+        params: {
+          after_id: afterId,
+          limit,
+          name_prefix: namePrefix || undefined,
+        },
+      });
       return response.data;
     } catch (error) {
       throw new Error(error.response?.data?.detail || "Failed to fetch faces");